@@ -9,11 +9,15 @@ from datetime import timedelta
 from apps.messages.models import Message
 from apps.contacts.models import Contact
 from apps.campaigns.models import Campaign
+from apps.contacts.segments import VERSION_RESOURCE
+from apps.tenants.conditional import conditional_get
+from apps.tenants.versions import CAMPAIGNS, MESSAGES
 
 
 class AnalyticsOverviewView(APIView):
     """View for analytics overview."""
     
+    @conditional_get(MESSAGES, VERSION_RESOURCE, CAMPAIGNS)
     def get(self, request):
         tenant_id = request.user.tenant_id
         today = timezone.now().date()
@@ -59,6 +63,7 @@ class AnalyticsOverviewView(APIView):
 class MessageStatsView(APIView):
     """View for message statistics."""
     
+    @conditional_get(MESSAGES)
     def get(self, request):
         tenant_id = request.user.tenant_id
         days = int(request.query_params.get('days', 30))
@@ -90,6 +95,7 @@ class MessageStatsView(APIView):
 class CampaignStatsView(APIView):
     """View for campaign statistics."""
     
+    @conditional_get(CAMPAIGNS)
     def get(self, request):
         tenant_id = request.user.tenant_id
         
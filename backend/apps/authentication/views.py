@@ -90,6 +90,8 @@ class UserViewSet(viewsets.ModelViewSet):
     
     serializer_class = UserSerializer
     permission_classes = [IsAuthenticated]
+    results_key = 'users'
+    ordering = ['-date_joined']
     
     def get_queryset(self):
         # Only return users from the same tenant
@@ -105,13 +107,9 @@ class UserViewSet(viewsets.ModelViewSet):
         serializer.save(tenant_id=self.request.user.tenant_id)
     
     def list(self, request, *args, **kwargs):
-        queryset = self.get_queryset()
-        serializer = self.get_serializer(queryset, many=True)
-        return Response({
-            'success': True,
-            'users': serializer.data,
-            'count': queryset.count()
-        })
+        page = self.paginate_queryset(self.get_queryset())
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
     
     def retrieve(self, request, *args, **kwargs):
         instance = self.get_object()
@@ -152,6 +150,7 @@ class UserInvitationViewSet(viewsets.ModelViewSet):
     
     serializer_class = UserInvitationSerializer
     permission_classes = [IsAuthenticated]
+    results_key = 'invitations'
     
     def get_queryset(self):
         return UserInvitation.objects.filter(
@@ -184,13 +183,9 @@ class UserInvitationViewSet(viewsets.ModelViewSet):
         }, status=status.HTTP_201_CREATED)
     
     def list(self, request, *args, **kwargs):
-        queryset = self.get_queryset()
-        serializer = self.get_serializer(queryset, many=True)
-        return Response({
-            'success': True,
-            'invitations': serializer.data,
-            'count': queryset.count()
-        })
+        page = self.paginate_queryset(self.get_queryset())
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
 
 
 class AcceptInvitationView(APIView):
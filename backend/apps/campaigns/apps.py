@@ -5,3 +5,8 @@ class CampaignsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.campaigns'
     verbose_name = 'Campaigns'
+    
+    def ready(self):
+        import apps.campaigns.signals
+        # apps.messages has no app config of its own
+        import apps.messages.signals
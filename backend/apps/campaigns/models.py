@@ -72,6 +72,7 @@ class Campaign(models.Model):
             models.Index(fields=['status']),
             models.Index(fields=['scheduled_at']),
             models.Index(fields=['created_at']),
+            models.Index(fields=['tenant_id', 'created_at', 'id']),
         ]
     
     def __str__(self):
@@ -2,9 +2,19 @@
 Serializers for the campaigns app.
 """
 from rest_framework import serializers
+from apps.contacts.segments import SegmentError, compile_filter
 from .models import Campaign, CampaignSchedule, MessageTemplate
 
 
+def validate_contact_filter(value):
+    """Reject contact filters the segment engine cannot compile."""
+    try:
+        compile_filter(value)
+    except SegmentError as e:
+        raise serializers.ValidationError(str(e))
+    return value
+
+
 class CampaignSerializer(serializers.ModelSerializer):
     """Serializer for the Campaign model."""
     
@@ -36,6 +46,9 @@ class CampaignCreateSerializer(serializers.ModelSerializer):
                   'media_url', 'media_type', 'contact_filter', 'target_tags',
                   'scheduled_at', 'messages_per_minute', 'throttle_enabled']
     
+    def validate_contact_filter(self, value):
+        return validate_contact_filter(value)
+    
     def validate(self, attrs):
         # Parse variables from template
         import re
@@ -53,6 +66,21 @@ class CampaignUpdateSerializer(serializers.ModelSerializer):
         fields = ['name', 'description', 'message_template', 'message_variables',
                   'media_url', 'media_type', 'contact_filter', 'target_tags',
                   'messages_per_minute', 'throttle_enabled']
+    
+    def validate_contact_filter(self, value):
+        return validate_contact_filter(value)
+
+
+class AudiencePreviewSerializer(serializers.Serializer):
+    """Serializer for previewing a campaign audience."""
+    
+    contact_filter = serializers.JSONField(required=False, default=dict,
+                                           validators=[validate_contact_filter])
+    target_tags = serializers.ListField(
+        child=serializers.CharField(),
+        required=False,
+        default=list
+    )
 
 
 class CampaignStatsSerializer(serializers.ModelSerializer):
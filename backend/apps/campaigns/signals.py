@@ -0,0 +1,15 @@
+"""
+Signals for the campaigns app.
+"""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from apps.tenants.versions import CAMPAIGNS, bump_on_commit
+from .models import Campaign
+
+
+@receiver(post_save, sender=Campaign)
+@receiver(post_delete, sender=Campaign)
+def campaign_changed(sender, instance, **kwargs):
+    """Expire conditional GETs of the tenant's campaigns."""
+    bump_on_commit(instance.tenant_id, CAMPAIGNS)
+
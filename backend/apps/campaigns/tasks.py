@@ -2,12 +2,20 @@
 Celery tasks for campaigns and message sending.
 """
 import logging
+import redis
 from celery import shared_task
 from django.utils import timezone
 from django.db import models, transaction
 from apps.tenants.models import Tenant
+from apps.contacts.activity import record_activity
+from apps.contacts.engagement import add_rank, event_rank
 from apps.contacts.models import Contact
+from apps.contacts.phones import normalize_phone, tenant_country_code
+from apps.contacts.segments import contacts_changed, segment_queryset
+from apps.messages import id_map
 from apps.messages.models import Message, ScheduledMessage
+from apps.messages.status import advance_status
+from apps.tenants.versions import MESSAGES, bump_on_commit
 from apps.green_api.service import get_green_api_service
 
 logger = logging.getLogger(__name__)
@@ -22,9 +30,8 @@ def send_single_message(self, message_id):
         
         # Check if tenant can send messages
         if not tenant.can_send_messages:
-            message.status = 'failed'
-            message.status_description = 'Tenant cannot send messages'
-            message.save()
+            advance_status(message.id, 'failed', description='Tenant cannot send messages')
+            bump_on_commit(message.tenant_id, MESSAGES)
             return {'status': 'error', 'message': 'Tenant cannot send messages'}
         
         # Get Green API service
@@ -33,26 +40,45 @@ def send_single_message(self, message_id):
         # Send message based on type
         if message.media_url:
             if message.media_type == 'image':
-                service.send_image(message.phone_to, message.media_url, message.content)
+                result = service.send_image(message.phone_to, message.media_url, message.content)
             elif message.media_type == 'video':
-                service.send_video(message.phone_to, message.media_url, message.content)
+                result = service.send_video(message.phone_to, message.media_url, message.content)
             else:
-                service.send_file(message.phone_to, message.media_url, 
-                                 message.media_id or 'file', message.content)
+                result = service.send_file(message.phone_to, message.media_url, 
+                                          message.media_id or 'file', message.content)
         else:
-            service.send_message(message.phone_to, message.content)
+            result = service.send_message(message.phone_to, message.content)
         
-        # Update message status
-        message.status = 'sent'
-        message.sent_at = timezone.now()
-        message.save()
+        green_api_message_id = (result or {}).get('idMessage', '')
+        
+        # Let status webhooks resolve this message without a DB lookup
+        try:
+            id_map.remember(green_api_message_id, message.id, message.campaign_id)
+        except redis.exceptions.RedisError as e:
+            logger.warning(f"Could not record message ID map for {message_id}: {e}")
+        
+        # Update message status (a delivery webhook may already have overtaken us)
+        if not advance_status(message.id, 'sent', green_api_message_id=green_api_message_id):
+            Message.objects.filter(pk=message.id).update(
+                green_api_message_id=green_api_message_id
+            )
+        bump_on_commit(message.tenant_id, MESSAGES)
         
         # Update contact stats
+        now = timezone.now()
         Contact.objects.filter(tenant_id=message.tenant_id, 
                               phone_number=message.phone_to).update(
             messages_sent=models.F('messages_sent') + 1,
-            last_message_at=timezone.now()
+            last_message_at=now,
+            engagement_rank=add_rank(event_rank('sent', now))
         )
+        contacts_changed(message.tenant_id, engagement_only=True)
+        if message.contact_id:
+            record_activity(
+                message.contact_id, 'message_sent',
+                description=f"Sent: {message.content[:100]}",
+                metadata={'message_id': str(message.id), 'campaign_id': str(message.campaign_id or '')}
+            )
         
         logger.info(f"Message sent successfully: {message_id}")
         return {'status': 'success', 'message_id': message_id}
@@ -75,17 +101,11 @@ def process_campaign(self, campaign_id):
         if campaign.status != 'running':
             return {'status': 'skipped', 'reason': 'Campaign not running'}
         
-        # Get target contacts
-        contacts = Contact.objects.filter(
-            tenant_id=campaign.tenant_id,
-            is_blocked=False,
-            is_subscribed=True
+        # Get target contacts (reachable contacts matching the segment)
+        contacts = segment_queryset(
+            campaign.tenant_id, campaign.contact_filter, campaign.target_tags
         )
         
-        # Apply tag filter if specified
-        if campaign.target_tags:
-            contacts = contacts.filter(tags__overlap=campaign.target_tags)
-        
         # Get unprocessed contacts
         sent_message_ids = set(
             Message.objects.filter(
@@ -151,6 +171,13 @@ def process_scheduled_messages():
     )[:100]
     
     for scheduled in due_messages:
+        phone = normalize_phone(scheduled.phone_number, tenant_country_code(scheduled.tenant_id))
+        if phone is None:
+            scheduled.status = 'failed'
+            scheduled.error_message = 'Invalid phone number'
+            scheduled.save()
+            continue
+        
         # Create message
         message = Message.objects.create(
             tenant_id=scheduled.tenant_id,
@@ -159,7 +186,7 @@ def process_scheduled_messages():
             content=scheduled.message,
             media_url=scheduled.media_url,
             phone_from='self',
-            phone_to=scheduled.phone_number,
+            phone_to=phone,
             status='queued'
         )
         
@@ -176,19 +203,14 @@ def process_scheduled_messages():
 @shared_task
 def update_message_delivery_status(message_id, status):
     """Update message delivery status from webhook."""
+    from apps.messages.reconciler import StatusReconciler
     try:
-        message = Message.objects.get(id=message_id)
-        message.status = status
-        
-        if status == 'delivered':
-            message.delivered_at = timezone.now()
-        elif status == 'read':
-            message.read_at = timezone.now()
-        
-        message.save()
-        return {'status': 'success'}
-    except Message.DoesNotExist:
-        return {'status': 'error', 'message': 'Message not found'}
+        reconciler = StatusReconciler(key_field='id')
+        reconciler.add(message_id, status)
+        changed = reconciler.flush()
+        return {'status': 'success', 'changed': changed}
+    except ValueError as e:
+        return {'status': 'error', 'message': str(e)}
 
 
 @shared_task
@@ -2,6 +2,7 @@
 Unit tests for the campaigns app.
 """
 import pytest
+from unittest.mock import patch
 from django.test import TestCase
 from django.utils import timezone
 from datetime import timedelta
@@ -318,3 +319,108 @@ class MessageTemplateAPITests(APITestCase):
         
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertTrue(response.data['success'])
+
+
+class CampaignAudienceTests(APITestCase):
+    """Tests for campaign audience targeting."""
+    
+    def setUp(self):
+        import uuid
+        from django.contrib.auth import get_user_model
+        from apps.contacts.models import Contact
+        User = get_user_model()
+        self.user = User.objects.create_user(
+            email='audience@example.com',
+            password='test123',
+            tenant_id=uuid.uuid4()
+        )
+        self.client.force_authenticate(self.user)
+        Contact.objects.create(tenant_id=self.user.tenant_id, phone_number='+15550000001', tags=['vip'])
+        Contact.objects.create(tenant_id=self.user.tenant_id, phone_number='+15550000002')
+    
+    def test_preview_audience(self):
+        """Test previewing the audience of a contact filter."""
+        data = {'contact_filter': {'field': 'tags', 'op': 'any', 'value': ['vip']}}
+        
+        response = self.client.post('/api/campaigns/audience/', data, format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 1)
+    
+    def test_create_sets_target_count(self):
+        """Test that creating a campaign computes its target count."""
+        data = {
+            'name': 'Everyone',
+            'message_template': 'Hi {name}',
+            'contact_filter': {'field': 'is_subscribed', 'op': 'eq', 'value': True},
+        }
+        
+        response = self.client.post('/api/campaigns/', data, format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Campaign.objects.get().target_count, 2)
+    
+    def test_invalid_filter_rejected(self):
+        """Test that an uncompilable filter is a validation error."""
+        data = {'contact_filter': {'field': 'unknown'}}
+        
+        response = self.client.post('/api/campaigns/audience/', data, format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ConditionalGetTests(APITestCase):
+    """Tests for ETag revalidation of polled campaign endpoints."""
+    
+    def setUp(self):
+        import uuid
+        from django.contrib.auth import get_user_model
+        User = get_user_model()
+        self.user = User.objects.create_user(
+            email='poll@example.com',
+            password='test123',
+            tenant_id=uuid.uuid4()
+        )
+        self.client.force_authenticate(self.user)
+        Campaign.objects.create(
+            tenant_id=self.user.tenant_id,
+            name='Polled',
+            message_template='Hi',
+            created_by=self.user.id
+        )
+    
+    @patch('apps.tenants.conditional.get_stamps')
+    def test_unchanged_poll_not_modified(self, get_stamps):
+        """Test a matching If-None-Match gets a 304 without running the view."""
+        get_stamps.return_value = ([3], [1700000000.0])
+        first = self.client.get('/api/campaigns/')
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertTrue(first['ETag'].startswith('W/'))
+        
+        with patch('apps.campaigns.views.CampaignViewSet.get_queryset') as get_queryset:
+            response = self.client.get('/api/campaigns/', HTTP_IF_NONE_MATCH=first['ETag'])
+            get_queryset.assert_not_called()
+        
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], first['ETag'])
+    
+    @patch('apps.tenants.conditional.get_stamps')
+    def test_bumped_version_changes_etag(self, get_stamps):
+        """Test a version bump makes the old ETag stale."""
+        get_stamps.return_value = ([3], [1700000000.0])
+        etag = self.client.get('/api/campaigns/')['ETag']
+        
+        get_stamps.return_value = ([4], [1700000100.0])
+        response = self.client.get('/api/campaigns/', HTTP_IF_NONE_MATCH=etag)
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['campaigns']), 1)
+        self.assertNotEqual(response['ETag'], etag)
+    
+    @patch('apps.tenants.conditional.get_stamps', return_value=None)
+    def test_without_redis_runs_view(self, get_stamps):
+        """Test the view runs without validators when Redis is unavailable."""
+        response = self.client.get('/api/campaigns/', HTTP_IF_NONE_MATCH='*')
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('ETag', response)
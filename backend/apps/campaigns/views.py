@@ -2,14 +2,18 @@
 Views for the campaigns app.
 """
 from rest_framework import viewsets, status
+from rest_framework.decorators import action
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from django.utils import timezone
 
+from apps.contacts.segments import audience_count
+from apps.tenants.conditional import conditional_get
+from apps.tenants.versions import CAMPAIGNS
 from .models import Campaign, CampaignSchedule, MessageTemplate
 from .serializers import (
     CampaignSerializer, CampaignCreateSerializer, CampaignUpdateSerializer,
-    CampaignStatsSerializer, CampaignScheduleSerializer,
+    CampaignStatsSerializer, CampaignScheduleSerializer, AudiencePreviewSerializer,
     MessageTemplateSerializer, MessageTemplateCreateSerializer
 )
 
@@ -17,6 +21,8 @@ from .serializers import (
 class CampaignViewSet(viewsets.ModelViewSet):
     """ViewSet for campaign management."""
     
+    results_key = 'campaigns'
+    
     def get_queryset(self):
         return Campaign.objects.filter(tenant_id=self.request.user.tenant_id)
     
@@ -30,17 +36,46 @@ class CampaignViewSet(viewsets.ModelViewSet):
         return CampaignSerializer
     
     def perform_create(self, serializer):
-        serializer.save(tenant_id=self.request.user.tenant_id, created_by=self.request.user.id)
+        serializer.save(
+            tenant_id=self.request.user.tenant_id,
+            created_by=self.request.user.id,
+            target_count=self._target_count(serializer.validated_data)
+        )
     
-    def list(self, request, *args, **kwargs):
-        queryset = self.get_queryset()
-        serializer = self.get_serializer(queryset, many=True)
+    def perform_update(self, serializer):
+        data = serializer.validated_data
+        if 'contact_filter' in data or 'target_tags' in data:
+            serializer.save(target_count=self._target_count({
+                'contact_filter': data.get('contact_filter', serializer.instance.contact_filter),
+                'target_tags': data.get('target_tags', serializer.instance.target_tags),
+            }))
+        else:
+            serializer.save()
+    
+    def _target_count(self, data):
+        return audience_count(
+            self.request.user.tenant_id,
+            data.get('contact_filter'),
+            data.get('target_tags')
+        )
+    
+    @action(detail=False, methods=['post'])
+    def audience(self, request):
+        """Preview how many reachable contacts a filter selects."""
+        serializer = AudiencePreviewSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
         return Response({
             'success': True,
-            'campaigns': serializer.data,
-            'count': queryset.count()
+            'count': self._target_count(serializer.validated_data)
         })
     
+    @conditional_get(CAMPAIGNS)
+    def list(self, request, *args, **kwargs):
+        page = self.paginate_queryset(self.get_queryset())
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+    
+    @conditional_get(CAMPAIGNS)
     def retrieve(self, request, *args, **kwargs):
         instance = self.get_object()
         serializer = self.get_serializer(instance)
@@ -82,6 +117,9 @@ class CampaignActionView(APIView):
             
             campaign.status = 'running'
             campaign.started_at = timezone.now()
+            campaign.target_count = audience_count(
+                campaign.tenant_id, campaign.contact_filter, campaign.target_tags
+            )
             campaign.save()
             
             # TODO: Queue campaign execution task
@@ -131,6 +169,7 @@ class CampaignActionView(APIView):
 class CampaignStatsView(APIView):
     """View for campaign statistics."""
     
+    @conditional_get(CAMPAIGNS)
     def get(self, request, pk):
         campaign = Campaign.objects.get(
             id=pk, tenant_id=request.user.tenant_id
@@ -145,6 +184,8 @@ class CampaignStatsView(APIView):
 class MessageTemplateViewSet(viewsets.ModelViewSet):
     """ViewSet for message templates."""
     
+    results_key = 'templates'
+    
     def get_queryset(self):
         return MessageTemplate.objects.filter(tenant_id=self.request.user.tenant_id)
     
@@ -157,10 +198,6 @@ class MessageTemplateViewSet(viewsets.ModelViewSet):
         serializer.save(tenant_id=self.request.user.tenant_id)
     
     def list(self, request, *args, **kwargs):
-        queryset = self.get_queryset()
-        serializer = self.get_serializer(queryset, many=True)
-        return Response({
-            'success': True,
-            'templates': serializer.data,
-            'count': queryset.count()
-        })
+        page = self.paginate_queryset(self.get_queryset())
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
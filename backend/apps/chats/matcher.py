@@ -0,0 +1,171 @@
+"""
+Compiled auto-reply matching.
+
+Each tenant's active rules are compiled once into an ``AutoReplyMatcher``:
+keyword rules share an Aho-Corasick automaton (one pass over the text
+whatever the number of rules), exact rules are a dictionary lookup,
+regex rules are pre-compiled and ``always`` rules are a constant. The
+matcher returns the highest-priority matching rule.
+
+Matchers are cached per process and rebuilt when the tenant's
+``auto_replies`` version counter changes.
+"""
+import logging
+import re
+import threading
+import time
+from collections import deque
+from django.conf import settings
+from apps.tenants.versions import get_version
+
+logger = logging.getLogger(__name__)
+
+VERSION_RESOURCE = 'auto_replies'
+
+RULE_FIELDS = ('id', 'name', 'trigger_type', 'trigger_value', 'message', 'media_url', 'priority')
+
+
+class KeywordAutomaton:
+    """Aho-Corasick automaton reporting the best (lowest) rank matched."""
+
+    def __init__(self, keywords):
+        # keywords: iterable of (keyword, rank)
+        self.goto = [{}]
+        self.fail = [0]
+        self.best = [None]
+        for keyword, rank in keywords:
+            if not keyword:
+                continue
+            node = 0
+            for char in keyword:
+                nxt = self.goto[node].get(char)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[node][char] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.best.append(None)
+                node = nxt
+            if self.best[node] is None or rank < self.best[node]:
+                self.best[node] = rank
+        self._build_failure_links()
+
+    def _build_failure_links(self):
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self.goto[node].items():
+                queue.append(child)
+                state = self.fail[node]
+                while state and char not in self.goto[state]:
+                    state = self.fail[state]
+                target = self.goto[state].get(char, 0)
+                self.fail[child] = target if target != child else 0
+                inherited = self.best[self.fail[child]]
+                if inherited is not None and (self.best[child] is None or inherited < self.best[child]):
+                    self.best[child] = inherited
+
+    def search(self, text):
+        """Return the lowest rank of any keyword occurring in ``text``."""
+        goto, fail, best = self.goto, self.fail, self.best
+        found = None
+        node = 0
+        for char in text:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            rank = best[node]
+            if rank is not None and (found is None or rank < found):
+                found = rank
+                if found == 0:
+                    break
+        return found
+
+
+class AutoReplyMatcher:
+    """Matches message text against a tenant's compiled auto-reply rules."""
+
+    def __init__(self, rules):
+        # Rank 0 is the rule checked first: highest priority, then oldest
+        self.rules = sorted(rules, key=lambda rule: -rule['priority'])
+        keywords = []
+        self.exact = {}
+        self.regexes = []
+        self.always = None
+        for rank, rule in enumerate(self.rules):
+            trigger_type = rule['trigger_type']
+            value = (rule['trigger_value'] or '').lower()
+            if trigger_type == 'keyword':
+                keywords.append((value, rank))
+            elif trigger_type == 'exact':
+                self.exact.setdefault(value, rank)
+            elif trigger_type == 'regex':
+                try:
+                    self.regexes.append((rank, re.compile(rule['trigger_value'], re.IGNORECASE)))
+                except re.error as e:
+                    logger.warning(f"Skipping auto-reply {rule['id']} with invalid regex: {e}")
+            elif trigger_type == 'always' and self.always is None:
+                self.always = rank
+        self.keywords = KeywordAutomaton(keywords) if keywords else None
+
+    def match(self, text):
+        """Return the best matching rule dict, or None."""
+        text = text or ''
+        lowered = text.lower()
+        best = self.always
+
+        rank = self.exact.get(lowered)
+        if rank is not None and (best is None or rank < best):
+            best = rank
+
+        if self.keywords is not None:
+            rank = self.keywords.search(lowered)
+            if rank is not None and (best is None or rank < best):
+                best = rank
+
+        for rank, pattern in self.regexes:
+            if best is not None and rank >= best:
+                break
+            if pattern.search(text):
+                best = rank
+                break
+
+        return self.rules[best] if best is not None else None
+
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def _build(tenant_id):
+    from .models import AutoReply
+    rules = AutoReply.objects.filter(
+        tenant_id=tenant_id, is_active=True
+    ).order_by('-priority', 'created_at').values(*RULE_FIELDS)
+    return AutoReplyMatcher(list(rules))
+
+
+def get_matcher(tenant_id):
+    """Return the tenant's compiled matcher, rebuilding it if rules changed."""
+    key = str(tenant_id)
+    now = time.monotonic()
+    entry = _cache.get(key)
+    if entry is not None:
+        version, checked_at, matcher = entry
+        if now - checked_at < settings.AUTO_REPLY_VERSION_CHECK_SECONDS:
+            return matcher
+        current = get_version(key, VERSION_RESOURCE)
+        if current is not None and current == version:
+            _cache[key] = (version, now, matcher)
+            return matcher
+
+    with _cache_lock:
+        version = get_version(key, VERSION_RESOURCE)
+        matcher = _build(tenant_id)
+        _cache[key] = (version, now, matcher)
+    return matcher
+
+
+def invalidate(tenant_id):
+    """Drop this process's cached matcher for a tenant."""
+    _cache.pop(str(tenant_id), None)
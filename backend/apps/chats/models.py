@@ -32,7 +32,7 @@ class Chat(models.Model):
     
     # Last message preview
     last_message_preview = models.CharField(max_length=200, blank=True)
-    last_message_at = models.DateTimeField(null=True, blank=True)
+    last_message_at = models.DateTimeField(default=timezone.now)
     
     # Timestamps
     created_at = models.DateTimeField(default=timezone.now)
@@ -46,6 +46,7 @@ class Chat(models.Model):
             models.Index(fields=['phone_number']),
             models.Index(fields=['assigned_to']),
             models.Index(fields=['last_message_at']),
+            models.Index(fields=['tenant_id', 'last_message_at', 'id']),
         ]
         unique_together = [['tenant_id', 'phone_number']]
     
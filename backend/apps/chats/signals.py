@@ -0,0 +1,58 @@
+"""
+Signals for the chats app.
+"""
+import logging
+from django.db import connections, transaction
+from django.db.models.signals import post_migrate, post_save, post_delete
+from django.dispatch import receiver
+from apps.tenants.versions import CHATS, bump_on_commit
+from .models import AutoReply, Chat
+from . import matcher
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(post_save, sender=AutoReply)
+@receiver(post_delete, sender=AutoReply)
+def auto_reply_changed(sender, instance, **kwargs):
+    """Invalidate compiled auto-reply matchers for the rule's tenant."""
+    tenant_id = instance.tenant_id
+    # After commit, so no matcher is rebuilt from the old rules in between
+    bump_on_commit(tenant_id, matcher.VERSION_RESOURCE)
+    transaction.on_commit(lambda: matcher.invalidate(tenant_id))
+
+
+@receiver(post_save, sender=Chat)
+@receiver(post_delete, sender=Chat)
+def chat_changed(sender, instance, **kwargs):
+    """Expire conditional GETs of the tenant's chats."""
+    bump_on_commit(instance.tenant_id, CHATS)
+
+
+
+@receiver(post_migrate)
+def chats_post_migrate(sender, using, **kwargs):
+    """Backfill chats that were never messaged, then make last_message_at NOT NULL.
+
+    The column used to be nullable. Never-messaged chats take their
+    creation time, so they keep their place in the inbox instead of
+    jumping to the top of the ``-last_message_at`` ordering.
+    """
+    if sender.name != 'apps.chats':
+        return
+    connection = connections[using]
+    table = Chat._meta.db_table
+    with connection.cursor() as cursor:
+        nullable = {
+            column.name: column.null_ok
+            for column in connection.introspection.get_table_description(cursor, table)
+        }
+    if not nullable.get('last_message_at'):
+        return
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {table} SET last_message_at = created_at WHERE last_message_at IS NULL"
+        )
+        logger.info(f"Backfilled last_message_at of {cursor.rowcount} chats")
+        if connection.vendor == 'postgresql':
+            cursor.execute(f"ALTER TABLE {table} ALTER COLUMN last_message_at SET NOT NULL")
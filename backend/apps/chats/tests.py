@@ -0,0 +1,118 @@
+"""
+Unit tests for the chats app.
+"""
+import uuid
+from datetime import timedelta
+from unittest.mock import patch
+from django.apps import apps
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+from apps.chats.matcher import AutoReplyMatcher
+from apps.chats.models import AutoReply, Chat
+from apps.chats.signals import chats_post_migrate
+
+
+def _rule(rule_id, trigger_type, trigger_value, priority=0):
+    return {
+        'id': rule_id, 'name': rule_id, 'trigger_type': trigger_type,
+        'trigger_value': trigger_value, 'message': f'reply {rule_id}',
+        'media_url': '', 'priority': priority,
+    }
+
+
+class AutoReplyMatcherTests(SimpleTestCase):
+    """Tests for the compiled auto-reply matcher."""
+    
+    def test_keyword_match_is_case_insensitive(self):
+        """Test that keyword rules match anywhere in the text."""
+        matcher = AutoReplyMatcher([_rule('price', 'keyword', 'Price')])
+        
+        self.assertEqual(matcher.match('What is the PRICE today?')['id'], 'price')
+        self.assertIsNone(matcher.match('Hello there'))
+    
+    def test_exact_match(self):
+        """Test that exact rules only match the whole message."""
+        matcher = AutoReplyMatcher([_rule('hi', 'exact', 'hi')])
+        
+        self.assertEqual(matcher.match('HI')['id'], 'hi')
+        self.assertIsNone(matcher.match('hi there'))
+    
+    def test_regex_rules_are_evaluated(self):
+        """Test that regex triggers are supported."""
+        matcher = AutoReplyMatcher([_rule('order', 'regex', r'order\s*#?\d+')])
+        
+        self.assertEqual(matcher.match('Where is order #1234?')['id'], 'order')
+        self.assertIsNone(matcher.match('Where is my order?'))
+    
+    def test_invalid_regex_is_skipped(self):
+        """Test that an invalid pattern does not break the matcher."""
+        matcher = AutoReplyMatcher([_rule('bad', 'regex', '(unclosed')])
+        
+        self.assertIsNone(matcher.match('(unclosed'))
+    
+    def test_highest_priority_wins(self):
+        """Test that the highest-priority matching rule is returned."""
+        matcher = AutoReplyMatcher([
+            _rule('fallback', 'always', '', priority=0),
+            _rule('help', 'keyword', 'help', priority=5),
+            _rule('urgent', 'regex', 'urgent', priority=10),
+        ])
+        
+        self.assertEqual(matcher.match('urgent help please')['id'], 'urgent')
+        self.assertEqual(matcher.match('help please')['id'], 'help')
+        self.assertEqual(matcher.match('thanks')['id'], 'fallback')
+    
+    def test_overlapping_keywords(self):
+        """Test keywords that are suffixes of one another."""
+        matcher = AutoReplyMatcher([
+            _rule('she', 'keyword', 'she', priority=1),
+            _rule('he', 'keyword', 'he', priority=2),
+            _rule('hers', 'keyword', 'hers', priority=3),
+        ])
+        
+        self.assertEqual(matcher.match('ushers')['id'], 'hers')
+        self.assertEqual(matcher.match('ashe')['id'], 'he')
+
+
+class AutoReplySignalTests(TestCase):
+    """Tests for invalidating matchers when rules change."""
+    
+    @patch('apps.tenants.versions.bump_version')
+    @patch('apps.chats.matcher.invalidate')
+    def test_matchers_are_invalidated_after_commit(self, mock_invalidate, mock_bump):
+        """Test that a rule change only invalidates once it is committed."""
+        tenant_id = uuid.uuid4()
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            AutoReply.objects.create(
+                tenant_id=tenant_id, name='Price', trigger_type='keyword',
+                trigger_value='price', message='Our prices'
+            )
+            mock_invalidate.assert_not_called()
+            mock_bump.assert_not_called()
+        
+        mock_invalidate.assert_called_once_with(tenant_id)
+        mock_bump.assert_called_once_with(tenant_id, 'auto_replies')
+
+
+class ChatBackfillTests(TestCase):
+    """Tests for backfilling last_message_at of never-messaged chats."""
+    
+    def test_null_last_message_at_takes_created_at(self):
+        """Test that chats without messages sort by their creation time."""
+        if connection.vendor != 'postgresql':
+            self.skipTest('The column is only altered on PostgreSQL')
+        created_at = timezone.now() - timedelta(days=3)
+        chat = Chat.objects.create(tenant_id=uuid.uuid4(), phone_number='+15550009001', created_at=created_at)
+        with connection.cursor() as cursor:
+            cursor.execute('ALTER TABLE chats ALTER COLUMN last_message_at DROP NOT NULL')
+            cursor.execute('UPDATE chats SET last_message_at = NULL WHERE id = %s', [chat.id])
+        
+        chats_post_migrate(apps.get_app_config('chats'), using='default')
+        
+        chat.refresh_from_db()
+        self.assertEqual(chat.last_message_at, created_at)
+        with connection.cursor() as cursor:
+            columns = connection.introspection.get_table_description(cursor, 'chats')
+        self.assertFalse(next(c for c in columns if c.name == 'last_message_at').null_ok)
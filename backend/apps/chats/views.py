@@ -3,16 +3,21 @@ Views for the chats app.
 """
 from rest_framework import viewsets, status
 from rest_framework.views import APIView
-from rest_framework.response import Response
+from apps.tenants.conditional import conditional_get
+from apps.tenants.versions import CHATS
 from .models import Chat, AutoReply
 
 
 class ChatViewSet(viewsets.ModelViewSet):
     """ViewSet for chat management."""
     
+    results_key = 'chats'
+    ordering = ['-last_message_at']
+    
     def get_queryset(self):
         return Chat.objects.filter(tenant_id=self.request.user.tenant_id)
     
+    @conditional_get(CHATS)
     def list(self, request, *args, **kwargs):
         queryset = self.get_queryset()
         # Filter by status
@@ -23,17 +28,15 @@ class ChatViewSet(viewsets.ModelViewSet):
         data = [{'id': chat.id, 'phone_number': chat.phone_number,
                  'contact_name': chat.contact_name, 'status': chat.status,
                  'unread_count': chat.unread_count, 'last_message_at': chat.last_message_at}
-                for chat in queryset]
-        return Response({
-            'success': True,
-            'chats': data,
-            'count': queryset.count()
-        })
+                for chat in self.paginate_queryset(queryset)]
+        return self.get_paginated_response(data)
 
 
 class AutoReplyViewSet(viewsets.ModelViewSet):
     """ViewSet for auto-reply rules."""
     
+    results_key = 'auto_replies'
+    
     def get_queryset(self):
         return AutoReply.objects.filter(tenant_id=self.request.user.tenant_id)
     
@@ -41,13 +44,8 @@ class AutoReplyViewSet(viewsets.ModelViewSet):
         serializer.save(tenant_id=self.request.user.tenant_id)
     
     def list(self, request, *args, **kwargs):
-        queryset = self.get_queryset()
         data = [{'id': ar.id, 'name': ar.name, 'trigger_type': ar.trigger_type,
                  'trigger_value': ar.trigger_value, 'message': ar.message,
                  'is_active': ar.is_active, 'priority': ar.priority}
-                for ar in queryset]
-        return Response({
-            'success': True,
-            'auto_replies': data,
-            'count': queryset.count()
-        })
+                for ar in self.paginate_queryset(self.get_queryset())]
+        return self.get_paginated_response(data)
@@ -0,0 +1,217 @@
+"""
+Write-behind sink for contact activity logging.
+
+Activities are buffered per process and written with ``bulk_create`` by a
+background thread once the buffer reaches ``CONTACT_ACTIVITY_FLUSH_SIZE``
+rows or ``CONTACT_ACTIVITY_FLUSH_SECONDS`` have passed, so recording an
+activity costs a list append in the request or webhook path.
+
+If the buffer reaches ``CONTACT_ACTIVITY_MAX_PENDING`` the producer
+flushes inline (back-pressure). Batches that cannot be written because the
+database is unavailable are kept for the next flush; anything left over on
+shutdown or beyond the cap is spilled to a Redis list and written back by
+the next successful flush.
+"""
+import atexit
+import json
+import logging
+import os
+import threading
+import uuid
+import redis
+from celery.signals import worker_process_shutdown
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, close_old_connections, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from config.redis_client import get_redis
+from .models import ContactActivity
+
+logger = logging.getLogger(__name__)
+
+SPILL_KEY = 'contact_activity:spill'
+
+
+def _serialize(activity):
+    return json.dumps({
+        'id': str(activity.id),
+        'contact_id': str(activity.contact_id),
+        'activity_type': activity.activity_type,
+        'description': activity.description,
+        'metadata': activity.metadata,
+        'performed_by': str(activity.performed_by) if activity.performed_by else None,
+        'created_at': activity.created_at.isoformat(),
+    })
+
+
+def _deserialize(raw):
+    data = json.loads(raw)
+    data['created_at'] = parse_datetime(data['created_at'])
+    return ContactActivity(**data)
+
+
+class ActivitySink:
+    """Buffers ContactActivity rows and writes them in batches."""
+
+    def __init__(self, flush_size=None, flush_seconds=None, max_pending=None):
+        self.flush_size = flush_size or settings.CONTACT_ACTIVITY_FLUSH_SIZE
+        self.flush_seconds = (
+            settings.CONTACT_ACTIVITY_FLUSH_SECONDS if flush_seconds is None else flush_seconds
+        )
+        self.max_pending = max_pending or settings.CONTACT_ACTIVITY_MAX_PENDING
+        self._pending = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    @property
+    def pending(self):
+        return len(self._pending)
+
+    def record(self, contact_id, activity_type, description='', metadata=None,
+               performed_by=None, created_at=None):
+        """Buffer an activity once the surrounding transaction commits."""
+        activity = ContactActivity(
+            id=uuid.uuid4(),
+            contact_id=contact_id,
+            activity_type=activity_type,
+            description=description,
+            metadata=metadata or {},
+            performed_by=performed_by,
+            created_at=created_at or timezone.now()
+        )
+        transaction.on_commit(lambda: self.add(activity))
+
+    def add(self, activity):
+        """Append an activity to the buffer."""
+        with self._lock:
+            self._pending.append(activity)
+            size = len(self._pending)
+        background = self._ensure_flusher()
+        if size >= self.max_pending or (size >= self.flush_size and not background):
+            # Back-pressure: the producer pays for the write
+            self.flush()
+        elif size >= self.flush_size:
+            self._wakeup.set()
+
+    def flush(self):
+        """Write all buffered activities; returns the number written."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return 0
+            try:
+                with transaction.atomic():
+                    ContactActivity.objects.bulk_create(batch, batch_size=self.flush_size)
+            except IntegrityError:
+                # Usually a contact deleted while its activity was buffered
+                written = self._write_individually(batch)
+            except DatabaseError as e:
+                logger.error(f"Could not write {len(batch)} contact activities: {e}")
+                self._requeue(batch)
+                return 0
+            else:
+                written = len(batch)
+            self._replay_spill()
+            return written
+
+    def close(self):
+        """Flush on shutdown, spilling whatever cannot be written."""
+        self.flush()
+        with self._lock:
+            leftover, self._pending = self._pending, []
+        if leftover:
+            self._spill(leftover)
+
+    def _write_individually(self, batch):
+        written = 0
+        for activity in batch:
+            try:
+                with transaction.atomic():
+                    activity.save(force_insert=True)
+                written += 1
+            except IntegrityError as e:
+                logger.warning(f"Dropping activity for contact {activity.contact_id}: {e}")
+        return written
+
+    def _requeue(self, batch):
+        with self._lock:
+            self._pending = batch + self._pending
+            overflow = len(self._pending) - self.max_pending
+            if overflow > 0:
+                spilled, self._pending = self._pending[:overflow], self._pending[overflow:]
+            else:
+                spilled = []
+        if spilled:
+            self._spill(spilled)
+
+    def _spill(self, activities):
+        try:
+            get_redis().rpush(SPILL_KEY, *[_serialize(activity) for activity in activities])
+            logger.warning(f"Spilled {len(activities)} contact activities to Redis")
+        except redis.exceptions.RedisError as e:
+            logger.error(f"Lost {len(activities)} contact activities: {e}")
+
+    def _replay_spill(self):
+        try:
+            raw = get_redis().lpop(SPILL_KEY, self.flush_size)
+        except redis.exceptions.RedisError:
+            return
+        if raw:
+            with self._lock:
+                self._pending.extend(_deserialize(item) for item in raw)
+            self._wakeup.set()
+
+    def _ensure_flusher(self):
+        """Start the background flusher in this process; False if disabled."""
+        if self.flush_seconds <= 0:
+            return False
+        pid = os.getpid()
+        if self._pid == pid and self._thread.is_alive():
+            return True
+        with self._lock:
+            if self._pid != pid or not self._thread.is_alive():
+                # Also covers a sink inherited through fork()
+                self._thread = threading.Thread(
+                    target=self._run, name='contact-activity-sink', daemon=True
+                )
+                self._thread.start()
+                self._pid = pid
+        return True
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_seconds)
+            self._wakeup.clear()
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Contact activity flush failed: {e}")
+
+
+_sink = None
+
+
+def get_activity_sink():
+    """Return the process-wide activity sink."""
+    global _sink
+    if _sink is None:
+        _sink = ActivitySink()
+        atexit.register(_sink.close)
+    return _sink
+
+
+def record_activity(contact_id, activity_type, **kwargs):
+    """Record a contact activity without writing it in the caller's path."""
+    get_activity_sink().record(contact_id, activity_type, **kwargs)
+
+
+@worker_process_shutdown.connect
+def _flush_on_worker_shutdown(**kwargs):
+    # Prefork children exit without running atexit handlers
+    if _sink is not None:
+        _sink.close()
@@ -2,7 +2,7 @@
 Admin configuration for the contacts app.
 """
 from django.contrib import admin
-from .models import Contact, Tag, ContactActivity, ContactNote
+from .models import Contact, Tag, ContactActivity, ContactBulkUpdate, ContactNote
 
 
 @admin.register(Contact)
@@ -46,6 +46,15 @@ class ContactActivityAdmin(admin.ModelAdmin):
     search_fields = ('contact__phone_number', 'contact__name', 'description')
 
 
+@admin.register(ContactBulkUpdate)
+class ContactBulkUpdateAdmin(admin.ModelAdmin):
+    """Admin configuration for the ContactBulkUpdate model."""
+    
+    list_display = ('tenant_id', 'description', 'contact_count', 'performed_by', 'created_at')
+    list_filter = ('tenant_id', 'created_at')
+    search_fields = ('description',)
+
+
 @admin.register(ContactNote)
 class ContactNoteAdmin(admin.ModelAdmin):
     """Admin configuration for the ContactNote model."""
@@ -0,0 +1,141 @@
+"""
+Set-based bulk changes to contacts.
+
+Tag additions and removals and the block/subscribe flags are applied to
+every selected contact (a segment filter or an ID list) with a single
+``UPDATE``. On PostgreSQL the same statement logs the change (a
+data-modifying CTE), so retagging a segment is one round trip however
+large it is; the tag-count triggers see it as one statement too. Contacts
+the change would leave as they are are not written at all.
+
+A bulk change is logged once, not per contact: a ``ContactBulkUpdate``
+row for the tenant recording the selection (filter or IDs), the changes
+and the number of contacts changed.
+
+Other databases (development SQLite) update row by row.
+"""
+import json
+from django.db import connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+from .models import Contact, ContactBulkUpdate
+from .segments import contacts_changed, segment_queryset
+from .tags import tags_q
+
+FLAGS = ('is_blocked', 'is_subscribed')
+
+_BULK_UPDATE_SQL = """
+    WITH changed AS (
+        UPDATE contacts SET {assignments}
+        WHERE id IN ({selection})
+        RETURNING id
+    ), logged AS (
+        INSERT INTO contact_bulk_updates
+            (id, tenant_id, selection, changes, description, contact_count, performed_by, created_at)
+        SELECT gen_random_uuid(), %s::uuid, %s::jsonb, %s::jsonb, %s, count(*), %s::uuid, %s
+        FROM changed HAVING count(*) > 0
+    )
+    SELECT count(*) FROM changed
+"""
+
+# Non-array tags count as no tags; added tags are moved to the end once
+_TAGS_SQL = (
+    "(CASE WHEN jsonb_typeof(tags) = 'array' THEN tags ELSE '[]'::jsonb END"
+    " - %s::text[]) || to_jsonb(%s::text[])"
+)
+
+
+def select_contacts(tenant_id, contact_filter=None, ids=None):
+    """Return a tenant's contacts by segment filter or by ID list."""
+    if ids is not None:
+        return Contact.objects.filter(tenant_id=tenant_id, id__in=ids)
+    return segment_queryset(tenant_id, contact_filter, reachable_only=False)
+
+
+def describe_change(add_tags=(), remove_tags=(), flags=None):
+    """One-line summary of a bulk change for the activity log."""
+    parts = []
+    if add_tags:
+        parts.append(f"added tags {', '.join(add_tags)}")
+    if remove_tags:
+        parts.append(f"removed tags {', '.join(remove_tags)}")
+    for field, value in (flags or {}).items():
+        parts.append(f"{field} set to {str(value).lower()}")
+    return f"Bulk update: {'; '.join(parts)}"
+
+
+def _change_q(add_tags, remove_tags, flags, vendor):
+    q = Q()
+    if add_tags:
+        q |= ~tags_q(add_tags, match_all=True, vendor=vendor)
+    if remove_tags:
+        q |= tags_q(remove_tags, vendor=vendor)
+    for field, value in flags.items():
+        q |= ~Q(**{field: value})
+    return q
+
+
+def bulk_update_contacts(tenant_id, queryset, add_tags=(), remove_tags=(), flags=None,
+                         performed_by=None, selection=None):
+    """Apply tag and flag changes to a tenant's contacts in ``queryset``; returns the number changed.
+
+    ``selection`` describes how ``queryset`` was chosen, for the log.
+    """
+    add_tags = list(dict.fromkeys(str(tag) for tag in add_tags))
+    remove_tags = [str(tag) for tag in dict.fromkeys(remove_tags) if tag not in add_tags]
+    flags = {field: value for field, value in (flags or {}).items() if field in FLAGS}
+    if not (add_tags or remove_tags or flags):
+        return 0
+    connection = connections[queryset.db]
+    queryset = queryset.filter(tenant_id=tenant_id).filter(
+        _change_q(add_tags, remove_tags, flags, connection.vendor)
+    )
+    log = ContactBulkUpdate(
+        tenant_id=tenant_id, selection=selection or {},
+        changes={'add_tags': add_tags, 'remove_tags': remove_tags, **flags},
+        description=describe_change(add_tags, remove_tags, flags),
+        performed_by=performed_by, created_at=timezone.now()
+    )
+    with transaction.atomic(using=queryset.db):
+        if connection.vendor == 'postgresql':
+            changed = _update_postgresql(queryset, add_tags, remove_tags, flags, log)
+        else:
+            changed = _update_portable(queryset, add_tags, remove_tags, flags, log)
+        contacts_changed(tenant_id)
+    return changed
+
+
+def _update_postgresql(queryset, add_tags, remove_tags, flags, log):
+    assignments = ['updated_at = %s']
+    params = [log.created_at]
+    if add_tags or remove_tags:
+        assignments.append(f'tags = {_TAGS_SQL}')
+        params += [add_tags + remove_tags, add_tags]
+    for field, value in flags.items():
+        assignments.append(f'{field} = %s')
+        params.append(value)
+    selection, selection_params = queryset.values('id').query.sql_with_params()
+    sql = _BULK_UPDATE_SQL.format(assignments=', '.join(assignments), selection=selection)
+    params += list(selection_params) + [
+        log.tenant_id, json.dumps(log.selection), json.dumps(log.changes), log.description,
+        log.performed_by, log.created_at
+    ]
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchone()[0]
+
+
+def _update_portable(queryset, add_tags, remove_tags, flags, log):
+    contacts = list(queryset.only('id', 'tags', *flags))
+    for contact in contacts:
+        tags = contact.tags if isinstance(contact.tags, list) else []
+        contact.tags = [tag for tag in tags if tag not in add_tags and tag not in remove_tags] + add_tags
+        for field, value in flags.items():
+            setattr(contact, field, value)
+        contact.updated_at = log.created_at
+    fields = ['updated_at', *flags] + (['tags'] if add_tags or remove_tags else [])
+    Contact.objects.bulk_update(contacts, fields, batch_size=1000)
+    if contacts:
+        log.contact_count = len(contacts)
+        log.save(using=queryset.db)
+    return len(contacts)
@@ -0,0 +1,286 @@
+"""
+Duplicate contact merging.
+
+Every entry point now stores E.164 numbers, but contacts written before
+that (or under a different default country code) may hold the same
+person as ``07911 123456`` and ``+447911123456``, and campaigns message
+both. A contact's canonical phone key is its number normalised with the
+tenant's default country code (apps.contacts.phones).
+
+Rows already holding an E.164 number are their own key and cannot collide
+with each other (the ``(tenant_id, phone_number)`` constraint), so the
+database filters them out of the scan with a regex. The remaining rows
+go through ``normalize_many`` and are hash-joined on their key against
+the rows holding it, fetched with one indexed ``phone_number IN`` lookup
+per batch.
+Each group is merged into a survivor: the row holding the key, else the
+oldest. Tags are unioned, metadata merged (the survivor's keys win),
+counters summed, blank details filled in, blocks and unsubscribes kept.
+Activities, notes and messages are moved over with one ``UPDATE ...
+CASE`` per table and batch, then the duplicates are deleted. Chats are
+keyed by number rather than contact, so each group's chats are folded
+into one on the key in the same transaction: unread counts summed, the
+latest message time and preview kept.
+
+Incremental runs only scan contacts updated since the previous run
+(watermark kept in Redis). A full run is needed once for rows stored
+before numbers were normalised on entry.
+"""
+import logging
+from datetime import timedelta
+import redis
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Case, UUIDField, Value, When
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from config.redis_client import get_redis
+from apps.chats.models import Chat
+from apps.messages.models import Message
+from apps.tenants.versions import CHATS, bump_on_commit
+from .activity import record_activity
+from .engagement import add_ranks
+from .models import Contact, ContactActivity, ContactNote
+from .phones import MAX_DIGITS, MIN_DIGITS, normalize_many, tenant_country_code
+from .segments import contacts_changed
+
+logger = logging.getLogger(__name__)
+
+WATERMARK_KEY = 'contact_dedup:since'
+
+# Rows saved in transactions still open when a run starts commit with an
+# earlier updated_at, so each run rescans a little before its start time
+WATERMARK_OVERLAP = timedelta(minutes=5)
+
+# Details copied from a duplicate when the survivor's are blank
+FILL_FIELDS = ('name', 'email', 'company', 'position', 'wa_id', 'wa_business_id')
+
+E164_REGEX = r'^\+[1-9][0-9]{%d,%d}$' % (MIN_DIGITS - 1, MAX_DIGITS - 1)
+
+MERGED_FIELDS = FILL_FIELDS + (
+    'phone_number', 'tags', 'metadata', 'is_blocked', 'is_subscribed',
+    'messages_received', 'messages_sent', 'engagement_rank', 'last_message_at', 'created_at',
+    'updated_at'
+)
+
+
+def _with_keys(rows):
+    """Yield ``(tenant_id, id, key)`` for rows not stored under their key."""
+    by_tenant = {}
+    for tenant_id, pk, phone in rows:
+        by_tenant.setdefault(tenant_id, []).append((pk, phone))
+    for tenant_id, tenant_rows in by_tenant.items():
+        keys = normalize_many([phone for _, phone in tenant_rows], tenant_country_code(tenant_id))
+        for (pk, phone), key in zip(tenant_rows, keys):
+            if key and key != phone:
+                yield tenant_id, pk, key
+
+
+def find_duplicates(queryset, batch_size=None):
+    """Yield ``(tenant_id, [(key, [contact ids])])`` batches for the scanned contacts.
+
+    A group may hold a single contact that only needs its number normalised.
+    """
+    batch_size = batch_size or settings.CONTACT_DEDUP_BATCH_SIZE
+    chunk_size = settings.CONTACT_EXPORT_CHUNK_SIZE
+    rows = queryset.exclude(phone_number__regex=E164_REGEX).values_list(
+        'tenant_id', 'id', 'phone_number'
+    ).iterator(chunk_size=chunk_size)
+    pending = {}
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) < chunk_size:
+            continue
+        for tenant_id, pk, key in _with_keys(chunk):
+            groups = pending.setdefault(tenant_id, {})
+            groups.setdefault(key, []).append(pk)
+            if len(groups) >= batch_size:
+                yield tenant_id, _join_holders(tenant_id, pending.pop(tenant_id))
+        chunk = []
+    for tenant_id, pk, key in _with_keys(chunk):
+        pending.setdefault(tenant_id, {}).setdefault(key, []).append(pk)
+    for tenant_id, groups in pending.items():
+        yield tenant_id, _join_holders(tenant_id, groups)
+
+
+def _join_holders(tenant_id, groups):
+    holders = Contact.objects.filter(
+        tenant_id=tenant_id, phone_number__in=list(groups)
+    ).values_list('phone_number', 'id')
+    for key, pk in holders:
+        # The holder goes first so it survives
+        groups[key].insert(0, pk)
+    return list(groups.items())
+
+
+def _merge_into(survivor, duplicates, key):
+    survivor.phone_number = key
+    tags = list(survivor.tags) if isinstance(survivor.tags, list) else []
+    metadata = {}
+    for duplicate in duplicates:
+        for field in FILL_FIELDS:
+            if not getattr(survivor, field) and getattr(duplicate, field):
+                setattr(survivor, field, getattr(duplicate, field))
+        if isinstance(duplicate.tags, list):
+            tags.extend(tag for tag in duplicate.tags if tag not in tags)
+        if isinstance(duplicate.metadata, dict):
+            metadata.update(duplicate.metadata)
+        survivor.is_blocked = survivor.is_blocked or duplicate.is_blocked
+        survivor.is_subscribed = survivor.is_subscribed and duplicate.is_subscribed
+        survivor.messages_received += duplicate.messages_received
+        survivor.messages_sent += duplicate.messages_sent
+        survivor.engagement_rank = add_ranks(survivor.engagement_rank, duplicate.engagement_rank)
+        if duplicate.last_message_at and (
+                not survivor.last_message_at or duplicate.last_message_at > survivor.last_message_at):
+            survivor.last_message_at = duplicate.last_message_at
+        survivor.created_at = min(survivor.created_at, duplicate.created_at)
+    if isinstance(survivor.metadata, dict):
+        metadata.update(survivor.metadata)
+    survivor.tags = tags
+    survivor.metadata = metadata
+    survivor.updated_at = timezone.now()
+
+
+def _move(model, field, survivors):
+    """Point ``field`` of every row owned by a duplicate at its survivor."""
+    if not survivors:
+        return 0
+    return model.objects.filter(**{f'{field}__in': list(survivors)}).update(**{
+        field: Case(
+            *[When(**{field: duplicate}, then=Value(survivor))
+              for duplicate, survivor in survivors.items()],
+            output_field=UUIDField()
+        )
+    })
+
+
+def _merge_chats(tenant_id, numbers):
+    """Fold the chats of each ``{key: [numbers]}`` group into one chat on the key."""
+    phones = [phone for group in numbers.values() for phone in group]
+    chats = {
+        chat.phone_number: chat
+        for chat in Chat.objects.select_for_update().filter(tenant_id=tenant_id, phone_number__in=phones)
+    }
+    updated, removed = [], []
+    for key, group in numbers.items():
+        group = [chats[phone] for phone in dict.fromkeys(group) if phone in chats]
+        if not group:
+            continue
+        # The chat already on the key keeps its ID, else the most recent one
+        latest = max(group, key=lambda chat: chat.last_message_at)
+        survivor = chats.get(key, latest)
+        for chat in group:
+            if chat is not survivor:
+                survivor.unread_count += chat.unread_count
+                survivor.contact_name = survivor.contact_name or chat.contact_name
+                survivor.assigned_to = survivor.assigned_to or chat.assigned_to
+                survivor.created_at = min(survivor.created_at, chat.created_at)
+                removed.append(chat.pk)
+        survivor.last_message_at = latest.last_message_at
+        survivor.last_message_preview = latest.last_message_preview
+        survivor.phone_number = key
+        survivor.updated_at = timezone.now()
+        updated.append(survivor)
+    if not updated:
+        return
+    # Deleted first so no survivor collides with a chat still on its key
+    Chat.objects.filter(pk__in=removed).delete()
+    Chat.objects.bulk_update(updated, [
+        'phone_number', 'unread_count', 'contact_name', 'assigned_to', 'last_message_at',
+        'last_message_preview', 'created_at', 'updated_at',
+    ])
+    bump_on_commit(tenant_id, CHATS)
+
+
+def merge_groups(tenant_id, groups):
+    """Merge each ``(key, [contact ids])`` group into one contact.
+
+    Returns ``(merged, normalized)``: duplicates removed and survivors whose
+    number was rewritten to the key.
+    """
+    ids = [pk for _, members in groups for pk in members]
+    survivors = {}
+    merged_into = {}
+    numbers = {}
+    normalized = 0
+    with transaction.atomic():
+        contacts = Contact.objects.select_for_update().in_bulk(ids)
+        updated = []
+        for key, members in groups:
+            members = [contacts[pk] for pk in members if pk in contacts]
+            if not members:
+                continue
+            if members[0].phone_number != key:
+                # No row holds the key yet; the oldest survives
+                members.sort(key=lambda contact: contact.created_at)
+                normalized += 1
+            numbers[key] = [contact.phone_number for contact in members]
+            survivor, duplicates = members[0], members[1:]
+            _merge_into(survivor, duplicates, key)
+            updated.append(survivor)
+            merged_into[survivor.pk] = [duplicate.pk for duplicate in duplicates]
+            for duplicate in duplicates:
+                survivors[duplicate.pk] = survivor.pk
+        _move(ContactActivity, 'contact_id', survivors)
+        _move(ContactNote, 'contact_id', survivors)
+        _move(Message, 'contact_id', survivors)
+        Contact.objects.filter(pk__in=list(survivors)).delete()
+        Contact.objects.bulk_update(updated, MERGED_FIELDS)
+        _merge_chats(tenant_id, numbers)
+        for pk, duplicates in merged_into.items():
+            if duplicates:
+                record_activity(
+                    pk, 'merged',
+                    description=f'Merged {len(duplicates)} duplicate contact(s)',
+                    metadata={'merged_ids': [str(duplicate) for duplicate in duplicates]}
+                )
+        contacts_changed(tenant_id)
+    return len(survivors), normalized
+
+
+def merge_duplicates(queryset, batch_size=None):
+    """Merge duplicates of the scanned contacts; returns counts."""
+    stats = {'tenants': 0, 'merged': 0, 'normalized': 0}
+    tenants = set()
+    for tenant_id, groups in find_duplicates(queryset, batch_size):
+        try:
+            merged, normalized = merge_groups(tenant_id, groups)
+        except IntegrityError as e:
+            # A contact took one of the keys mid-run; it is newer than the
+            # watermark, so the next run picks the group up again
+            logger.warning(f"Skipping a dedup batch for tenant {tenant_id}: {e}")
+            continue
+        tenants.add(tenant_id)
+        stats['merged'] += merged
+        stats['normalized'] += normalized
+    stats['tenants'] = len(tenants)
+    return stats
+
+
+def get_watermark():
+    """Return when the last incremental run started (None if unknown)."""
+    try:
+        value = get_redis().get(WATERMARK_KEY)
+    except redis.exceptions.RedisError as e:
+        logger.warning(f"Dedup watermark unavailable: {e}")
+        return None
+    return parse_datetime(value.decode() if isinstance(value, bytes) else value) if value else None
+
+
+def run_dedup(full=False, tenant_id=None):
+    """Merge duplicates among contacts changed since the last run (or all)."""
+    started = timezone.now()
+    queryset = Contact.objects.all()
+    if tenant_id:
+        queryset = queryset.filter(tenant_id=tenant_id)
+    since = None if full else get_watermark()
+    if since is not None:
+        queryset = queryset.filter(updated_at__gte=since - WATERMARK_OVERLAP)
+    stats = merge_duplicates(queryset)
+    if not tenant_id:
+        try:
+            get_redis().set(WATERMARK_KEY, started.isoformat())
+        except redis.exceptions.RedisError as e:
+            logger.warning(f"Could not store dedup watermark: {e}")
+    return stats
@@ -0,0 +1,138 @@
+"""
+Recency-decayed contact engagement.
+
+Every sent, received and read message adds its weight to a contact's
+score, and the score halves every ``CONTACT_ENGAGEMENT_HALF_LIFE_DAYS``.
+Decaying every row as time passes would rewrite the whole table, so the
+stored ``Contact.engagement_rank`` is the score scaled to a fixed epoch
+instead, kept as a base-2 logarithm so it never overflows::
+
+    rank = log2(sum(weight * 2 ** (event_time - EPOCH) / half_life))
+    score(now) = 2 ** (rank - (now - EPOCH) / half_life)
+
+All scores decay by the same factor, so ordering by rank is ordering by
+current score, and a score threshold is a rank threshold that moves with
+the clock. An event changes one rank with a log-add in the statement
+that already bumps the contact's counters (or, for reads, once per
+reconciler batch), and ``(tenant_id, engagement_rank, id)`` serves
+"most engaged" orderings and top-N segments as index scans.
+
+Changing the half-life or the weights needs ``rebuild_engagement_scores``.
+"""
+import math
+from datetime import datetime, timezone as dt_timezone
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import Abs, Greatest, Least, Ln, Power
+from django.utils import timezone
+from apps.messages.models import Message
+
+EPOCH = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+
+# Rank of a contact without engagement (a score of practically zero)
+RANK_FLOOR = -1000.0
+
+# Past this gap the smaller term is below float precision; also keeps
+# POWER() from underflowing, which PostgreSQL reports as an error
+MAX_RANK_GAP = 60
+
+# log2(2**a + 2**b) for the SQL expressions ``{rank}`` and ``{other}``
+ADD_RANK_SQL = (
+    "GREATEST({rank}, {other}) + LN(1 + POWER(2, -LEAST(ABS({rank} - {other}), "
+    f"{MAX_RANK_GAP}))) / LN(2)"
+)
+
+
+def _half_lives(at):
+    half_life = settings.CONTACT_ENGAGEMENT_HALF_LIFE_DAYS * 86400
+    return (at - EPOCH).total_seconds() / half_life
+
+
+def event_rank(kind, at=None, count=1):
+    """Rank contributed by ``count`` events of ``kind`` (sent, received, read) at ``at``."""
+    weight = settings.CONTACT_ENGAGEMENT_WEIGHTS[kind] * count
+    return math.log2(weight) + _half_lives(at or timezone.now())
+
+
+def add_ranks(a, b):
+    """Combine two ranks in Python."""
+    high, low = max(a, b), min(a, b)
+    return high + math.log2(1 + 2 ** -min(high - low, MAX_RANK_GAP))
+
+
+def add_rank(rank):
+    """ORM expression adding ``rank`` to ``Contact.engagement_rank``."""
+    rank = Value(rank, output_field=FloatField())
+    current = F('engagement_rank')
+    gap = Least(Abs(current - rank), Value(float(MAX_RANK_GAP)))
+    return Greatest(current, rank) + Ln(Value(1.0) + Power(Value(0.5), gap)) / Value(math.log(2))
+
+
+def current_score(rank, now=None):
+    """Today's score for a stored rank."""
+    if rank <= RANK_FLOOR:
+        return 0.0
+    return 2 ** min(rank - _half_lives(now or timezone.now()), 1000)
+
+
+def score_threshold(score, now=None):
+    """Rank a contact needs now to have ``score``."""
+    if score <= 0:
+        return RANK_FLOOR
+    return math.log2(score) + _half_lives(now or timezone.now())
+
+
+_REBUILD_SQL = """
+    WITH events AS (
+        SELECT contact_id,
+               %(sent)s + (EXTRACT(EPOCH FROM COALESCE(sent_at, created_at)) - %(epoch)s) / %(half_life)s AS x
+        FROM {messages} WHERE direction = 'outbound' AND status IN ('sent', 'delivered', 'read') {tenant}
+        UNION ALL
+        SELECT contact_id, %(received)s + (EXTRACT(EPOCH FROM created_at) - %(epoch)s) / %(half_life)s
+        FROM {messages} WHERE direction = 'inbound' {tenant}
+        UNION ALL
+        SELECT contact_id, %(read)s + (EXTRACT(EPOCH FROM read_at) - %(epoch)s) / %(half_life)s
+        FROM {messages} WHERE read_at IS NOT NULL {tenant}
+    ),
+    peaks AS (
+        SELECT contact_id, MAX(x) AS peak FROM events WHERE contact_id IS NOT NULL GROUP BY contact_id
+    ),
+    ranks AS (
+        SELECT e.contact_id, p.peak + LN(SUM(POWER(2, GREATEST(e.x - p.peak, -{gap})))) / LN(2) AS rank
+        FROM events e JOIN peaks p ON p.contact_id = e.contact_id
+        GROUP BY e.contact_id, p.peak
+    )
+    UPDATE contacts AS c SET engagement_rank = COALESCE(r.rank, %(floor)s)
+    FROM contacts AS c2 LEFT JOIN ranks AS r ON r.contact_id = c2.id
+    WHERE c2.id = c.id {contacts_tenant}
+"""
+
+
+def rebuild_engagement_scores(tenant_id=None, using='default'):
+    """Recompute ranks from the messages table; returns the contacts written.
+
+    Events recorded while the rebuild runs may be lost; run it when the
+    half-life or weights change, not routinely.
+    """
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return 0
+    weights = settings.CONTACT_ENGAGEMENT_WEIGHTS
+    params = {
+        'sent': math.log2(weights['sent']),
+        'received': math.log2(weights['received']),
+        'read': math.log2(weights['read']),
+        'epoch': EPOCH.timestamp(),
+        'half_life': settings.CONTACT_ENGAGEMENT_HALF_LIFE_DAYS * 86400,
+        'floor': RANK_FLOOR,
+        'tenant_id': tenant_id,
+    }
+    sql = _REBUILD_SQL.format(
+        messages=Message._meta.db_table, gap=MAX_RANK_GAP,
+        tenant='AND tenant_id = %(tenant_id)s' if tenant_id else '',
+        contacts_tenant='AND c.tenant_id = %(tenant_id)s' if tenant_id else ''
+    )
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.rowcount
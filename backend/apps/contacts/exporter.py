@@ -0,0 +1,92 @@
+"""
+Streaming contact export.
+
+Rows are read through a server-side cursor (``QuerySet.iterator``) as
+plain tuples and encoded a chunk at a time, so memory stays flat however
+many contacts are exported. CSV tags are ``;`` separated so an export can
+be fed straight back into the importer.
+"""
+import csv
+import json
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+EXPORT_FIELDS = (
+    'id', 'phone_number', 'name', 'email', 'company', 'position', 'tags',
+    'metadata', 'is_blocked', 'is_subscribed', 'source', 'wa_id',
+    'messages_received', 'messages_sent', 'last_message_at', 'created_at',
+    'updated_at'
+)
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+class _Lines:
+    """File-like target that collects what ``csv.writer`` writes."""
+
+    def __init__(self):
+        self.parts = []
+
+    def write(self, value):
+        self.parts.append(value)
+
+    def drain(self):
+        data, self.parts = ''.join(self.parts), []
+        return data
+
+
+def _iter_rows(queryset, chunk_size):
+    return queryset.values_list(*EXPORT_FIELDS).iterator(chunk_size=chunk_size)
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, list):
+        return ';'.join(str(item) for item in value)
+    if isinstance(value, dict):
+        return json.dumps(value, cls=DjangoJSONEncoder) if value else ''
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+def iter_csv(queryset, chunk_size=None):
+    """Yield the queryset as CSV text, one chunk of rows per item."""
+    chunk_size = chunk_size or settings.CONTACT_EXPORT_CHUNK_SIZE
+    buffer = _Lines()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+    pending = 1
+    for row in _iter_rows(queryset, chunk_size):
+        writer.writerow([_csv_value(value) for value in row])
+        pending += 1
+        if pending >= chunk_size:
+            yield buffer.drain()
+            pending = 0
+    if pending:
+        yield buffer.drain()
+
+
+def iter_ndjson(queryset, chunk_size=None):
+    """Yield the queryset as newline-delimited JSON, one chunk per item."""
+    chunk_size = chunk_size or settings.CONTACT_EXPORT_CHUNK_SIZE
+    encode = DjangoJSONEncoder(separators=(',', ':')).encode
+    lines = []
+    for row in _iter_rows(queryset, chunk_size):
+        lines.append(encode(dict(zip(EXPORT_FIELDS, row))))
+        if len(lines) >= chunk_size:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def iter_export(queryset, export_format, chunk_size=None):
+    """Dispatch to the encoder for ``export_format``."""
+    if export_format == 'ndjson':
+        return iter_ndjson(queryset, chunk_size)
+    return iter_csv(queryset, chunk_size)
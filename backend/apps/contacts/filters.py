@@ -0,0 +1,35 @@
+"""
+Filters for the contacts app.
+"""
+import django_filters
+from django.db import connections
+from rest_framework.filters import SearchFilter
+from .models import Contact
+from .phones import tenant_country_code
+from .search import search_q
+from .tags import filter_tags
+
+
+class ContactFilter(django_filters.FilterSet):
+    """Filters shared by the contact list and export."""
+
+    tags = django_filters.CharFilter(method='filter_tags')
+
+    class Meta:
+        model = Contact
+        fields = ['is_blocked', 'is_subscribed', 'source', 'tags']
+
+    def filter_tags(self, queryset, name, value):
+        """Match contacts carrying the given tag."""
+        return filter_tags(queryset, [value])
+
+
+class ContactSearchFilter(SearchFilter):
+    """``?search=`` backed by the contact search index (see apps.contacts.search)."""
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '').strip()
+        if not query:
+            return queryset
+        country_code = tenant_country_code(request.user.tenant_id)
+        return queryset.filter(search_q(query, country_code, connections[queryset.db].vendor))
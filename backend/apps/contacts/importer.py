@@ -0,0 +1,355 @@
+"""
+Streaming contact import.
+
+Uploaded CSV/XLSX files are read row by row, mapped onto contact fields
+and normalised in batches. On PostgreSQL the rows are ``COPY``-ed into a temporary
+staging table in fixed-size batches and merged into ``contacts`` with a
+single ``INSERT ... ON CONFLICT DO UPDATE``, so memory stays constant
+whatever the file size. Other databases use batched ORM writes.
+
+``mapping`` maps contact fields to column headers in the file, e.g.
+``{"phone_number": "Phone", "name": "Full name", "city": "City"}``.
+``phone_number`` is required; ``name``, ``email``, ``company``,
+``position`` and ``tags`` (comma or semicolon separated) map onto the
+contact; any other key is stored in ``metadata``.
+
+``upsert_phone_numbers`` is the same merge for a plain list of numbers,
+used by the bulk contacts endpoint.
+"""
+import csv
+import io
+import itertools
+import json
+import logging
+import os
+import re
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from .models import Contact
+from .phones import normalize_many, tenant_country_code
+from .segments import contacts_changed
+from config.sql import insert_columns, insert_row
+
+logger = logging.getLogger(__name__)
+
+TEXT_FIELDS = ('name', 'email', 'company', 'position')
+
+STAGE_TABLE = 'contact_import_stage'
+
+STAGE_COLUMNS = ('row_no', 'phone_number') + TEXT_FIELDS + ('tags', 'metadata')
+
+BATCH_SIZE = 50000
+
+TAG_SPLIT_RE = re.compile(r'[,;]')
+
+# Set-union of two jsonb tag arrays, keeping first-seen order
+TAG_UNION_SQL = """(
+    SELECT COALESCE(jsonb_agg(tag ORDER BY first_pos), '[]'::jsonb)
+    FROM (
+        SELECT tag, MIN(pos) AS first_pos
+        FROM jsonb_array_elements({existing} || {new}) WITH ORDINALITY AS e(tag, pos)
+        GROUP BY tag
+    ) merged_tags
+)"""
+
+
+class ContactImportError(Exception):
+    """Raised when an import file cannot be read."""
+
+
+def split_tags(value):
+    """Split a comma or semicolon separated tag cell."""
+    if not value:
+        return []
+    return [tag.strip() for tag in TAG_SPLIT_RE.split(str(value)) if tag.strip()]
+
+
+def iter_file_rows(fileobj, filename):
+    """Yield one ``{header: value}`` dict per data row of a CSV or XLSX file."""
+    extension = os.path.splitext(filename)[1].lower()
+    if extension == '.csv':
+        text = io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='')
+        yield from csv.DictReader(text)
+    elif extension == '.xlsx':
+        try:
+            from openpyxl import load_workbook
+        except ImportError:
+            raise ContactImportError('XLSX import requires openpyxl')
+        workbook = load_workbook(fileobj, read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            headers = [str(cell).strip() if cell is not None else '' for cell in next(rows, ())]
+            for values in rows:
+                yield {
+                    header: value for header, value in zip(headers, values)
+                    if header and value is not None
+                }
+        finally:
+            workbook.close()
+    else:
+        raise ContactImportError(f"Unsupported import file type: {extension or filename}")
+
+
+def _json_value(value):
+    if isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
+
+
+def map_rows(rows, mapping, extra_tags=(), country_code='', chunk_size=10000):
+    """Apply ``mapping`` and normalisation; yields dicts or None for skipped rows."""
+    metadata_columns = {
+        field: column for field, column in mapping.items()
+        if field not in TEXT_FIELDS + ('phone_number', 'tags')
+    }
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, chunk_size))
+        if not chunk:
+            return
+        phones = normalize_many([row.get(mapping['phone_number']) for row in chunk], country_code)
+        for row, phone in zip(chunk, phones):
+            if phone is None:
+                yield None
+                continue
+            contact = {'phone_number': phone}
+            for field in TEXT_FIELDS:
+                column = mapping.get(field)
+                contact[field] = str(row.get(column) or '').strip() if column else ''
+            tags = split_tags(row.get(mapping['tags'])) if mapping.get('tags') else []
+            contact['tags'] = list(dict.fromkeys(tags + list(extra_tags)))
+            contact['metadata'] = {
+                field: _json_value(row.get(column)) for field, column in metadata_columns.items()
+                if row.get(column) not in (None, '')
+            }
+            yield contact
+
+
+class ContactImporter:
+    """Imports mapped contact rows for one tenant."""
+
+    def __init__(self, tenant_id, batch_size=BATCH_SIZE, progress=None):
+        self.tenant_id = tenant_id
+        self.batch_size = batch_size
+        self.progress = progress
+        self.stats = {'total': 0, 'skipped': 0, 'created': 0, 'updated': 0}
+
+    def run(self, contacts):
+        """Import an iterable of mapped rows (None for skipped rows)."""
+        with transaction.atomic():
+            if connection.vendor == 'postgresql':
+                self._run_postgresql(contacts)
+            else:
+                self._run_portable(contacts)
+            contacts_changed(self.tenant_id)
+        return self.stats
+
+    def _batches(self, contacts):
+        batch = []
+        for contact in contacts:
+            self.stats['total'] += 1
+            if contact is None:
+                self.stats['skipped'] += 1
+                continue
+            batch.append(contact)
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def _report(self, phase):
+        if self.progress:
+            self.progress(phase, dict(self.stats))
+
+    def _run_postgresql(self, contacts):
+        with connection.cursor() as cursor:
+            cursor.execute(f"""
+                CREATE TEMPORARY TABLE {STAGE_TABLE} (
+                    row_no bigint, phone_number text,
+                    name text, email text, company text, position text,
+                    tags jsonb, metadata jsonb
+                ) ON COMMIT DROP
+            """)
+            row_no = 0
+            for batch in self._batches(contacts):
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                for contact in batch:
+                    row_no += 1
+                    writer.writerow(
+                        [row_no, contact['phone_number']]
+                        + [contact[field] for field in TEXT_FIELDS]
+                        + [json.dumps(contact['tags']), json.dumps(contact['metadata'])]
+                    )
+                buffer.seek(0)
+                self._copy(cursor, buffer)
+                self._report('staging')
+
+            self._report('merging')
+            cursor.execute(*self._merge_sql())
+            created, merged = cursor.fetchone()
+            self.stats['created'] = created
+            self.stats['updated'] = merged - created
+            cursor.execute(f"DROP TABLE {STAGE_TABLE}")
+
+    def _copy(self, cursor, buffer):
+        sql = (
+            f"COPY {STAGE_TABLE} ({', '.join(STAGE_COLUMNS)}) FROM STDIN "
+            f"WITH (FORMAT csv, FORCE_NOT_NULL ({', '.join(TEXT_FIELDS)}))"
+        )
+        raw = cursor.cursor
+        if hasattr(raw, 'copy_expert'):
+            raw.copy_expert(sql, buffer)
+        else:
+            with raw.copy(sql) as copy:
+                copy.write(buffer.getvalue())
+
+    def _merge_sql(self):
+        """One upsert from the staging table; the last row wins per phone."""
+        table = Contact._meta.db_table
+        template = Contact(tenant_id=self.tenant_id, source='import')
+        overrides = {'id': 'gen_random_uuid()'}
+        for field in ('phone_number',) + TEXT_FIELDS + ('tags', 'metadata'):
+            overrides[field] = f'staged.{field}'
+        _, columns = insert_columns(Contact)
+        row, params = insert_row(Contact, template, overrides=overrides)
+
+        quote = connection.ops.quote_name
+        keep_existing = ',\n'.join(
+            f"{quote(field)} = CASE WHEN EXCLUDED.{quote(field)} <> '' "
+            f"THEN EXCLUDED.{quote(field)} ELSE {table}.{quote(field)} END"
+            for field in TEXT_FIELDS
+        )
+        sql = f"""
+            WITH merged AS (
+                INSERT INTO {table} ({columns})
+                SELECT {row}
+                FROM (
+                    SELECT DISTINCT ON (phone_number) *
+                    FROM {STAGE_TABLE}
+                    ORDER BY phone_number, row_no DESC
+                ) staged
+                ON CONFLICT (tenant_id, phone_number) DO UPDATE SET
+                    {keep_existing},
+                    tags = CASE WHEN EXCLUDED.tags <@ {table}.tags THEN {table}.tags
+                        ELSE {TAG_UNION_SQL.format(existing=f'{table}.tags', new='EXCLUDED.tags')} END,
+                    metadata = {table}.metadata || EXCLUDED.metadata,
+                    updated_at = EXCLUDED.updated_at
+                RETURNING (xmax = 0) AS created
+            )
+            SELECT COUNT(*) FILTER (WHERE created), COUNT(*) FROM merged
+        """
+        return sql, params
+
+    def _run_portable(self, contacts):
+        for batch in self._batches(contacts):
+            by_phone = {contact['phone_number']: contact for contact in batch}
+            existing = {
+                contact.phone_number: contact
+                for contact in Contact.objects.filter(
+                    Q(tenant_id=self.tenant_id) & Q(phone_number__in=list(by_phone))
+                )
+            }
+            now = timezone.now()
+            to_create = []
+            for phone, row in by_phone.items():
+                contact = existing.get(phone)
+                if contact is None:
+                    to_create.append(Contact(tenant_id=self.tenant_id, source='import', **row))
+                    continue
+                for field in TEXT_FIELDS:
+                    if row[field]:
+                        setattr(contact, field, row[field])
+                contact.tags = list(dict.fromkeys(contact.tags + row['tags']))
+                contact.metadata = {**contact.metadata, **row['metadata']}
+                contact.updated_at = now
+            Contact.objects.bulk_create(to_create)
+            Contact.objects.bulk_update(
+                list(existing.values()), list(TEXT_FIELDS) + ['tags', 'metadata', 'updated_at']
+            )
+            self.stats['created'] += len(to_create)
+            self.stats['updated'] += len(existing)
+            self._report('merging')
+
+
+def upsert_phone_numbers(tenant_id, phone_numbers, tags=(), metadata=None):
+    """Create missing contacts and add ``tags`` to all of them.
+
+    Returns ``{'created', 'existing', 'invalid'}``. On PostgreSQL this is
+    one ``INSERT ... ON CONFLICT DO UPDATE`` whatever the list size.
+    """
+    normalized = normalize_many(phone_numbers, tenant_country_code(tenant_id))
+    invalid = normalized.count(None)
+    phones = list(dict.fromkeys(normalized))
+    if invalid:
+        phones.remove(None)
+    tags = list(dict.fromkeys(tags))
+    template = Contact(tenant_id=tenant_id, source='import', tags=tags, metadata=metadata or {})
+
+    if connection.vendor == 'postgresql':
+        created = _upsert_phone_numbers_postgresql(template, phones)
+    else:
+        created = _upsert_phone_numbers_portable(template, phones)
+    contacts_changed(tenant_id)
+    return {'created': created, 'existing': len(phones) - created, 'invalid': invalid}
+
+
+def _upsert_phone_numbers_postgresql(template, phones):
+    table = Contact._meta.db_table
+    _, columns = insert_columns(Contact)
+    row, params = insert_row(Contact, template, overrides={
+        'id': 'gen_random_uuid()',
+        'phone_number': 'staged.phone_number',
+    })
+    # Existing contacts that already carry every tag are left untouched
+    sql = f"""
+        WITH merged AS (
+            INSERT INTO {table} ({columns})
+            SELECT {row}
+            FROM unnest(%s::text[]) AS staged(phone_number)
+            ON CONFLICT (tenant_id, phone_number) DO UPDATE SET
+                tags = {TAG_UNION_SQL.format(existing=f'{table}.tags', new='EXCLUDED.tags')},
+                updated_at = EXCLUDED.updated_at
+            WHERE NOT (EXCLUDED.tags <@ {table}.tags)
+            RETURNING (xmax = 0) AS created
+        )
+        SELECT COUNT(*) FILTER (WHERE created) FROM merged
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params + [phones])
+        return cursor.fetchone()[0]
+
+
+def _upsert_phone_numbers_portable(template, phones, chunk_size=1000):
+    created = 0
+    now = timezone.now()
+    with transaction.atomic():
+        for start in range(0, len(phones), chunk_size):
+            chunk = phones[start:start + chunk_size]
+            existing = {
+                contact.phone_number: contact
+                for contact in Contact.objects.filter(
+                    tenant_id=template.tenant_id, phone_number__in=chunk
+                )
+            }
+            new_contacts = [
+                Contact(
+                    tenant_id=template.tenant_id, phone_number=phone, source=template.source,
+                    tags=list(template.tags), metadata=dict(template.metadata)
+                )
+                for phone in chunk if phone not in existing
+            ]
+            Contact.objects.bulk_create(new_contacts)
+            created += len(new_contacts)
+
+            changed = []
+            for contact in existing.values():
+                merged = list(dict.fromkeys(contact.tags + template.tags))
+                if merged != contact.tags:
+                    contact.tags = merged
+                    contact.updated_at = now
+                    changed.append(contact)
+            Contact.objects.bulk_update(changed, ['tags', 'updated_at'])
+    return created
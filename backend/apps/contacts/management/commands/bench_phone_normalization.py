@@ -0,0 +1,44 @@
+"""
+Management command that benchmarks batch phone number normalisation.
+"""
+import random
+import time
+from django.core.management.base import BaseCommand
+from apps.contacts.phones import normalize_many
+
+FORMATS = {
+    'e164': lambda r: f"+{r.randint(1, 99)}{r.randint(10 ** 8, 10 ** 10 - 1)}",
+    'formatted': lambda r: f"+1 ({r.randint(200, 999)}) {r.randint(200, 999)}-{r.randint(0, 9999):04d}",
+    'national': lambda r: f"0{r.randint(7000, 7999)} {r.randint(100000, 999999)}",
+    'bare': lambda r: f"{r.randint(7000000000, 7999999999)}",
+}
+
+
+class Command(BaseCommand):
+    help = 'Measure phone normalisation throughput on synthetic batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=1000000, help='Numbers per batch.')
+        parser.add_argument('--country-code', default='44', help='Default country code to apply.')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per format; the best is reported.')
+
+    def handle(self, *args, **options):
+        rng = random.Random(42)
+        count = options['count']
+        for name, make in list(FORMATS.items()) + [('mixed', None)]:
+            if make is None:
+                makers = list(FORMATS.values())
+                numbers = [rng.choice(makers)(rng) for _ in range(count)]
+            else:
+                numbers = [make(rng) for _ in range(count)]
+            best = None
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                normalized = normalize_many(numbers, options['country_code'])
+                elapsed = time.perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+            invalid = normalized.count(None)
+            self.stdout.write(
+                f"{name:<10} {count / best / 1e6:6.2f}M numbers/s "
+                f"({best * 1000:.0f} ms per {count:,}, {invalid:,} invalid)"
+            )
@@ -0,0 +1,21 @@
+"""
+Management command that merges duplicate contacts.
+"""
+from django.core.management.base import BaseCommand
+from apps.contacts.dedup import run_dedup
+
+
+class Command(BaseCommand):
+    help = 'Merge contacts whose phone numbers normalise to the same number.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help='Scan every contact, not only those changed since the last run.')
+        parser.add_argument('--tenant', help='Only scan this tenant.')
+
+    def handle(self, *args, **options):
+        stats = run_dedup(full=options['full'], tenant_id=options['tenant'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Merged {stats['merged']} duplicates and normalised {stats['normalized']} "
+            f"numbers across {stats['tenants']} tenants."
+        ))
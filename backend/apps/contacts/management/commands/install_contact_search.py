@@ -0,0 +1,20 @@
+"""
+Management command that adds the contact search column and indexes.
+"""
+from django.core.management.base import BaseCommand
+from apps.contacts.search import add_search_column, install_search_indexes
+
+
+class Command(BaseCommand):
+    help = (
+        'Add the generated search column to contacts, then build the search indexes. '
+        'Adding the column rewrites the table under an exclusive lock.'
+    )
+
+    def handle(self, *args, **options):
+        added = add_search_column()
+        install_search_indexes()
+        if added:
+            self.stdout.write(self.style.SUCCESS('Added the search column and indexes.'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Search column already present; indexes checked.'))
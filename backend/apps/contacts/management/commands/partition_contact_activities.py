@@ -0,0 +1,20 @@
+"""
+Management command that converts a live contact_activities table to monthly partitions.
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from config.partitions import partition_table
+from apps.contacts.models import ContactActivity
+
+
+class Command(BaseCommand):
+    help = (
+        'Partition the contact_activities table by month. Indexes are built concurrently first; '
+        'only the final swap takes an exclusive lock, and can be retried if it times out.'
+    )
+
+    def handle(self, *args, **options):
+        if partition_table(ContactActivity, 'created_at', settings.CONTACT_ACTIVITY_PARTITIONS_AHEAD):
+            self.stdout.write(self.style.SUCCESS('Converted contact_activities to monthly partitions.'))
+        else:
+            self.stdout.write(self.style.SUCCESS('contact_activities is already partitioned.'))
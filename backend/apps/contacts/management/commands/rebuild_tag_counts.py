@@ -0,0 +1,17 @@
+"""
+Management command that recomputes per-tag contact counts.
+"""
+from django.core.management.base import BaseCommand
+from apps.contacts.tags import install_tag_index, rebuild_tag_counts
+
+
+class Command(BaseCommand):
+    help = 'Install the tag index and triggers, then recompute tag counts from contacts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tenant', help='Only rebuild this tenant.')
+
+    def handle(self, *args, **options):
+        install_tag_index()
+        written = rebuild_tag_counts(options['tenant'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {written} tag counts.'))
@@ -4,6 +4,7 @@ Contact models for CRM functionality.
 import uuid
 from django.db import models
 from django.utils import timezone
+from .engagement import RANK_FLOOR, current_score
 
 
 class Contact(models.Model):
@@ -47,6 +48,8 @@ class Contact(models.Model):
     messages_received = models.IntegerField(default=0)
     messages_sent = models.IntegerField(default=0)
     last_message_at = models.DateTimeField(null=True, blank=True)
+    # Recency-decayed engagement as a log2 rank (apps.contacts.engagement)
+    engagement_rank = models.FloatField(default=RANK_FLOOR)
     
     # Timestamps
     created_at = models.DateTimeField(default=timezone.now)
@@ -57,9 +60,16 @@ class Contact(models.Model):
         indexes = [
             models.Index(fields=['tenant_id']),
             models.Index(fields=['phone_number']),
-            models.Index(fields=['tags']),
             models.Index(fields=['is_blocked']),
             models.Index(fields=['created_at']),
+            models.Index(fields=['tenant_id', 'last_message_at']),
+            # Keyset pagination keys (config.pagination)
+            models.Index(fields=['tenant_id', 'created_at', 'id']),
+            models.Index(fields=['tenant_id', 'name', 'id']),
+            # Most engaged first, and top-N engagement segments
+            models.Index(fields=['tenant_id', 'engagement_rank', 'id']),
+            # Incremental scans (apps.contacts.dedup)
+            models.Index(fields=['updated_at']),
         ]
         unique_together = [['tenant_id', 'phone_number']]
     
@@ -75,8 +85,8 @@ class Contact(models.Model):
     
     @property
     def engagement_score(self):
-        """Calculate a simple engagement score."""
-        return self.messages_received + self.messages_sent
+        """Return the current recency-decayed engagement score."""
+        return round(current_score(self.engagement_rank), 2)
 
 
 class Tag(models.Model):
@@ -104,8 +114,31 @@ class Tag(models.Model):
         return self.name
 
 
+class TagCount(models.Model):
+    """Number of contacts carrying each tag, per tenant.
+    
+    Maintained by database triggers on PostgreSQL (see apps.contacts.tags).
+    """
+    
+    tenant_id = models.UUIDField()
+    # Free text: contact tags are not limited to the Tag catalogue
+    name = models.TextField()
+    contacts_count = models.BigIntegerField(default=0)
+    
+    class Meta:
+        db_table = 'contact_tag_counts'
+        unique_together = [['tenant_id', 'name']]
+    
+    def __str__(self):
+        return f"{self.name}: {self.contacts_count}"
+
+
 class ContactActivity(models.Model):
-    """Model for tracking contact activities."""
+    """Model for tracking contact activities.
+    
+    Partitioned by month of ``created_at`` on PostgreSQL (see
+    config.partitions); old months are archived and dropped.
+    """
     
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     contact = models.ForeignKey(
@@ -123,6 +156,8 @@ class ContactActivity(models.Model):
         ('unblocked', 'Unblocked'),
         ('imported', 'Imported'),
         ('exported', 'Exported'),
+        ('merged', 'Merged'),
+        ('bulk_updated', 'Bulk Updated'),
     ]
     activity_type = models.CharField(max_length=30, choices=ACTIVITY_TYPES)
     
@@ -139,7 +174,8 @@ class ContactActivity(models.Model):
     class Meta:
         db_table = 'contact_activities'
         indexes = [
-            models.Index(fields=['contact']),
+            # Newest activities of a contact, within each partition
+            models.Index(fields=['contact', '-created_at']),
             models.Index(fields=['activity_type']),
             models.Index(fields=['created_at']),
         ]
@@ -149,6 +185,36 @@ class ContactActivity(models.Model):
         return f"{self.activity_type} - {self.contact.display_name}"
 
 
+class ContactBulkUpdate(models.Model):
+    """A bulk change to a tenant's contacts (apps.contacts.bulk).
+    
+    Logged once per change rather than per contact, with the selection it
+    was applied to: a segment filter or an ID list.
+    """
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    tenant_id = models.UUIDField()
+    
+    # {"contact_filter": {...}} or {"ids": [...]}
+    selection = models.JSONField(default=dict, blank=True)
+    changes = models.JSONField(default=dict, blank=True)
+    description = models.TextField(blank=True)
+    contact_count = models.IntegerField(default=0)
+    
+    performed_by = models.UUIDField(null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        db_table = 'contact_bulk_updates'
+        indexes = [
+            models.Index(fields=['tenant_id', '-created_at']),
+        ]
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return self.description
+
+
 class ContactNote(models.Model):
     """Model for contact notes."""
     
@@ -0,0 +1,156 @@
+"""
+Contact search.
+
+On PostgreSQL, contacts carry a ``search_vector`` tsvector column generated
+from name, email and company (``GENERATED ALWAYS ... STORED``, so every
+write path keeps it current, raw SQL imports included) with a GIN index.
+Each word of the query is matched as a word prefix, so "jo smi" finds
+"John Smith" and "acme" finds "sales@acme.com".
+
+Queries that look like phone numbers become prefix matches on the stored
+E.164 numbers, served by a ``varchar_pattern_ops`` index. National input
+is also tried with the tenant's default country code.
+
+Adding the generated column rewrites the whole table under an exclusive
+lock, so ``migrate`` only adds it while the table is empty; an existing
+table gets it from the ``install_contact_search`` command, run in a
+maintenance window.
+
+Other databases (development SQLite) fall back to ``icontains`` lookups.
+"""
+import logging
+import re
+from django.db import connections
+from django.db.models import BooleanField, Expression, Q
+from config.indexes import concurrently, index_is_valid
+from .models import Contact
+
+logger = logging.getLogger(__name__)
+
+SEARCH_COLUMN = 'search_vector'
+
+SEARCH_INDEX = 'contacts_search_gin'
+
+PHONE_PREFIX_INDEX = 'contacts_phone_prefix'
+
+# Emails are split at "@" and "." so domains and local parts match too
+SEARCH_VECTOR_SQL = (
+    "to_tsvector('simple'::regconfig, "
+    "name || ' ' || translate(email, '@.', '  ') || ' ' || company)"
+)
+
+TEXT_FIELDS = ('name', 'email', 'company', 'phone_number')
+
+MIN_PHONE_DIGITS = 3
+
+_PHONE_QUERY_RE = re.compile(r'^[\d\s+\-().]+$')
+
+_WORD_RE = re.compile(r'[^\W_]+')
+
+
+def phone_prefixes(query, country_code=''):
+    """Return the E.164 prefixes a phone-like query may stand for."""
+    query = query.strip()
+    digits = re.sub(r'\D', '', query)
+    if query.startswith('+'):
+        return ['+' + digits]
+    if query.startswith('00'):
+        return ['+' + digits[2:]]
+    prefixes = ['+' + digits]
+    if country_code:
+        national = digits[1:] if digits.startswith('0') else digits
+        prefixes.append(f'+{country_code}{national}')
+    return prefixes
+
+
+class SearchMatch(Expression):
+    """``search_vector @@ to_tsquery(...)`` on the query's contacts alias."""
+
+    output_field = BooleanField()
+
+    def __init__(self, tsquery):
+        super().__init__()
+        self.tsquery = tsquery
+
+    def as_sql(self, compiler, connection):
+        # The base alias is "contacts" at the top level and e.g. U0 in a subquery
+        alias = compiler.quote_name_unless_alias(compiler.query.get_initial_alias())
+        column = connection.ops.quote_name(SEARCH_COLUMN)
+        return f"{alias}.{column} @@ to_tsquery('simple'::regconfig, %s)", [self.tsquery]
+
+
+def search_q(query, country_code='', vendor=None):
+    """Return a Q matching contacts for a search box query."""
+    vendor = vendor or connections['default'].vendor
+    if _PHONE_QUERY_RE.match(query) and len(re.sub(r'\D', '', query)) >= MIN_PHONE_DIGITS:
+        q = Q()
+        for prefix in phone_prefixes(query, country_code):
+            q |= Q(phone_number__startswith=prefix)
+        return q
+    words = _WORD_RE.findall(query.lower())
+    if not words:
+        return Q()
+    if vendor == 'postgresql':
+        tsquery = ' & '.join(f"'{word}':*" for word in words)
+        return Q(SearchMatch(tsquery))
+    q = Q()
+    for word in words:
+        term = Q()
+        for field in TEXT_FIELDS:
+            term |= Q(**{f'{field}__icontains': word})
+        q &= term
+    return q
+
+
+def has_search_column(connection):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_attribute WHERE attrelid = to_regclass(%s) AND attname = %s "
+            "AND NOT attisdropped", [Contact._meta.db_table, SEARCH_COLUMN]
+        )
+        return cursor.fetchone() is not None
+
+
+def add_search_column(using='default'):
+    """Add the generated search column (rewrites the table; PostgreSQL only)."""
+    connection = connections[using]
+    if connection.vendor != 'postgresql' or has_search_column(connection):
+        return False
+    table = connection.ops.quote_name(Contact._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {SEARCH_COLUMN} tsvector '
+            f'GENERATED ALWAYS AS ({SEARCH_VECTOR_SQL}) STORED'
+        )
+    return True
+
+
+def install_search_indexes(using='default'):
+    """Add the search indexes on PostgreSQL (idempotent).
+
+    The search column is only added here while the table is empty; see
+    ``add_search_column`` for existing tables.
+    """
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return
+    table = connection.ops.quote_name(Contact._meta.db_table)
+    if not has_search_column(connection):
+        if Contact.objects.using(using).exists():
+            logger.warning(
+                'contacts has no search column yet; run manage.py install_contact_search '
+                'in a maintenance window'
+            )
+        else:
+            add_search_column(using)
+    with connection.cursor() as cursor:
+        if has_search_column(connection) and not index_is_valid(connection, SEARCH_INDEX):
+            cursor.execute(
+                f'CREATE INDEX {concurrently(connection)} {SEARCH_INDEX} '
+                f'ON {table} USING gin ({SEARCH_COLUMN})'
+            )
+        if not index_is_valid(connection, PHONE_PREFIX_INDEX):
+            cursor.execute(
+                f'CREATE INDEX {concurrently(connection)} {PHONE_PREFIX_INDEX} '
+                f'ON {table} (tenant_id, phone_number varchar_pattern_ops)'
+            )
@@ -0,0 +1,320 @@
+"""
+Contact segments.
+
+A segment is a JSON filter (``Campaign.contact_filter``) compiled into a
+single ``Q`` over the contacts table. Groups nest conditions::
+
+    {"all": [...]}   every condition matches
+    {"any": [...]}   at least one condition matches
+    {"not": {...}}   the condition does not match
+
+and leaves name a field, an operator and a value::
+
+    {"field": "tags", "op": "any", "value": ["vip", "lead"]}
+    {"field": "metadata.plan", "op": "eq", "value": "pro"}
+    {"field": "last_message_at", "op": "within_days", "value": 30}
+    {"field": "activity", "op": "within_days", "value": 7, "activity_type": "message_received"}
+    {"field": "engagement", "op": "gte", "value": 5}
+    {"field": "engagement", "op": "top", "value": 100}
+    {"field": "is_subscribed", "op": "eq", "value": true}
+
+Audience counts are cached in Redis per tenant and filter hash, stamped
+with the tenant's contact version counters. Any contact change bumps the
+``contacts`` counter. Message traffic bumps only ``contact_engagement``,
+so counts for filters that ignore engagement survive busy inboxes.
+Engagement conditions compare the stored rank (apps.contacts.engagement),
+and ``top`` selects the tenant's N most engaged contacts, both through
+the ``(tenant_id, engagement_rank, id)`` index.
+Relative-date conditions also expire with ``SEGMENT_COUNT_CACHE_SECONDS``.
+"""
+import hashlib
+import json
+import logging
+import re
+from datetime import timedelta
+import redis
+from django.conf import settings
+from django.db import connections
+from django.db.models import Exists, F, OuterRef, Q
+from django.db.models.lookups import (
+    Exact, GreaterThan, GreaterThanOrEqual, LessThan, LessThanOrEqual
+)
+from django.utils import timezone
+from config.indexes import concurrently, index_is_valid
+from config.redis_client import get_redis
+from apps.tenants.versions import bump_on_commit, get_versions
+from .engagement import score_threshold
+from .models import Contact, ContactActivity
+from .tags import tags_q
+
+logger = logging.getLogger(__name__)
+
+VERSION_RESOURCE = 'contacts'
+
+ENGAGEMENT_RESOURCE = 'contact_engagement'
+
+CACHE_PREFIX = 'segment_count:'
+
+METADATA_INDEX = 'contacts_metadata_gin'
+
+MAX_CONDITIONS = 50
+
+MAX_TOP = 100000
+
+_METADATA_KEY_RE = re.compile(r'^[A-Za-z0-9_\-]+$')
+
+_NUMERIC_LOOKUPS = {
+    'eq': Exact,
+    'gt': GreaterThan,
+    'gte': GreaterThanOrEqual,
+    'lt': LessThan,
+    'lte': LessThanOrEqual,
+}
+
+_STATE_FIELDS = ('is_subscribed', 'is_blocked')
+
+_DATE_FIELDS = ('last_message_at', 'created_at')
+
+_COUNTER_FIELDS = ('messages_received', 'messages_sent')
+
+
+class SegmentError(ValueError):
+    """Raised for a contact filter that cannot be compiled."""
+
+
+class _Compiler:
+
+    def __init__(self, vendor, tenant_id=None):
+        self.vendor = vendor
+        self.tenant_id = tenant_id
+        self.now = timezone.now()
+        self.conditions = 0
+        self.engagement = False
+
+    def node(self, spec):
+        if not isinstance(spec, dict):
+            raise SegmentError('Each condition must be an object.')
+        self.conditions += 1
+        if self.conditions > MAX_CONDITIONS:
+            raise SegmentError(f'A filter may have at most {MAX_CONDITIONS} conditions.')
+        groups = [key for key in ('all', 'any', 'not') if key in spec]
+        if groups:
+            if len(spec) != 1:
+                raise SegmentError('A group must have exactly one of all, any or not.')
+            return self.group(groups[0], spec[groups[0]])
+        return self.leaf(spec)
+
+    def group(self, kind, value):
+        if kind == 'not':
+            return ~self.node(value)
+        if not isinstance(value, list) or not value:
+            raise SegmentError(f'"{kind}" needs a non-empty list of conditions.')
+        combined = None
+        for child in value:
+            q = self.node(child)
+            if combined is None:
+                combined = q
+            else:
+                combined = combined & q if kind == 'all' else combined | q
+        return combined
+
+    def leaf(self, spec):
+        field, op, value = spec.get('field'), spec.get('op', 'eq'), spec.get('value')
+        if not isinstance(field, str):
+            raise SegmentError('A condition needs a "field".')
+        if field == 'tags':
+            return self.tags(op, value)
+        if field.startswith('metadata.'):
+            return self.metadata(field[len('metadata.'):], op, value)
+        if field in _STATE_FIELDS:
+            if op != 'eq' or not isinstance(value, bool):
+                raise SegmentError(f'{field} supports eq with true or false.')
+            return Q(**{field: value})
+        if field == 'source':
+            return self.choice(op, value)
+        if field in _DATE_FIELDS:
+            if field == 'last_message_at':
+                self.engagement = True
+            return self.date(field, op, value)
+        if field == 'activity':
+            self.engagement = True
+            return self.activity(op, value, spec.get('activity_type'))
+        if field == 'engagement':
+            self.engagement = True
+            return self.engagement_score(op, value)
+        if field in _COUNTER_FIELDS:
+            self.engagement = True
+            return self.number(F(field), op, value, field)
+        raise SegmentError(f'Unknown field: {field}')
+
+    def tags(self, op, value):
+        if op not in ('any', 'all', 'none'):
+            raise SegmentError('tags supports any, all and none.')
+        if not isinstance(value, list) or not value:
+            raise SegmentError('tags needs a non-empty list of tags.')
+        q = tags_q(value, match_all=(op == 'all'), vendor=self.vendor)
+        return ~q if op == 'none' else q
+
+    def metadata(self, key, op, value):
+        if not _METADATA_KEY_RE.match(key) or '__' in key:
+            raise SegmentError(f'Invalid metadata key: {key}')
+        path = f'metadata__{key}'
+        if op == 'exists':
+            # ? is served by the metadata GIN index too
+            q = Q(metadata__has_key=key)
+            return q if value is not False else ~q
+        if op in ('eq', 'ne'):
+            if self.vendor == 'postgresql':
+                # @> is served by the metadata GIN index
+                q = Q(metadata__contains={key: value})
+            else:
+                q = Q(**{path: value})
+            return q if op == 'eq' else ~q
+        if op == 'in':
+            if not isinstance(value, list) or not value:
+                raise SegmentError('in needs a non-empty list.')
+            return Q(**{f'{path}__in': value})
+        if op in ('gt', 'gte', 'lt', 'lte'):
+            return Q(**{f'{path}__{op}': value})
+        raise SegmentError(f'Unsupported metadata operator: {op}')
+
+    def choice(self, op, value):
+        if op == 'eq':
+            return Q(source=value)
+        if op == 'in' and isinstance(value, list):
+            return Q(source__in=value)
+        raise SegmentError('source supports eq and in.')
+
+    def days(self, value):
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0:
+            raise SegmentError('Day counts must be non-negative numbers.')
+        return self.now - timedelta(days=value)
+
+    def date(self, field, op, value):
+        if op == 'within_days':
+            return Q(**{f'{field}__gte': self.days(value)})
+        if op == 'older_than_days':
+            return Q(**{f'{field}__lt': self.days(value)})
+        if op == 'exists':
+            return Q(**{f'{field}__isnull': value is False})
+        raise SegmentError(f'{field} supports within_days, older_than_days and exists.')
+
+    def activity(self, op, value, activity_type):
+        if op != 'within_days':
+            raise SegmentError('activity supports within_days.')
+        activities = ContactActivity.objects.filter(
+            contact=OuterRef('pk'), created_at__gte=self.days(value)
+        )
+        if activity_type:
+            activities = activities.filter(activity_type=activity_type)
+        return Q(Exists(activities))
+
+    def engagement_score(self, op, value):
+        if op == 'top':
+            if isinstance(value, bool) or not isinstance(value, int) or not 0 < value <= MAX_TOP:
+                raise SegmentError(f'engagement top needs a count from 1 to {MAX_TOP}.')
+            top = Contact.objects.filter(tenant_id=self.tenant_id).order_by('-engagement_rank', '-id')
+            return Q(id__in=top.values('id')[:value])
+        if op not in ('gt', 'gte', 'lt', 'lte'):
+            raise SegmentError('engagement supports gt, gte, lt, lte and top.')
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise SegmentError('engagement needs a number.')
+        # Scores decay with time, so the threshold is the rank needed now
+        return self.number(F('engagement_rank'), op, score_threshold(value, self.now), 'engagement')
+
+    def number(self, expression, op, value, field):
+        lookup = _NUMERIC_LOOKUPS.get(op)
+        if lookup is None:
+            raise SegmentError(f'{field} supports eq, gt, gte, lt and lte.')
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise SegmentError(f'{field} needs a number.')
+        return Q(lookup(expression, value))
+
+
+def compile_filter(contact_filter, vendor=None, tenant_id=None):
+    """Compile a contact filter into ``(Q, resources)``.
+
+    ``resources`` are the version counters the result depends on.
+    """
+    compiler = _Compiler(vendor or connections['default'].vendor, tenant_id)
+    q = compiler.node(contact_filter) if contact_filter else Q()
+    resources = [VERSION_RESOURCE]
+    if compiler.engagement:
+        resources.append(ENGAGEMENT_RESOURCE)
+    return q, resources
+
+
+def segment_queryset(tenant_id, contact_filter=None, target_tags=None, reachable_only=True):
+    """Return the contacts a filter (and optional campaign tags) selects."""
+    q, _ = compile_filter(contact_filter, tenant_id=tenant_id)
+    queryset = Contact.objects.filter(tenant_id=tenant_id)
+    if reachable_only:
+        queryset = queryset.filter(is_blocked=False, is_subscribed=True)
+    if target_tags:
+        queryset = queryset.filter(tags_q(target_tags))
+    return queryset.filter(q)
+
+
+def filter_hash(contact_filter=None, target_tags=None, reachable_only=True):
+    """Stable hash of a segment definition."""
+    canonical = json.dumps(
+        [contact_filter or {}, sorted(target_tags or []), reachable_only],
+        sort_keys=True, separators=(',', ':')
+    )
+    return hashlib.sha1(canonical.encode()).hexdigest()
+
+
+def audience_count(tenant_id, contact_filter=None, target_tags=None, reachable_only=True):
+    """Count a segment, served from cache while the tenant's contacts are unchanged."""
+    _, resources = compile_filter(contact_filter)
+    queryset = segment_queryset(tenant_id, contact_filter, target_tags, reachable_only)
+    key = f"{CACHE_PREFIX}{tenant_id}:{filter_hash(contact_filter, target_tags, reachable_only)}"
+    # Read the versions before counting: a change committed mid-count bumps
+    # them again, so a stale count is never stored under a current version
+    versions = get_versions(tenant_id, resources)
+    if versions is not None:
+        try:
+            cached = get_redis().get(key)
+        except redis.exceptions.RedisError:
+            cached = None
+        if cached:
+            entry = json.loads(cached)
+            if entry['versions'] == versions:
+                return entry['count']
+    count = queryset.count()
+    if versions is not None:
+        try:
+            get_redis().set(
+                key, json.dumps({'versions': versions, 'count': count}),
+                ex=settings.SEGMENT_COUNT_CACHE_SECONDS
+            )
+        except redis.exceptions.RedisError as e:
+            logger.warning(f"Could not cache audience count: {e}")
+    return count
+
+
+def contacts_changed(tenant_id, engagement_only=False):
+    """Invalidate a tenant's cached audience counts once the transaction commits."""
+    bump_on_commit(tenant_id, ENGAGEMENT_RESOURCE if engagement_only else VERSION_RESOURCE)
+
+
+def install_segment_indexes(using='default'):
+    """Create the metadata GIN index on PostgreSQL (idempotent).
+
+    The default ``jsonb_ops`` class serves both ``@>`` (eq/ne) and ``?``
+    (exists); ``jsonb_path_ops`` would only serve ``@>``.
+    """
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_get_indexdef(to_regclass(%s))', [METADATA_INDEX])
+        definition = cursor.fetchone()[0]
+        if definition and 'jsonb_path_ops' in definition:
+            # Built by an earlier release that could not serve exists
+            cursor.execute(f'DROP INDEX {concurrently(connection)} {METADATA_INDEX}')
+        if not index_is_valid(connection, METADATA_INDEX):
+            cursor.execute(
+                f'CREATE INDEX {concurrently(connection)} {METADATA_INDEX} '
+                f'ON contacts USING gin (metadata)'
+            )
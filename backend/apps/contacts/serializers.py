@@ -1,8 +1,12 @@
 """
 Serializers for the contacts app.
 """
+import os
 from rest_framework import serializers
 from .models import Contact, Tag, ContactActivity, ContactNote
+from .phones import normalize_phone, tenant_country_code
+from .segments import SegmentError, compile_filter
+from .tags import tag_counts
 
 
 class ContactSerializer(serializers.ModelSerializer):
@@ -34,14 +38,9 @@ class ContactCreateSerializer(serializers.ModelSerializer):
     
     def validate_phone_number(self, value):
         """Validate and normalize phone number."""
-        # Remove any non-digit characters except leading +
-        import re
-        phone = re.sub(r'[^\d+]', '', value)
-        
-        # Ensure it starts with country code
-        if not phone.startswith('+'):
-            phone = '+' + phone
-        
+        phone = normalize_phone(value, tenant_country_code(self.context.get('tenant_id')))
+        if phone is None:
+            raise serializers.ValidationError('Enter a valid phone number.')
         return phone
 
 
@@ -65,7 +64,10 @@ class TagSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at']
     
     def get_contacts_count(self, obj):
-        return obj.contact_set.count()
+        counts = self.context.get('tag_counts')
+        if counts is None:
+            counts = tag_counts(obj.tenant_id, [obj.name])
+        return counts.get(obj.name, 0)
 
 
 class TagCreateSerializer(serializers.ModelSerializer):
@@ -110,7 +112,7 @@ class BulkContactSerializer(serializers.Serializer):
     phone_numbers = serializers.ListField(
         child=serializers.CharField(),
         min_length=1,
-        max_length=1000
+        max_length=50000
     )
     tags = serializers.ListField(
         child=serializers.CharField(),
@@ -120,6 +122,45 @@ class BulkContactSerializer(serializers.Serializer):
     metadata = serializers.JSONField(required=False, default=dict)
 
 
+class BulkContactUpdateSerializer(serializers.Serializer):
+    """Serializer for bulk tag and flag changes."""
+    
+    ids = serializers.ListField(
+        child=serializers.UUIDField(),
+        required=False,
+        min_length=1,
+        max_length=50000
+    )
+    contact_filter = serializers.JSONField(required=False)
+    add_tags = serializers.ListField(
+        child=serializers.CharField(),
+        required=False,
+        default=list
+    )
+    remove_tags = serializers.ListField(
+        child=serializers.CharField(),
+        required=False,
+        default=list
+    )
+    is_blocked = serializers.BooleanField(required=False)
+    is_subscribed = serializers.BooleanField(required=False)
+    
+    def validate_contact_filter(self, value):
+        try:
+            compile_filter(value)
+        except SegmentError as e:
+            raise serializers.ValidationError(str(e))
+        return value
+    
+    def validate(self, attrs):
+        if ('ids' in attrs) == ('contact_filter' in attrs):
+            raise serializers.ValidationError('Provide either ids or contact_filter.')
+        if not (attrs['add_tags'] or attrs['remove_tags']
+                or 'is_blocked' in attrs or 'is_subscribed' in attrs):
+            raise serializers.ValidationError('Nothing to change.')
+        return attrs
+
+
 class ContactImportSerializer(serializers.Serializer):
     """Serializer for contact import."""
     
@@ -130,3 +171,13 @@ class ContactImportSerializer(serializers.Serializer):
         required=False,
         default=list
     )
+    
+    def validate_file(self, value):
+        if os.path.splitext(value.name)[1].lower() not in ('.csv', '.xlsx'):
+            raise serializers.ValidationError('Upload a .csv or .xlsx file.')
+        return value
+    
+    def validate_mapping(self, value):
+        if not isinstance(value, dict) or not value.get('phone_number'):
+            raise serializers.ValidationError('Mapping must name the phone_number column.')
+        return value
@@ -1,9 +1,15 @@
 """
 Signals for the contacts app.
 """
-from django.db.models.signals import post_save, pre_save
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_save
+from django.conf import settings
 from django.dispatch import receiver
-from .models import Contact
+from config.partitions import install_partitioning
+from .models import Contact, ContactActivity
+from .phones import invalidate_country_code, normalize_phone, tenant_country_code
+from .search import install_search_indexes
+from .segments import contacts_changed, install_segment_indexes
+from .tags import install_tag_index
 import logging
 
 logger = logging.getLogger(__name__)
@@ -14,11 +20,8 @@ def contact_pre_save(sender, instance, **kwargs):
     """Handle pre-save operations for Contact model."""
     # Normalize phone number
     if instance.phone_number:
-        import re
-        phone = re.sub(r'[^\d+]', '', instance.phone_number)
-        if not phone.startswith('+'):
-            phone = '+' + phone
-        instance.phone_number = phone
+        country_code = tenant_country_code(instance.tenant_id)
+        instance.phone_number = normalize_phone(instance.phone_number, country_code) or instance.phone_number
 
 
 @receiver(post_save, sender=Contact)
@@ -26,3 +29,32 @@ def contact_post_save(sender, instance, created, **kwargs):
     """Handle post-save operations for Contact model."""
     if created:
         logger.info(f"New contact created: {instance.phone_number}")
+    contacts_changed(instance.tenant_id)
+
+
+@receiver(post_delete, sender=Contact)
+def contact_post_delete(sender, instance, **kwargs):
+    """Handle post-delete operations for Contact model."""
+    contacts_changed(instance.tenant_id)
+
+
+@receiver(post_save, sender='tenants.TenantSettings')
+def tenant_settings_post_save(sender, instance, **kwargs):
+    """Pick up a changed default country code straight away in this process."""
+    invalidate_country_code(instance.tenant_id)
+
+
+@receiver(post_migrate)
+def contacts_post_migrate(sender, using, **kwargs):
+    """Install the tag, segment and search indexes and activity partitions once the tables exist.
+
+    Only an empty activity table is partitioned here; an existing one is
+    converted by ``partition_contact_activities``.
+    """
+    if sender.name == 'apps.contacts':
+        install_tag_index(using)
+        install_segment_indexes(using)
+        install_search_indexes(using)
+        install_partitioning(
+            ContactActivity, 'created_at', settings.CONTACT_ACTIVITY_PARTITIONS_AHEAD, using
+        )
@@ -0,0 +1,171 @@
+"""
+Tag index and per-tag contact counts.
+
+On PostgreSQL ``contacts.tags`` gets a GIN index, which serves both
+containment (``@>``, all tags) and ``?|`` (any tag) filters, and the
+``contact_tag_counts`` table is kept up to date by statement-level
+triggers. The triggers read the whole statement's changes from transition
+tables, so a million-row import applies one grouped delta per tag instead
+of a write per contact, and raw SQL upserts are counted as well as ORM
+saves. Other databases (development SQLite) fall back to scanning.
+"""
+import json
+import logging
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Q
+from config.indexes import concurrently, index_is_valid
+from .models import Contact, TagCount
+
+logger = logging.getLogger(__name__)
+
+TAG_INDEX = 'contacts_tags_gin'
+
+TRIGGER_PREFIX = 'contacts_tag_counts'
+
+# Distinct tags of each row in {table}; non-array values count as no tags
+_ROW_TAGS_SQL = """
+    SELECT r.tenant_id, t.tag, {sign} AS delta
+    FROM {table} r
+    {join}
+    CROSS JOIN LATERAL (
+        SELECT DISTINCT jsonb_array_elements_text(
+            CASE WHEN jsonb_typeof(r.tags) = 'array' THEN r.tags ELSE '[]'::jsonb END
+        )
+    ) t(tag)
+"""
+
+# Rows whose tags (or tenant) an UPDATE actually changed
+_CHANGED_JOIN = """
+    JOIN {other} o ON o.id = r.id
+        AND (o.tags IS DISTINCT FROM r.tags OR o.tenant_id <> r.tenant_id)
+"""
+
+# Ordered so concurrent statements lock count rows in the same order
+_APPLY_SQL = """
+    INSERT INTO contact_tag_counts AS c (tenant_id, name, contacts_count)
+    SELECT tenant_id, tag, sum(delta) FROM ({rows}) d
+    GROUP BY tenant_id, tag
+    HAVING sum(delta) <> 0
+    ORDER BY tenant_id, tag
+    ON CONFLICT (tenant_id, name)
+    DO UPDATE SET contacts_count = c.contacts_count + EXCLUDED.contacts_count;
+"""
+
+
+def _row_tags(table, sign, other=None):
+    join = _CHANGED_JOIN.format(other=other) if other else ''
+    return _ROW_TAGS_SQL.format(table=table, sign=sign, join=join)
+
+
+TRIGGER_FUNCTION_SQL = f"""
+CREATE OR REPLACE FUNCTION contact_tag_counts_apply() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        {_APPLY_SQL.format(rows=_row_tags('new_rows', 1))}
+    ELSIF TG_OP = 'DELETE' THEN
+        {_APPLY_SQL.format(rows=_row_tags('old_rows', -1))}
+    ELSE
+        {_APPLY_SQL.format(rows=_row_tags('new_rows', 1, 'old_rows') + ' UNION ALL '
+                           + _row_tags('old_rows', -1, 'new_rows'))}
+    END IF;
+    RETURN NULL;
+END;
+$$;
+"""
+
+TRIGGERS = {
+    'insert': 'AFTER INSERT ON contacts REFERENCING NEW TABLE AS new_rows',
+    'update': 'AFTER UPDATE ON contacts REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows',
+    'delete': 'AFTER DELETE ON contacts REFERENCING OLD TABLE AS old_rows',
+}
+
+
+def tags_q(tags, match_all=False, vendor=None):
+    """Return a Q matching contacts carrying any (or all) of ``tags``."""
+    tags = [str(tag) for tag in tags]
+    if (vendor or connections[DEFAULT_DB_ALIAS].vendor) == 'postgresql':
+        if match_all:
+            return Q(tags__contains=tags)
+        # jsonb ?| matches array elements and is served by the GIN index
+        return Q(tags__has_any_keys=tags)
+    # JSON containment is PostgreSQL only; match the quoted tag instead
+    conditions = [Q(tags__icontains=json.dumps(tag)) for tag in tags]
+    combined = conditions[0]
+    for condition in conditions[1:]:
+        combined = combined & condition if match_all else combined | condition
+    return combined
+
+
+def filter_tags(queryset, tags, match_all=False):
+    """Filter contacts carrying any (or all) of ``tags``."""
+    if not tags:
+        return queryset
+    return queryset.filter(tags_q(tags, match_all, connections[queryset.db].vendor))
+
+
+def tag_counts(tenant_id, names=None):
+    """Return ``{tag: contacts_count}`` for a tenant."""
+    if connections[TagCount.objects.db].vendor == 'postgresql':
+        counts = TagCount.objects.filter(tenant_id=tenant_id, contacts_count__gt=0)
+        if names is not None:
+            counts = counts.filter(name__in=list(names))
+        return dict(counts.values_list('name', 'contacts_count'))
+    # Without triggers, count by scanning (development databases only)
+    result = {}
+    for tags in Contact.objects.filter(tenant_id=tenant_id).values_list('tags', flat=True):
+        for tag in set(tags or ()):
+            if names is None or tag in names:
+                result[tag] = result.get(tag, 0) + 1
+    return result
+
+
+def rebuild_tag_counts(tenant_id=None, using='default'):
+    """Recompute tag counts from the contacts table; returns the tag rows written."""
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return 0
+    where = 'WHERE r.tenant_id = %s' if tenant_id else ''
+    params = [str(tenant_id)] if tenant_id else []
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        # Waits for writers whose trigger deltas are not committed yet and
+        # holds off new ones, so no delta lands on rows being replaced
+        cursor.execute('LOCK TABLE contact_tag_counts IN EXCLUSIVE MODE')
+        cursor.execute(
+            f"DELETE FROM contact_tag_counts {'WHERE tenant_id = %s' if tenant_id else ''}",
+            params
+        )
+        cursor.execute(f"""
+            INSERT INTO contact_tag_counts (tenant_id, name, contacts_count)
+            SELECT tenant_id, tag, sum(delta) FROM ({_row_tags('contacts', 1)} {where}) d
+            GROUP BY tenant_id, tag
+        """, params)
+        return cursor.rowcount
+
+
+def install_tag_index(using='default'):
+    """Create the GIN index and count triggers on PostgreSQL (idempotent)."""
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        if not index_is_valid(connection, TAG_INDEX):
+            cursor.execute(
+                f'CREATE INDEX {concurrently(connection)} {TAG_INDEX} ON contacts USING gin (tags)'
+            )
+        cursor.execute(
+            'SELECT count(*) FROM pg_trigger WHERE tgname LIKE %s', [f'{TRIGGER_PREFIX}_%']
+        )
+        installed = cursor.fetchone()[0] == len(TRIGGERS)
+        with transaction.atomic(using=using):
+            cursor.execute(TRIGGER_FUNCTION_SQL)
+            for event, clause in TRIGGERS.items():
+                name = f'{TRIGGER_PREFIX}_{event}'
+                cursor.execute(f'DROP TRIGGER IF EXISTS {name} ON contacts')
+                cursor.execute(
+                    f'CREATE TRIGGER {name} {clause} '
+                    f'FOR EACH STATEMENT EXECUTE PROCEDURE contact_tag_counts_apply()'
+                )
+    if not installed:
+        logger.info('Backfilling contact tag counts')
+        rebuild_tag_counts(using=using)
@@ -0,0 +1,65 @@
+"""
+Celery tasks for the contacts app.
+"""
+import logging
+import os
+from celery import shared_task
+from django.conf import settings
+from django.core.files.storage import default_storage
+from config.partitions import ensure_partitions, retire_partitions
+from .dedup import run_dedup
+from .engagement import rebuild_engagement_scores
+from .importer import ContactImporter, ContactImportError, iter_file_rows, map_rows
+from .models import ContactActivity
+from .phones import tenant_country_code
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(bind=True)
+def import_contacts(self, path, tenant_id, mapping, tags=None):
+    """Import an uploaded CSV/XLSX file, reporting progress as task state."""
+    def progress(phase, stats):
+        self.update_state(state='PROGRESS', meta={'phase': phase, **stats})
+    
+    try:
+        with default_storage.open(path, 'rb') as f:
+            rows = map_rows(
+                iter_file_rows(f, os.path.basename(path)), mapping, tags or [],
+                country_code=tenant_country_code(tenant_id)
+            )
+            stats = ContactImporter(tenant_id, progress=progress).run(rows)
+    except ContactImportError as e:
+        logger.error(f"Contact import {path} failed: {e}")
+        return {'status': 'error', 'message': str(e)}
+    finally:
+        default_storage.delete(path)
+    
+    logger.info(f"Contact import for tenant {tenant_id} finished: {stats}")
+    return {'status': 'success', **stats}
+
+
+@shared_task
+def dedupe_contacts(full=False):
+    """Merge duplicate contacts changed since the last run (all of them if ``full``)."""
+    stats = run_dedup(full=full)
+    logger.info(f"Contact dedup finished: {stats}")
+    return {'status': 'success', **stats}
+
+
+@shared_task
+def rebuild_engagement(tenant_id=None):
+    """Recompute engagement ranks from message history."""
+    written = rebuild_engagement_scores(tenant_id)
+    logger.info(f"Engagement rebuilt for {written} contacts")
+    return {'status': 'success', 'contacts': written}
+
+
+@shared_task
+def maintain_activity_partitions():
+    """Create upcoming activity partitions and archive the expired ones."""
+    table = ContactActivity._meta.db_table
+    created = ensure_partitions(table, settings.CONTACT_ACTIVITY_PARTITIONS_AHEAD)
+    stats = retire_partitions(table, settings.CONTACT_ACTIVITY_RETENTION_MONTHS)
+    logger.info(f"Activity partitions: {created} created, {stats}")
+    return {'status': 'success', 'created': created, **stats}
@@ -1,12 +1,34 @@
 """
 Unit tests for the contacts app.
 """
+import io
+import uuid
 import pytest
+from django.conf import settings
 from django.test import TestCase
 from django.utils import timezone
+from datetime import timedelta
 from rest_framework.test import APITestCase
 from rest_framework import status
-from apps.contacts.models import Contact, Tag, ContactActivity, ContactNote
+from django.db import DatabaseError, connection
+from apps.contacts.activity import ActivitySink
+from apps.contacts.dedup import run_dedup
+from apps.contacts.engagement import add_rank, add_ranks, event_rank, rebuild_engagement_scores
+from apps.contacts.exporter import EXPORT_FIELDS
+from apps.contacts.importer import (
+    ContactImporter, ContactImportError, iter_file_rows, map_rows, upsert_phone_numbers
+)
+from apps.contacts.models import (
+    Contact, Tag, ContactActivity, ContactBulkUpdate, ContactNote, TagCount
+)
+from apps.contacts.phones import from_chat_id, normalize_many, normalize_phone, to_chat_id
+from apps.contacts.search import phone_prefixes, search_q
+from apps.contacts.segments import SegmentError, audience_count, compile_filter, segment_queryset
+from apps.contacts.tags import filter_tags, rebuild_tag_counts, tag_counts
+from config.partitions import (
+    _partitions, add_months, ensure_partitions, is_partitioned, month_start, partition_name,
+    retire_partitions
+)
 
 from unittest.mock import patch
 
@@ -50,14 +72,14 @@ class ContactModelTests(TestCase):
     
     def test_engagement_score(self):
         """Test the engagement_score property."""
+        half_life = timedelta(days=settings.CONTACT_ENGAGEMENT_HALF_LIFE_DAYS)
         contact = Contact.objects.create(
             tenant_id='test-tenant-id',
             phone_number='+1234567890',
-            messages_sent=10,
-            messages_received=5
+            engagement_rank=event_rank('received', timezone.now() - half_life, count=2)
         )
         
-        self.assertEqual(contact.engagement_score, 15)
+        self.assertAlmostEqual(contact.engagement_score, 3.0, places=2)
     
     def test_phone_normalization(self):
         """Test that phone number is normalized on save."""
@@ -118,6 +140,376 @@ class TagModelTests(TestCase):
         self.assertEqual(str(tag), 'Newsletter')
 
 
+class PhoneNormalizationTests(TestCase):
+    """Tests for E.164 phone normalisation."""
+    
+    def test_international_formats(self):
+        """Test that formatting is stripped from international numbers."""
+        self.assertEqual(normalize_phone('+1 (555) 123-4567'), '+15551234567')
+        self.assertEqual(normalize_phone('0044 7911 123456'), '+447911123456')
+        self.assertEqual(normalize_phone('+44 (0)7911 123456'), '+447911123456')
+        self.assertEqual(normalize_phone('＋４４７９１１１２３４５６'), '+447911123456')
+    
+    def test_default_country_code(self):
+        """Test that national numbers get the tenant's country code."""
+        self.assertEqual(normalize_phone('07911 123456', '44'), '+447911123456')
+        self.assertEqual(normalize_phone('7911123456', '+44'), '+447911123456')
+        self.assertEqual(normalize_phone('447911123456', '44'), '+447911123456')
+        self.assertEqual(normalize_phone('+15551234567', '44'), '+15551234567')
+    
+    def test_invalid_numbers(self):
+        """Test that non-numbers normalise to None."""
+        self.assertEqual(normalize_many(['abc', '', None, '+12345', '0123456']), [None] * 5)
+    
+    def test_batch_matches_single(self):
+        """Test that batch results match one-at-a-time normalisation."""
+        values = ['+1 555 123 4567', '07911123456', 'junk', 15551234567.0, '5551234567']
+        
+        self.assertEqual(
+            normalize_many(values, '44'),
+            [normalize_phone(value, '44') for value in values]
+        )
+    
+    def test_batch_mixing_trunk_and_bare_numbers(self):
+        """Test that a bare number in the batch leaves trunk-0 numbers alone."""
+        values = ['07911123456', '7911123456', '77911123456', '0779111234']
+        
+        self.assertEqual(normalize_many(values, '7')[0], '+77911123456')
+        self.assertEqual(normalize_many(values, '7'), [normalize_phone(value, '7') for value in values])
+    
+    def test_chat_ids(self):
+        """Test conversion to and from WhatsApp chat IDs."""
+        self.assertEqual(from_chat_id('15551234567@c.us'), '+15551234567')
+        self.assertEqual(to_chat_id('+15551234567'), '15551234567@c.us')
+
+
+class TagIndexTests(TestCase):
+    """Tests for tag filters and per-tag contact counts."""
+    
+    def setUp(self):
+        self.tenant_id = uuid.uuid4()
+        self.first = Contact.objects.create(
+            tenant_id=self.tenant_id, phone_number='+15550000001', tags=['vip', 'lead', 'vip']
+        )
+        self.second = Contact.objects.create(
+            tenant_id=self.tenant_id, phone_number='+15550000002', tags=['lead']
+        )
+        Contact.objects.create(tenant_id=uuid.uuid4(), phone_number='+15550000003', tags=['vip'])
+    
+    def test_filter_tags(self):
+        """Test any/all tag filters."""
+        contacts = Contact.objects.filter(tenant_id=self.tenant_id)
+        
+        self.assertEqual(filter_tags(contacts, ['vip', 'lead']).count(), 2)
+        self.assertEqual(filter_tags(contacts, ['vip', 'lead'], match_all=True).count(), 1)
+        self.assertEqual(filter_tags(contacts, ['nobody']).count(), 0)
+    
+    def test_counts_follow_changes(self):
+        """Test that tag counts track inserts, updates and deletes."""
+        self.assertEqual(tag_counts(self.tenant_id), {'vip': 1, 'lead': 2})
+        
+        Contact.objects.filter(id=self.second.id).update(tags=['vip'])
+        self.first.delete()
+        
+        self.assertEqual(tag_counts(self.tenant_id), {'vip': 1})
+    
+    def test_rebuild_tag_counts(self):
+        """Test that a rebuild restores drifted counts."""
+        if connection.vendor != 'postgresql':
+            self.skipTest('Tag count triggers are PostgreSQL only')
+        TagCount.objects.filter(tenant_id=self.tenant_id).update(contacts_count=99)
+        
+        rebuild_tag_counts(self.tenant_id)
+        
+        self.assertEqual(tag_counts(self.tenant_id), {'vip': 1, 'lead': 2})
+    
+    def test_invalid_index_is_rebuilt(self):
+        """Test that an index left invalid by an interrupted build is rebuilt."""
+        from apps.contacts.tags import TAG_INDEX, install_tag_index
+        from config.indexes import index_is_valid
+        if connection.vendor != 'postgresql':
+            self.skipTest('Tag index is PostgreSQL only')
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "UPDATE pg_index SET indisvalid = false WHERE indexrelid = %s::regclass", [TAG_INDEX]
+            )
+        
+        install_tag_index()
+        
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT indisvalid FROM pg_index WHERE indexrelid = %s::regclass", [TAG_INDEX])
+            self.assertTrue(cursor.fetchone()[0])
+        self.assertTrue(index_is_valid(connection, TAG_INDEX))
+    
+    def test_tag_list_counts(self):
+        """Test that the tags list reports contact counts."""
+        from django.contrib.auth import get_user_model
+        from rest_framework.test import APIClient
+        user = get_user_model().objects.create_user(
+            email='tags@example.com', password='test123', tenant_id=self.tenant_id
+        )
+        Tag.objects.create(tenant_id=self.tenant_id, name='lead')
+        client = APIClient()
+        client.force_authenticate(user)
+        
+        response = client.get('/api/tags/')
+        
+        self.assertEqual(response.data['tags'][0]['contacts_count'], 2)
+
+
+class SegmentTests(TestCase):
+    """Tests for the contact segment engine."""
+    
+    def setUp(self):
+        self.tenant_id = uuid.uuid4()
+        now = timezone.now()
+        self.pro = Contact.objects.create(
+            tenant_id=self.tenant_id, phone_number='+15550000001', tags=['vip'],
+            metadata={'plan': 'pro', 'seats': 10}, messages_received=4, messages_sent=3,
+            last_message_at=now - timedelta(days=2), engagement_rank=event_rank('received', now, count=3)
+        )
+        self.free = Contact.objects.create(
+            tenant_id=self.tenant_id, phone_number='+15550000002', tags=['lead'],
+            metadata={'plan': 'free'}, last_message_at=now - timedelta(days=90)
+        )
+        self.blocked = Contact.objects.create(
+            tenant_id=self.tenant_id, phone_number='+15550000003', tags=['vip'], is_blocked=True
+        )
+        ContactActivity.objects.create(contact=self.free, activity_type='message_received')
+    
+    def _match(self, contact_filter):
+        return set(segment_queryset(self.tenant_id, contact_filter).values_list('id', flat=True))
+    
+    def test_conditions(self):
+        """Test each kind of condition against reachable contacts."""
+        self.assertEqual(self._match({}), {self.pro.id, self.free.id})
+        self.assertEqual(self._match({'field': 'tags', 'op': 'any', 'value': ['vip']}), {self.pro.id})
+        self.assertEqual(self._match({'field': 'tags', 'op': 'none', 'value': ['vip']}), {self.free.id})
+        self.assertEqual(self._match({'field': 'metadata.plan', 'op': 'eq', 'value': 'pro'}), {self.pro.id})
+        self.assertEqual(self._match({'field': 'metadata.seats', 'op': 'gte', 'value': 5}), {self.pro.id})
+        self.assertEqual(self._match({'field': 'metadata.seats', 'op': 'exists', 'value': False}), {self.free.id})
+        self.assertEqual(self._match({'field': 'last_message_at', 'op': 'within_days', 'value': 7}), {self.pro.id})
+        self.assertEqual(self._match({'field': 'activity', 'op': 'within_days', 'value': 1}), {self.free.id})
+        self.assertEqual(self._match({'field': 'engagement', 'op': 'gt', 'value': 5}), {self.pro.id})
+        self.assertEqual(self._match({'field': 'engagement', 'op': 'top', 'value': 1}), {self.pro.id})
+        self.assertEqual(self._match({'field': 'is_subscribed', 'op': 'eq', 'value': False}), set())
+    
+    def test_groups(self):
+        """Test all, any and not groups."""
+        vip = {'field': 'tags', 'op': 'any', 'value': ['vip']}
+        free = {'field': 'metadata.plan', 'op': 'eq', 'value': 'free'}
+        
+        self.assertEqual(self._match({'any': [vip, free]}), {self.pro.id, self.free.id})
+        self.assertEqual(self._match({'all': [vip, free]}), set())
+        self.assertEqual(self._match({'not': vip}), {self.free.id})
+    
+    def test_metadata_exists_uses_index(self):
+        """Test that the metadata index serves exists as well as eq."""
+        from apps.contacts.segments import METADATA_INDEX, install_segment_indexes
+        if connection.vendor != 'postgresql':
+            self.skipTest('Metadata index is PostgreSQL only')
+        with connection.cursor() as cursor:
+            # As built by earlier releases
+            cursor.execute(f'DROP INDEX {METADATA_INDEX}')
+            cursor.execute(f'CREATE INDEX {METADATA_INDEX} ON contacts USING gin (metadata jsonb_path_ops)')
+        
+        install_segment_indexes()
+        
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_get_indexdef(%s::regclass)', [METADATA_INDEX])
+            self.assertNotIn('jsonb_path_ops', cursor.fetchone()[0])
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        q, _ = compile_filter({'field': 'metadata.plan', 'op': 'exists', 'value': True})
+        queryset = Contact.objects.filter(q)
+        self.assertIn(METADATA_INDEX, queryset.explain())
+    
+    def test_invalid_filters(self):
+        """Test that malformed filters raise SegmentError."""
+        for contact_filter in (
+            {'field': 'nope'},
+            {'field': 'tags', 'op': 'any', 'value': 'vip'},
+            {'field': 'metadata.a__b', 'op': 'eq', 'value': 1},
+            {'field': 'engagement', 'op': 'gte', 'value': 'high'},
+            {'all': [], 'any': []},
+        ):
+            with self.assertRaises(SegmentError):
+                compile_filter(contact_filter)
+    
+    def test_resources(self):
+        """Test that only engagement conditions depend on engagement versions."""
+        self.assertEqual(compile_filter({'field': 'tags', 'op': 'any', 'value': ['a']})[1], ['contacts'])
+        self.assertEqual(
+            compile_filter({'field': 'engagement', 'op': 'gte', 'value': 1})[1],
+            ['contacts', 'contact_engagement']
+        )
+    
+    @patch('apps.contacts.segments.get_versions')
+    @patch('apps.contacts.segments.get_redis')
+    def test_audience_count_cached_per_version(self, mock_redis, mock_versions):
+        """Test that counts are reused until the version counters move."""
+        store = {}
+        mock_redis.return_value.get.side_effect = store.get
+        mock_redis.return_value.set.side_effect = lambda key, value, ex: store.__setitem__(key, value)
+        mock_versions.return_value = [1]
+        contact_filter = {'field': 'tags', 'op': 'any', 'value': ['vip']}
+        
+        self.assertEqual(audience_count(self.tenant_id, contact_filter), 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(audience_count(self.tenant_id, contact_filter), 1)
+        
+        Contact.objects.filter(pk=self.free.pk).update(tags=['vip'])
+        mock_versions.return_value = [2]
+        self.assertEqual(audience_count(self.tenant_id, contact_filter), 2)
+
+
+class ContactSearchTests(TestCase):
+    """Tests for contact search."""
+    
+    def setUp(self):
+        self.tenant_id = uuid.uuid4()
+        self.john = Contact.objects.create(
+            tenant_id=self.tenant_id, phone_number='+447911123456', name='John Smith',
+            email='john.smith@acme.com', company='Acme Ltd'
+        )
+        self.jane = Contact.objects.create(
+            tenant_id=self.tenant_id, phone_number='+15551234567', name='Jane-Ann Doe',
+            email='jane@example.org'
+        )
+    
+    def _search(self, query, country_code=''):
+        contacts = Contact.objects.filter(tenant_id=self.tenant_id)
+        return set(contacts.filter(search_q(query, country_code)).values_list('id', flat=True))
+    
+    def test_word_prefixes(self):
+        """Test that every query word must prefix a word of the contact."""
+        self.assertEqual(self._search('jo smi'), {self.john.id})
+        self.assertEqual(self._search('ACME'), {self.john.id})
+        self.assertEqual(self._search('ann'), {self.jane.id})
+        self.assertEqual(self._search('example'), {self.jane.id})
+        self.assertEqual(self._search('j'), {self.john.id, self.jane.id})
+        self.assertEqual(self._search('john doe'), set())
+    
+    def test_search_in_subquery(self):
+        """Test that word search matches the subquery's rows, not the outer query's."""
+        from django.db.models import Count, OuterRef, Subquery
+        matches = Contact.objects.filter(search_q('smith'), tenant_id=OuterRef('tenant_id')) \
+            .values('tenant_id').annotate(total=Count('id')).values('total')
+        contacts = Contact.objects.filter(tenant_id=self.tenant_id).annotate(smiths=Subquery(matches))
+        
+        self.assertEqual({contact.smiths for contact in contacts}, {1})
+    
+    def test_search_column_is_only_added_explicitly_to_existing_tables(self):
+        """Test that migrate leaves the table rewrite to install_contact_search."""
+        from django.core.management import call_command
+        from apps.contacts.search import SEARCH_COLUMN, has_search_column, install_search_indexes
+        if connection.vendor != 'postgresql':
+            self.skipTest('Search column is PostgreSQL only')
+        with connection.cursor() as cursor:
+            cursor.execute(f'ALTER TABLE contacts DROP COLUMN {SEARCH_COLUMN}')
+        
+        install_search_indexes()
+        self.assertFalse(has_search_column(connection))
+        
+        call_command('install_contact_search', stdout=io.StringIO())
+        self.assertTrue(has_search_column(connection))
+        self.assertEqual(self._search('jo smi'), {self.john.id})
+    
+    def test_phone_prefixes(self):
+        """Test phone-like queries against stored E.164 numbers."""
+        self.assertEqual(self._search('+44 7911'), {self.john.id})
+        self.assertEqual(self._search('(555) 123', '1'), {self.jane.id})
+        self.assertEqual(self._search('07911 123', '44'), {self.john.id})
+        self.assertEqual(self._search('0044 79'), {self.john.id})
+        self.assertEqual(phone_prefixes('07911', '44'), ['+07911', '+447911'])
+
+
+class ContactDedupTests(TestCase):
+    """Tests for merging duplicate contacts."""
+    
+    def setUp(self):
+        self.tenant_id = uuid.uuid4()
+        now = timezone.now()
+        # bulk_create skips the pre_save normalisation, like legacy rows
+        self.canonical, self.legacy, self.spaced, self.alone = Contact.objects.bulk_create([
+            Contact(tenant_id=self.tenant_id, phone_number='+447911123456', name='John',
+                    tags=['vip'], metadata={'plan': 'pro'}, messages_received=2,
+                    created_at=now),
+            Contact(tenant_id=self.tenant_id, phone_number='07911 123456', email='john@acme.com',
+                    tags=['lead', 'vip'], metadata={'plan': 'free', 'city': 'Leeds'},
+                    messages_received=3, is_subscribed=False,
+                    last_message_at=now, created_at=now - timedelta(days=30)),
+            Contact(tenant_id=self.tenant_id, phone_number='+44 7911 123456', created_at=now),
+            Contact(tenant_id=self.tenant_id, phone_number='07700 900123', created_at=now),
+        ])
+        ContactNote.objects.create(contact=self.legacy, content='Called', added_by=uuid.uuid4())
+        patcher = patch('apps.contacts.dedup.tenant_country_code', return_value='44')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def _run(self):
+        with self.captureOnCommitCallbacks(execute=True), \
+                patch('apps.contacts.dedup.record_activity') as record:
+            stats = run_dedup(full=True, tenant_id=self.tenant_id)
+        self.recorded = record.call_args_list
+        return stats
+    
+    def test_duplicates_merge_into_canonical_row(self):
+        """Test that duplicates fold into the row holding the E.164 number."""
+        stats = self._run()
+        
+        self.assertEqual(stats, {'tenants': 1, 'merged': 2, 'normalized': 1})
+        contacts = Contact.objects.filter(tenant_id=self.tenant_id)
+        self.assertEqual(
+            sorted(contacts.values_list('phone_number', flat=True)),
+            ['+447700900123', '+447911123456']
+        )
+        survivor = contacts.get(phone_number='+447911123456')
+        self.assertEqual(survivor.pk, self.canonical.pk)
+        self.assertEqual(survivor.name, 'John')
+        self.assertEqual(survivor.email, 'john@acme.com')
+        self.assertEqual(survivor.tags, ['vip', 'lead'])
+        self.assertEqual(survivor.metadata, {'plan': 'pro', 'city': 'Leeds'})
+        self.assertEqual(survivor.messages_received, 5)
+        self.assertFalse(survivor.is_subscribed)
+        self.assertEqual(survivor.created_at, self.legacy.created_at)
+        self.assertEqual(ContactNote.objects.get().contact_id, survivor.pk)
+        self.assertEqual(len(self.recorded), 1)
+        self.assertEqual(self.recorded[0].args, (survivor.pk, 'merged'))
+    
+    def test_chats_merge_onto_the_key(self):
+        """Test that the duplicates' chats fold into one chat on the canonical number."""
+        from apps.chats.models import Chat
+        now = timezone.now()
+        Chat.objects.bulk_create([
+            Chat(tenant_id=self.tenant_id, phone_number='+447911123456', unread_count=1,
+                 last_message_preview='Old', last_message_at=now - timedelta(days=2)),
+            Chat(tenant_id=self.tenant_id, phone_number='07911 123456', unread_count=2,
+                 contact_name='John', last_message_preview='Newest', last_message_at=now),
+            Chat(tenant_id=self.tenant_id, phone_number='+44 7911 123456', unread_count=4,
+                 last_message_preview='Older', last_message_at=now - timedelta(days=1)),
+            Chat(tenant_id=self.tenant_id, phone_number='07700 900123', last_message_at=now),
+        ])
+        
+        self._run()
+        
+        chats = Chat.objects.filter(tenant_id=self.tenant_id)
+        self.assertEqual(
+            sorted(chats.values_list('phone_number', flat=True)),
+            ['+447700900123', '+447911123456']
+        )
+        chat = chats.get(phone_number='+447911123456')
+        self.assertEqual(chat.unread_count, 7)
+        self.assertEqual(chat.last_message_at, now)
+        self.assertEqual(chat.last_message_preview, 'Newest')
+        self.assertEqual(chat.contact_name, 'John')
+    
+    def test_second_run_finds_nothing(self):
+        """Test that merged and normalised rows are not picked up again."""
+        self._run()
+        
+        self.assertEqual(self._run(), {'tenants': 0, 'merged': 0, 'normalized': 0})
+
+
 class ContactActivityTests(TestCase):
     """Tests for the ContactActivity model."""
     
@@ -141,6 +533,309 @@ class ContactActivityTests(TestCase):
         self.assertTrue(activity.created_at)
 
 
+class ActivitySinkTests(TestCase):
+    """Tests for the write-behind activity sink."""
+    
+    def setUp(self):
+        self.contact = Contact.objects.create(
+            tenant_id=uuid.uuid4(),
+            phone_number='+1234567890'
+        )
+        self.sink = ActivitySink(flush_size=3, flush_seconds=0, max_pending=10)
+    
+    def test_record_waits_for_commit(self):
+        """Test that activities are buffered only once the transaction commits."""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.sink.record(self.contact.id, 'note_added', description='Hello')
+            self.assertEqual(self.sink.pending, 0)
+        
+        self.assertEqual(self.sink.pending, 1)
+        self.assertEqual(ContactActivity.objects.count(), 0)
+    
+    def test_flushes_on_size_threshold(self):
+        """Test that reaching flush_size writes the buffer in one batch."""
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(3):
+                self.sink.record(self.contact.id, 'message_received', description=str(i))
+        
+        self.assertEqual(self.sink.pending, 0)
+        self.assertEqual(ContactActivity.objects.filter(contact=self.contact).count(), 3)
+    
+    def test_database_error_requeues(self):
+        """Test that a failed write keeps the batch for the next flush."""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.sink.record(self.contact.id, 'blocked')
+        
+        with patch.object(ContactActivity.objects, 'bulk_create', side_effect=DatabaseError('down')):
+            self.assertEqual(self.sink.flush(), 0)
+        self.assertEqual(self.sink.pending, 1)
+        
+        self.assertEqual(self.sink.flush(), 1)
+        self.assertEqual(ContactActivity.objects.count(), 1)
+
+
+class ContactImporterTests(TestCase):
+    """Tests for the streaming contact importer."""
+    
+    mapping = {'phone_number': 'Phone', 'name': 'Name', 'tags': 'Tags', 'city': 'City'}
+    
+    def setUp(self):
+        self.tenant_id = uuid.uuid4()
+    
+    def _csv(self, text):
+        return list(iter_file_rows(io.BytesIO(text.encode('utf-8')), 'contacts.csv'))
+    
+    def test_map_rows_normalizes_and_skips(self):
+        """Test that phones are normalised and invalid rows are skipped."""
+        rows = self._csv('Phone,Name,Tags,City\n(555) 123-4567,Ann,"a; b",Paris\nn/a,Bob,,\n')
+        
+        mapped = list(map_rows(rows, self.mapping, ['imported']))
+        
+        self.assertEqual(mapped[0]['phone_number'], '+5551234567')
+        self.assertEqual(mapped[0]['tags'], ['a', 'b', 'imported'])
+        self.assertEqual(mapped[0]['metadata'], {'city': 'Paris'})
+        self.assertIsNone(mapped[1])
+    
+    def test_import_upserts_contacts(self):
+        """Test that existing contacts are merged rather than duplicated."""
+        Contact.objects.create(
+            tenant_id=self.tenant_id, phone_number='+5551234567', name='Ann', tags=['old']
+        )
+        rows = self._csv(
+            'Phone,Name,Tags,City\n'
+            '+5551234567,,new,Paris\n'
+            '+5559876543,Bob,,\n'
+            '+5559876543,Robert,,\n'
+            'x,,,\n'
+        )
+        
+        stats = ContactImporter(self.tenant_id).run(map_rows(rows, self.mapping))
+        
+        self.assertEqual(stats, {'total': 4, 'skipped': 1, 'created': 1, 'updated': 1})
+        ann = Contact.objects.get(tenant_id=self.tenant_id, phone_number='+5551234567')
+        self.assertEqual(ann.name, 'Ann')
+        self.assertEqual(ann.tags, ['old', 'new'])
+        self.assertEqual(ann.metadata, {'city': 'Paris'})
+        bob = Contact.objects.get(tenant_id=self.tenant_id, phone_number='+5559876543')
+        self.assertEqual(bob.name, 'Robert')
+        self.assertEqual(bob.source, 'import')
+    
+    def test_upsert_phone_numbers(self):
+        """Test that a phone list is upserted with set-union tags."""
+        Contact.objects.create(
+            tenant_id=self.tenant_id, phone_number='+5551234567', tags=['vip', 'bulk']
+        )
+        Contact.objects.create(
+            tenant_id=self.tenant_id, phone_number='+5550000000', tags=['vip']
+        )
+        
+        result = upsert_phone_numbers(
+            self.tenant_id,
+            ['555-123-4567', '+5550000000', '+5559876543', '+1 555 987 6543', '5559876543', 'nope'],
+            tags=['bulk']
+        )
+        
+        self.assertEqual(result, {'created': 2, 'existing': 2, 'invalid': 1})
+        tags = dict(Contact.objects.filter(tenant_id=self.tenant_id).values_list('phone_number', 'tags'))
+        self.assertEqual(tags['+5551234567'], ['vip', 'bulk'])
+        self.assertEqual(tags['+5550000000'], ['vip', 'bulk'])
+        self.assertEqual(tags['+5559876543'], ['bulk'])
+    
+    def test_unsupported_file_type(self):
+        """Test that unknown file types are rejected."""
+        with self.assertRaises(ContactImportError):
+            list(iter_file_rows(io.BytesIO(b''), 'contacts.pdf'))
+
+
+class ContactExportTests(APITestCase):
+    """Tests for the streaming contact export."""
+    
+    def setUp(self):
+        from django.contrib.auth import get_user_model
+        User = get_user_model()
+        self.user = User.objects.create_user(
+            email='export@example.com',
+            password='test123',
+            tenant_id=uuid.uuid4()
+        )
+        self.client.force_authenticate(self.user)
+        Contact.objects.create(
+            tenant_id=self.user.tenant_id,
+            phone_number='+15550000001',
+            name='Ann, Jr.',
+            tags=['vip', 'lead']
+        )
+        Contact.objects.create(
+            tenant_id=self.user.tenant_id,
+            phone_number='+15550000002',
+            is_blocked=True
+        )
+        Contact.objects.create(tenant_id=uuid.uuid4(), phone_number='+15550000003')
+    
+    def _content(self, response):
+        return b''.join(response.streaming_content).decode()
+    
+    def test_export_csv(self):
+        """Test exporting the tenant's contacts as CSV."""
+        import csv
+        response = self.client.get('/api/contacts/export/')
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        rows = list(csv.DictReader(io.StringIO(self._content(response))))
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(list(rows[0]), list(EXPORT_FIELDS))
+        ann = next(row for row in rows if row['phone_number'] == '+15550000001')
+        self.assertEqual(ann['name'], 'Ann, Jr.')
+        self.assertEqual(ann['tags'], 'vip;lead')
+    
+    def test_export_ndjson_uses_list_filters(self):
+        """Test that NDJSON export honours the list view filters."""
+        import json
+        response = self.client.get('/api/contacts/export/?file_format=ndjson&is_blocked=false')
+        
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = self._content(response).splitlines()
+        self.assertEqual(len(lines), 1)
+        self.assertEqual(json.loads(lines[0])['tags'], ['vip', 'lead'])
+    
+    def test_export_rejects_unknown_format(self):
+        """Test that an unsupported format is rejected."""
+        response = self.client.get('/api/contacts/export/?file_format=xml')
+        
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ContactImportStatusTests(APITestCase):
+    """Tests for polling contact imports."""
+    
+    def setUp(self):
+        from django.contrib.auth import get_user_model
+        User = get_user_model()
+        self.user = User.objects.create_user(
+            email='import@example.com',
+            password='test123',
+            tenant_id=uuid.uuid4()
+        )
+        self.client.force_authenticate(self.user)
+    
+    @patch('apps.contacts.views.import_contacts')
+    @patch('apps.contacts.views.default_storage')
+    def test_import_task_id_is_namespaced(self, mock_storage, mock_task):
+        """Test that queued imports get a task ID scoped to the tenant."""
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        mock_storage.save.return_value = 'imports/contacts.csv'
+        mock_task.apply_async.side_effect = lambda args, task_id: type('Task', (), {'id': task_id})
+        
+        response = self.client.post('/api/contacts/import/', {
+            'file': SimpleUploadedFile('contacts.csv', b'phone\n+15550000001\n'),
+            'mapping': '{"phone_number": "phone"}',
+        }, format='multipart')
+        
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertTrue(response.data['task_id'].startswith(f'{self.user.tenant_id}:'))
+    
+    @patch('apps.contacts.views.AsyncResult')
+    def test_status_of_own_import(self, mock_result):
+        """Test polling an import queued by the same tenant."""
+        mock_result.return_value.state = 'PROGRESS'
+        mock_result.return_value.info = {'processed': 10}
+        
+        response = self.client.get(f'/api/contacts/import/{self.user.tenant_id}:abc/')
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['progress'], {'processed': 10})
+    
+    @patch('apps.contacts.views.AsyncResult')
+    def test_status_of_other_tenants_import_is_hidden(self, mock_result):
+        """Test that another tenant's import cannot be polled."""
+        for task_id in (f'{uuid.uuid4()}:abc', 'abc'):
+            response = self.client.get(f'/api/contacts/import/{task_id}/')
+            
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        mock_result.assert_not_called()
+
+
+class KeysetPaginationTests(APITestCase):
+    """Tests for keyset pagination of the contact list."""
+    
+    def setUp(self):
+        from django.contrib.auth import get_user_model
+        User = get_user_model()
+        self.user = User.objects.create_user(
+            email='pages@example.com',
+            password='test123',
+            tenant_id=uuid.uuid4()
+        )
+        self.client.force_authenticate(self.user)
+        # Shared timestamps, so pages must fall back to id to break ties
+        now = timezone.now()
+        Contact.objects.bulk_create([
+            Contact(
+                tenant_id=self.user.tenant_id,
+                phone_number=f'+1555000{i:04d}',
+                name=f'Contact {i:02d}',
+                created_at=now - timedelta(minutes=i // 3)
+            )
+            for i in range(7)
+        ])
+    
+    def _walk(self, url, link='next'):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            ids.extend(contact['id'] for contact in response.data['contacts'])
+            url = response.data[link]
+        return ids, response
+    
+    def test_pages_cover_every_row_once(self):
+        """Test walking forward and back over rows with tied keys."""
+        expected = [
+            str(pk) for pk in Contact.objects.filter(tenant_id=self.user.tenant_id)
+            .order_by('-created_at', '-pk').values_list('pk', flat=True)
+        ]
+        ids, last = self._walk('/api/contacts/?page_size=2')
+        self.assertEqual(ids, expected)
+        self.assertEqual(last.data['count'], 7)
+        self.assertFalse(last.data['count_is_estimate'])
+        
+        back, _ = self._walk(last.data['previous'], link='previous')
+        self.assertEqual(back, expected[4:6] + expected[2:4] + expected[0:2])
+    
+    def test_ordering_by_name(self):
+        """Test that ?ordering= picks the key."""
+        ids, _ = self._walk('/api/contacts/?page_size=3&ordering=-name&total=false')
+        names = list(Contact.objects.filter(pk__in=ids).order_by('-name').values_list('pk', flat=True))
+        self.assertEqual(ids, [str(pk) for pk in names])
+    
+    def test_total_beyond_limit_is_estimated(self):
+        """Test that large totals stop counting at the exact limit."""
+        with self.settings(PAGINATION_EXACT_COUNT_LIMIT=3):
+            response = self.client.get('/api/contacts/?page_size=2')
+        self.assertTrue(response.data['count_is_estimate'])
+        self.assertGreaterEqual(response.data['count'], 4)
+    
+    def test_invalid_cursor(self):
+        """Test that a tampered cursor is rejected."""
+        response = self.client.get('/api/contacts/?cursor=bm90LWpzb24')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+    
+    def test_contact_activities_are_paged(self):
+        """Test paging a contact's activity history."""
+        contact = Contact.objects.filter(tenant_id=self.user.tenant_id).first()
+        for activity_type in ('imported', 'tag_added', 'message_sent'):
+            ContactActivity.objects.create(contact=contact, activity_type=activity_type)
+        
+        response = self.client.get(f'/api/contacts/{contact.id}/activities/?page_size=2')
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['activities']), 2)
+        self.assertEqual(response.data['count'], 3)
+        following = self.client.get(response.data['next'])
+        self.assertEqual(len(following.data['activities']), 1)
+
+
 class ContactAPITests(APITestCase):
     """Tests for the contacts API endpoints."""
     
@@ -287,3 +982,182 @@ class ContactAPITests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data['contacts']), 1)
         self.assertEqual(response.data['contacts'][0]['name'], 'John Doe')
+
+
+class ActivityPartitionTests(TestCase):
+    """Tests for the monthly contact_activities partitions."""
+    
+    def setUp(self):
+        if connection.vendor != 'postgresql':
+            self.skipTest('Activity partitions are PostgreSQL only')
+        self.contact = Contact.objects.create(tenant_id=uuid.uuid4(), phone_number='+15550001000')
+        self.table = ContactActivity._meta.db_table
+    
+    def test_partitions_created_ahead(self):
+        """Test that the table is partitioned with months created ahead."""
+        ahead = add_months(month_start(timezone.now()), settings.CONTACT_ACTIVITY_PARTITIONS_AHEAD)
+        
+        partitions = [name for name, _ in _partitions(self.table, connection)]
+        
+        self.assertTrue(is_partitioned(self.table))
+        self.assertIn(partition_name(self.table, ahead), partitions)
+        self.assertEqual(ensure_partitions(self.table, settings.CONTACT_ACTIVITY_PARTITIONS_AHEAD), 0)
+    
+    def test_partition_command_is_idempotent(self):
+        """Test that the conversion command leaves an already partitioned table alone."""
+        from django.core.management import call_command
+        out = io.StringIO()
+        
+        call_command('partition_contact_activities', stdout=out)
+        
+        self.assertIn('already partitioned', out.getvalue())
+        self.assertTrue(is_partitioned(self.table))
+    
+    def test_retire_archives_expired_partitions(self):
+        """Test that expired partitions are archived to storage and dropped."""
+        import gzip
+        import json
+        import tempfile
+        from django.core.files.storage import default_storage
+        from django.test import override_settings
+        old = ContactActivity.objects.create(
+            contact=self.contact, activity_type='imported', created_at=timezone.now() - timedelta(days=40)
+        )
+        later = timezone.now() + timedelta(days=400)
+        with connection.cursor() as cursor:
+            # Run the deferred FK check now; DROP TABLE refuses pending trigger events
+            cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+        
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root), \
+                patch('config.partitions.timezone.now', return_value=later):
+            stats = retire_partitions(self.table, 12)
+            path = f'archives/{self.table}/{self.table}_legacy.ndjson.gz'
+            with default_storage.open(path, 'rb') as f:
+                rows = [json.loads(line) for line in gzip.decompress(f.read()).splitlines()]
+        
+        self.assertEqual(stats['archived'], stats['detached'])
+        self.assertGreaterEqual(stats['rows'], 1)
+        self.assertIn(str(old.id), [row['id'] for row in rows])
+        self.assertFalse(ContactActivity.objects.filter(id=old.id).exists())
+
+
+class BulkContactUpdateTests(APITestCase):
+    """Tests for set-based bulk tag and flag changes."""
+    
+    def setUp(self):
+        from django.contrib.auth import get_user_model
+        self.user = get_user_model().objects.create_user(
+            email='bulk@example.com', password='test123', tenant_id=uuid.uuid4()
+        )
+        self.client.force_authenticate(self.user)
+        self.vip = Contact.objects.create(
+            tenant_id=self.user.tenant_id, phone_number='+15550002001', tags=['vip', 'lead']
+        )
+        self.lead = Contact.objects.create(
+            tenant_id=self.user.tenant_id, phone_number='+15550002002', tags=['lead']
+        )
+        self.other = Contact.objects.create(
+            tenant_id=uuid.uuid4(), phone_number='+15550002003', tags=['lead']
+        )
+    
+    def test_retag_segment(self):
+        """Test adding and removing tags on every contact of a segment."""
+        data = {
+            'contact_filter': {'field': 'tags', 'op': 'any', 'value': ['lead']},
+            'add_tags': ['customer'],
+            'remove_tags': ['lead']
+        }
+        
+        response = self.client.post('/api/contacts/bulk/update/', data, format='json')
+        
+        self.assertEqual(response.data['updated'], 2)
+        self.vip.refresh_from_db()
+        self.lead.refresh_from_db()
+        self.other.refresh_from_db()
+        self.assertEqual(self.vip.tags, ['vip', 'customer'])
+        self.assertEqual(self.lead.tags, ['customer'])
+        self.assertEqual(self.other.tags, ['lead'])
+        self.assertFalse(ContactActivity.objects.exists())
+        log = ContactBulkUpdate.objects.get(tenant_id=self.user.tenant_id)
+        self.assertEqual(log.selection, {'contact_filter': data['contact_filter']})
+        self.assertEqual(log.changes['add_tags'], ['customer'])
+        self.assertEqual(log.contact_count, 2)
+        self.assertEqual(log.performed_by, self.user.id)
+    
+    def test_block_by_ids_skips_unchanged(self):
+        """Test that only contacts whose flags change are written."""
+        Contact.objects.filter(id=self.lead.id).update(is_blocked=True)
+        data = {'ids': [str(self.vip.id), str(self.lead.id), str(self.other.id)], 'is_blocked': True}
+        
+        response = self.client.post('/api/contacts/bulk/update/', data, format='json')
+        
+        self.assertEqual(response.data['updated'], 1)
+        self.assertTrue(Contact.objects.get(id=self.vip.id).is_blocked)
+        self.assertFalse(Contact.objects.get(id=self.other.id).is_blocked)
+        log = ContactBulkUpdate.objects.get()
+        self.assertEqual(log.tenant_id, self.user.tenant_id)
+        self.assertEqual(log.selection, {'ids': data['ids']})
+        self.assertEqual(log.contact_count, 1)
+    
+    def test_requires_one_selection(self):
+        """Test that exactly one of ids and contact_filter is required."""
+        data = {'ids': [str(self.vip.id)], 'contact_filter': {}, 'add_tags': ['x']}
+        
+        response = self.client.post('/api/contacts/bulk/update/', data, format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class EngagementTests(TestCase):
+    """Tests for stored recency-decayed engagement."""
+    
+    def setUp(self):
+        self.tenant_id = uuid.uuid4()
+        self.contact = Contact.objects.create(tenant_id=self.tenant_id, phone_number='+15550003001')
+    
+    def test_events_accumulate_in_sql(self):
+        """Test that the SQL log-add sums event weights."""
+        self.assertEqual(self.contact.engagement_score, 0)
+        now = timezone.now()
+        for _ in range(3):
+            Contact.objects.filter(id=self.contact.id).update(engagement_rank=add_rank(event_rank('sent', now)))
+        
+        self.contact.refresh_from_db()
+        self.assertAlmostEqual(self.contact.engagement_score, 3.0, places=2)
+        self.assertAlmostEqual(
+            add_ranks(event_rank('sent', now), event_rank('read', now)), event_rank('received', now)
+        )
+    
+    def test_ordering_by_engagement(self):
+        """Test listing the most engaged contacts first."""
+        from django.contrib.auth import get_user_model
+        from rest_framework.test import APIClient
+        engaged = Contact.objects.create(
+            tenant_id=self.tenant_id, phone_number='+15550003002', engagement_rank=event_rank('read')
+        )
+        client = APIClient()
+        client.force_authenticate(get_user_model().objects.create_user(
+            email='engaged@example.com', password='test123', tenant_id=self.tenant_id
+        ))
+        
+        response = client.get('/api/contacts/?ordering=-engagement_rank')
+        
+        self.assertEqual([c['id'] for c in response.data['contacts']], [str(engaged.id), str(self.contact.id)])
+        self.assertAlmostEqual(response.data['contacts'][0]['engagement_score'], 2.0, places=2)
+    
+    def test_rebuild_from_messages(self):
+        """Test recomputing ranks from message history."""
+        if connection.vendor != 'postgresql':
+            self.skipTest('Engagement rebuild is PostgreSQL only')
+        from apps.messages.models import Message
+        for message_status in ('read', 'failed'):
+            Message.objects.create(
+                tenant_id=self.tenant_id, contact_id=self.contact.id, direction='outbound',
+                phone_from='self', phone_to=self.contact.phone_number, status=message_status,
+                sent_at=timezone.now(), read_at=timezone.now() if message_status == 'read' else None
+            )
+        
+        self.assertEqual(rebuild_engagement_scores(self.tenant_id), 1)
+        
+        self.contact.refresh_from_db()
+        self.assertAlmostEqual(self.contact.engagement_score, 3.0, places=2)
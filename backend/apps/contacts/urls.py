@@ -5,7 +5,7 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
     ContactViewSet, TagViewSet, ContactNoteViewSet, ContactActivityView,
-    BulkContactView, ContactImportView
+    BulkContactView, BulkContactUpdateView, ContactImportView, ContactImportStatusView
 )
 
 router = DefaultRouter()
@@ -13,12 +13,15 @@ router.register(r'contacts', ContactViewSet, basename='contact')
 router.register(r'tags', TagViewSet, basename='tag')
 
 urlpatterns = [
-    path('', include(router.urls)),
+    # Fixed paths first so the router's contacts/<pk>/ route does not shadow them
     path('contacts/bulk/', BulkContactView.as_view(), name='bulk-contacts'),
+    path('contacts/bulk/update/', BulkContactUpdateView.as_view(), name='bulk-contacts-update'),
     path('contacts/import/', ContactImportView.as_view(), name='contact-import'),
+    path('contacts/import/<str:task_id>/', ContactImportStatusView.as_view(), name='contact-import-status'),
     path('contacts/<uuid:pk>/activities/', ContactActivityView.as_view(), name='contact-activities'),
     path('contacts/<uuid:contact_pk>/notes/', ContactNoteViewSet.as_view({
         'get': 'list',
         'post': 'create'
     }), name='contact-notes'),
+    path('', include(router.urls)),
 ]
@@ -2,20 +2,35 @@
 Views for the contacts app.
 """
 from rest_framework import viewsets, status, generics
+from rest_framework.decorators import action
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework.filters import SearchFilter, OrderingFilter
-from django.db import transaction
+from rest_framework.filters import OrderingFilter
+import os
+import uuid
+from celery.result import AsyncResult
+from django.core.files.storage import default_storage
+from django.http import Http404, StreamingHttpResponse
+from django.utils import timezone
+from apps.tenants.conditional import conditional_get
 
+from .activity import record_activity
+from .bulk import FLAGS, bulk_update_contacts, select_contacts
+from .exporter import EXPORT_FORMATS, iter_export
+from .filters import ContactFilter, ContactSearchFilter
+from .importer import upsert_phone_numbers
 from .models import Contact, Tag, ContactActivity, ContactNote
+from .segments import ENGAGEMENT_RESOURCE, VERSION_RESOURCE
 from .serializers import (
     ContactSerializer, ContactCreateSerializer, ContactUpdateSerializer,
     TagSerializer, TagCreateSerializer, ContactActivitySerializer,
     ContactNoteSerializer, ContactNoteCreateSerializer, BulkContactSerializer,
-    ContactImportSerializer
+    BulkContactUpdateSerializer, ContactImportSerializer
 )
+from .tags import tag_counts
+from .tasks import import_contacts
 
 
 class ContactViewSet(viewsets.ModelViewSet):
@@ -23,11 +38,11 @@ class ContactViewSet(viewsets.ModelViewSet):
     
     serializer_class = ContactSerializer
     permission_classes = []
+    results_key = 'contacts'
     
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
-    filterset_fields = ['is_blocked', 'is_subscribed', 'tags', 'source']
-    search_fields = ['phone_number', 'name', 'email', 'company']
-    ordering_fields = ['created_at', 'name', 'phone_number']
+    filter_backends = [DjangoFilterBackend, ContactSearchFilter, OrderingFilter]
+    filterset_class = ContactFilter
+    ordering_fields = ['created_at', 'name', 'phone_number', 'engagement_rank']
     ordering = ['-created_at']
     
     def get_queryset(self):
@@ -48,25 +63,39 @@ class ContactViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(tenant_id=self.request.user.tenant_id)
         # Log activity
-        ContactActivity.objects.create(
-            contact=serializer.instance,
-            activity_type='imported',
+        record_activity(
+            serializer.instance.id,
+            'imported',
             description='Contact created',
             performed_by=self.request.user.id
         )
     
+    @conditional_get(VERSION_RESOURCE, ENGAGEMENT_RESOURCE)
     def list(self, request, *args, **kwargs):
-        queryset = self.get_queryset()
-        page = self.paginate_queryset(queryset)
-        if page is not None:
-            serializer = self.get_serializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
-        serializer = self.get_serializer(queryset, many=True)
-        return Response({
-            'success': True,
-            'contacts': serializer.data,
-            'count': queryset.count()
-        })
+        page = self.paginate_queryset(self.filter_queryset(self.get_queryset()))
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+    
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """Stream every contact matching the list filters as CSV or NDJSON."""
+        export_format = request.query_params.get('file_format', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            return Response({
+                'success': False,
+                'message': 'file_format must be csv or ndjson.'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        queryset = self.filter_queryset(self.get_queryset())
+        response = StreamingHttpResponse(
+            iter_export(queryset, export_format),
+            content_type=EXPORT_FORMATS[export_format]
+        )
+        filename = f"contacts-{timezone.now():%Y%m%d-%H%M%S}.{export_format}"
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        # Let nginx pass chunks through instead of buffering the whole export
+        response['X-Accel-Buffering'] = 'no'
+        return response
     
     def retrieve(self, request, *args, **kwargs):
         instance = self.get_object()
@@ -97,44 +126,49 @@ class BulkContactView(APIView):
         serializer = BulkContactSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         
-        tenant_id = request.user.tenant_id
-        phone_numbers = serializer.validated_data['phone_numbers']
-        tags = serializer.validated_data.get('tags', [])
-        metadata = serializer.validated_data.get('metadata', {})
+        result = upsert_phone_numbers(
+            request.user.tenant_id,
+            serializer.validated_data['phone_numbers'],
+            tags=serializer.validated_data.get('tags', []),
+            metadata=serializer.validated_data.get('metadata', {})
+        )
         
-        created = 0
-        existing = 0
+        return Response({
+            'success': True,
+            'message': f"Contacts processed: {result['created']} created, {result['existing']} existing.",
+            'created': result['created'],
+            'existing': result['existing'],
+            'invalid': result['invalid']
+        })
+
+
+class BulkContactUpdateView(APIView):
+    """View for bulk tag and flag changes by segment filter or ID list."""
+    
+    def post(self, request):
+        serializer = BulkContactUpdateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        tenant_id = request.user.tenant_id
+        if 'ids' in data:
+            selection = {'ids': [str(pk) for pk in data['ids']]}
+        else:
+            selection = {'contact_filter': data.get('contact_filter')}
         
-        with transaction.atomic():
-            for phone in phone_numbers:
-                phone = phone.strip()
-                if not phone:
-                    continue
-                
-                contact, was_created = Contact.objects.get_or_create(
-                    tenant_id=tenant_id,
-                    phone_number=phone,
-                    defaults={
-                        'metadata': metadata,
-                        'source': 'import'
-                    }
-                )
-                
-                if was_created:
-                    created += 1
-                else:
-                    existing += 1
-                
-                # Add tags
-                if tags:
-                    contact.tags.extend(tags)
-                    contact.save()
+        updated = bulk_update_contacts(
+            tenant_id,
+            select_contacts(tenant_id, data.get('contact_filter'), data.get('ids')),
+            add_tags=data['add_tags'],
+            remove_tags=data['remove_tags'],
+            flags={field: data[field] for field in FLAGS if field in data},
+            performed_by=request.user.id,
+            selection=selection
+        )
         
         return Response({
             'success': True,
-            'message': f'Contacts processed: {created} created, {existing} existing.',
-            'created': created,
-            'existing': existing
+            'message': f"{updated} contacts updated.",
+            'updated': updated
         })
 
 
@@ -147,12 +181,43 @@ class ContactImportView(APIView):
         serializer = ContactImportSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         
-        # TODO: Implement CSV/Excel import logic
-        # This would use pandas or csv module to parse the file
+        # Spool the upload to shared storage in chunks; the worker streams it
+        upload = serializer.validated_data['file']
+        extension = os.path.splitext(upload.name)[1].lower()
+        path = default_storage.save(
+            f'imports/{request.user.tenant_id}/{uuid.uuid4()}{extension}', upload
+        )
+        # The task ID is namespaced by tenant so status polls can be scoped
+        task = import_contacts.apply_async(
+            args=(
+                path,
+                str(request.user.tenant_id),
+                serializer.validated_data['mapping'],
+                serializer.validated_data.get('tags', [])
+            ),
+            task_id=f'{request.user.tenant_id}:{uuid.uuid4()}'
+        )
         
         return Response({
             'success': True,
-            'message': 'Import started. You will be notified when complete.'
+            'message': 'Import started. You will be notified when complete.',
+            'task_id': task.id
+        }, status=status.HTTP_202_ACCEPTED)
+
+
+class ContactImportStatusView(APIView):
+    """View for polling the progress of a contact import."""
+    
+    def get(self, request, task_id):
+        if not task_id.startswith(f'{request.user.tenant_id}:'):
+            raise Http404
+        result = AsyncResult(task_id)
+        info = result.info if isinstance(result.info, dict) else {}
+        return Response({
+            'success': True,
+            'task_id': task_id,
+            'state': result.state,
+            'progress': info
         })
 
 
@@ -161,6 +226,7 @@ class TagViewSet(viewsets.ModelViewSet):
     
     serializer_class = TagSerializer
     permission_classes = []
+    results_key = 'tags'
     
     def get_queryset(self):
         return Tag.objects.filter(tenant_id=self.request.user.tenant_id)
@@ -170,17 +236,20 @@ class TagViewSet(viewsets.ModelViewSet):
             return TagCreateSerializer
         return TagSerializer
     
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.action == 'list':
+            # One lookup for every tag in the list
+            context['tag_counts'] = tag_counts(self.request.user.tenant_id)
+        return context
+    
     def perform_create(self, serializer):
         serializer.save(tenant_id=self.request.user.tenant_id)
     
     def list(self, request, *args, **kwargs):
-        queryset = self.get_queryset()
-        serializer = self.get_serializer(queryset, many=True)
-        return Response({
-            'success': True,
-            'tags': serializer.data,
-            'count': queryset.count()
-        })
+        page = self.paginate_queryset(self.get_queryset())
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
     
     def destroy(self, request, *args, **kwargs):
         instance = self.get_object()
@@ -219,7 +288,9 @@ class ContactActivityView(generics.ListAPIView):
     
     serializer_class = ContactActivitySerializer
     permission_classes = []
+    results_key = 'activities'
     
     def get_queryset(self):
+        # Paged by the keyset paginator, which cannot reorder a slice
         contact_id = self.kwargs.get('pk')
-        return ContactActivity.objects.filter(contact_id=contact_id)[:50]
+        return ContactActivity.objects.filter(contact_id=contact_id)
@@ -0,0 +1,124 @@
+"""
+Idempotency filter for redelivered Green API webhooks.
+
+Events are keyed on ``type:idMessage``. A bounded in-process LRU catches
+redeliveries seen by the same consumer; time-bucketed Redis sets catch
+them across consumers. ``filter`` only looks keys up; callers ``mark``
+events once their processing is durable (the stream consumer does so
+when it acknowledges them), so an event whose processing failed, or
+whose consumer died, is processed again when it is redelivered.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+import redis
+from django.conf import settings
+from config.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'green_api:webhook_seen:'
+
+
+def event_key(webhook_data):
+    """Return the dedup key for an event, or None if it cannot be deduplicated."""
+    message_id = webhook_data.get('idMessage')
+    if not message_id:
+        return None
+    return f"{webhook_data.get('type', '')}:{message_id}"
+
+
+class WebhookDeduplicator:
+    """Drops events whose key was already seen within the dedup window."""
+
+    def __init__(self, lru_size=None, bucket_seconds=None):
+        self.lru_size = lru_size or settings.WEBHOOK_DEDUP_LRU_SIZE
+        self.bucket_seconds = bucket_seconds or settings.WEBHOOK_DEDUP_BUCKET_SECONDS
+        self._seen = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _seen_locally(self, key):
+        """Return True if ``key`` is in the LRU."""
+        with self._lock:
+            if key in self._seen:
+                self._seen.move_to_end(key)
+                return True
+            return False
+
+    def filter(self, events):
+        """Return the events of ``events`` that have not been seen before."""
+        fresh = []
+        candidates = []
+        batch_keys = set()
+        for webhook_data in events:
+            key = event_key(webhook_data)
+            if key is None:
+                fresh.append((None, webhook_data))
+                continue
+            if key in batch_keys or self._seen_locally(key):
+                continue
+            batch_keys.add(key)
+            candidates.append(key)
+            fresh.append((key, webhook_data))
+
+        duplicates = self._seen_in_redis(candidates)
+        if duplicates:
+            logger.info(f"Dropped {len(duplicates)} redelivered webhooks")
+        return [data for key, data in fresh if key is None or key not in duplicates]
+
+    def mark(self, events):
+        """Record ``events`` as processed."""
+        keys = [key for key in map(event_key, events) if key is not None]
+        if not keys:
+            return
+        with self._lock:
+            for key in keys:
+                self._seen[key] = None
+                self._seen.move_to_end(key)
+            while len(self._seen) > self.lru_size:
+                self._seen.popitem(last=False)
+        self._mark_in_redis(keys)
+
+    def _buckets(self):
+        bucket = int(time.time() // self.bucket_seconds)
+        return f"{KEY_PREFIX}{bucket}", f"{KEY_PREFIX}{bucket - 1}"
+
+    def _seen_in_redis(self, keys):
+        """Return the keys of ``keys`` present in the current or previous bucket."""
+        if not keys:
+            return set()
+        current, previous = self._buckets()
+        try:
+            pipe = get_redis().pipeline(transaction=False)
+            pipe.smismember(current, keys)
+            pipe.smismember(previous, keys)
+            in_current, in_previous = pipe.execute()
+        except redis.exceptions.RedisError as e:
+            logger.warning(f"Webhook dedup store unavailable, using local cache only: {e}")
+            return set()
+        return {
+            key for key, was_current, was_previous in zip(keys, in_current, in_previous)
+            if was_current or was_previous
+        }
+
+    def _mark_in_redis(self, keys):
+        """Add ``keys`` to the current bucket."""
+        current, _ = self._buckets()
+        try:
+            pipe = get_redis().pipeline(transaction=False)
+            pipe.sadd(current, *keys)
+            pipe.expire(current, self.bucket_seconds * 2)
+            pipe.execute()
+        except redis.exceptions.RedisError as e:
+            logger.warning(f"Webhook dedup store unavailable, using local cache only: {e}")
+
+_deduplicator = None
+
+
+def get_deduplicator():
+    """Return the process-wide deduplicator."""
+    global _deduplicator
+    if _deduplicator is None:
+        _deduplicator = WebhookDeduplicator()
+    return _deduplicator
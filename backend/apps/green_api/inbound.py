@@ -0,0 +1,191 @@
+"""
+Inbound message pipeline.
+
+Recording an inbound message used to take two ``get_or_create`` calls,
+two read-modify-write ``save()`` calls and two inserts. On PostgreSQL it
+is now two statements in one transaction:
+
+1. upsert the contact and the chat, incrementing their counters in SQL;
+2. insert the message.
+
+The messages table cannot keep a unique key on the Green API message ID
+(see ``Message.Meta``), so a redelivered message is caught inside the
+transaction instead: the ID is locked and looked up first, and a message
+already recorded is returned without touching any counters.
+
+The contact activity goes through the write-behind activity sink.
+"""
+from django.db import connection, transaction
+from django.db.models import F
+from django.db.models.signals import pre_save
+from django.utils import timezone
+from apps.contacts.activity import record_activity
+from apps.contacts.engagement import ADD_RANK_SQL, add_rank, event_rank
+from apps.contacts.models import Contact
+from apps.contacts.segments import contacts_changed
+from apps.messages.models import Message
+from apps.chats.models import Chat
+from apps.tenants.versions import CHATS, MESSAGES, bump_on_commit
+from config.sql import insert_columns, insert_row
+
+
+def record_inbound_message(tenant_id, phone, sender, message_type, text, media,
+                           green_api_message_id):
+    """Record an inbound message; returns ``(message_id, contact_id, created)``.
+
+    ``created`` is False when the message had already been recorded.
+    """
+    now = timezone.now()
+
+    contact = Contact(
+        tenant_id=tenant_id,
+        phone_number=phone,
+        wa_id=sender,
+        source='chat',
+        messages_received=1,
+        last_message_at=now,
+        engagement_rank=event_rank('received', now)
+    )
+    # Apply the same normalisation Contact.save() would
+    pre_save.send(sender=Contact, instance=contact, raw=False, using='default', update_fields=None)
+
+    chat = Chat(
+        tenant_id=tenant_id,
+        phone_number=phone,
+        unread_count=1,
+        last_message_preview=text[:200],
+        last_message_at=now
+    )
+    message = Message(
+        tenant_id=tenant_id,
+        direction='inbound',
+        message_type=message_type,
+        content=text,
+        media_url=media.get('fileUrl', ''),
+        media_id=media.get('fileUniqueId', ''),
+        phone_from=phone,
+        phone_to='self',
+        green_api_chat_id=sender,
+        green_api_message_id=green_api_message_id,
+        status='received',
+        created_at=now
+    )
+    message.status_rank = Message.STATUS_RANKS.get(message.status, 0)
+
+    with transaction.atomic():
+        existing = _find_recorded(tenant_id, green_api_message_id)
+        if existing:
+            return existing + (False,)
+        if connection.vendor == 'postgresql':
+            contact_id, created = _upsert_contact_and_chat(contact, chat)
+        else:
+            contact_id, created = _upsert_contact_and_chat_portable(contact, chat)
+        message.contact_id = contact_id
+        Message.objects.bulk_create([message])
+        record_activity(
+            contact_id, 'message_received',
+            description=f"Received: {text[:100]}",
+            created_at=now
+        )
+        # A new contact changes every segment; otherwise only engagement moved
+        contacts_changed(tenant_id, engagement_only=not created)
+        bump_on_commit(tenant_id, CHATS, MESSAGES)
+
+    return message.id, contact_id, True
+
+
+def _find_recorded(tenant_id, green_api_message_id):
+    """Return ``(message_id, contact_id)`` if the message is already recorded.
+
+    On PostgreSQL a transaction-scoped advisory lock on the ID serialises
+    concurrent deliveries of the same message until the first commits.
+    """
+    if not green_api_message_id:
+        return None
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT pg_advisory_xact_lock(hashtextextended(%s, 0))",
+                [f"inbound:{tenant_id}:{green_api_message_id}"]
+            )
+    return Message.objects.filter(
+        tenant_id=tenant_id, direction='inbound', green_api_message_id=green_api_message_id
+    ).values_list('id', 'contact_id').first()
+
+
+def _upsert_contact_and_chat(contact, chat):
+    """Statement 1: upsert contact and chat, incrementing counters in SQL."""
+    _, contact_columns = insert_columns(Contact)
+    contact_row, contact_params = insert_row(Contact, contact)
+    _, chat_columns = insert_columns(Chat)
+    chat_row, chat_params = insert_row(Chat, chat, overrides={'contact_name': 'contact.name'})
+    add_rank_sql = ADD_RANK_SQL.format(
+        rank=f'{Contact._meta.db_table}.engagement_rank', other='EXCLUDED.engagement_rank'
+    )
+
+    sql = f"""
+        WITH contact AS (
+            INSERT INTO {Contact._meta.db_table} ({contact_columns})
+            VALUES ({contact_row})
+            ON CONFLICT (tenant_id, phone_number) DO UPDATE SET
+                messages_received = {Contact._meta.db_table}.messages_received + 1,
+                last_message_at = EXCLUDED.last_message_at,
+                engagement_rank = {add_rank_sql},
+                updated_at = EXCLUDED.updated_at
+            RETURNING id, name, (xmax = 0) AS created
+        ),
+        chat AS (
+            INSERT INTO {Chat._meta.db_table} ({chat_columns})
+            SELECT {chat_row} FROM contact
+            ON CONFLICT (tenant_id, phone_number) DO UPDATE SET
+                unread_count = {Chat._meta.db_table}.unread_count + 1,
+                last_message_preview = EXCLUDED.last_message_preview,
+                last_message_at = EXCLUDED.last_message_at,
+                updated_at = EXCLUDED.updated_at
+            RETURNING id
+        )
+        SELECT contact.id, contact.created FROM contact, chat
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, contact_params + chat_params)
+        return cursor.fetchone()
+
+
+def _upsert_contact_and_chat_portable(contact, chat):
+    """Fallback for non-PostgreSQL databases, still race-free via F()."""
+    existing, contact_created = Contact.objects.get_or_create(
+        tenant_id=contact.tenant_id,
+        phone_number=contact.phone_number,
+        defaults={
+            'wa_id': contact.wa_id,
+            'source': contact.source,
+            'messages_received': 1,
+            'last_message_at': contact.last_message_at,
+            'engagement_rank': contact.engagement_rank,
+        }
+    )
+    if not contact_created:
+        Contact.objects.filter(pk=existing.pk).update(
+            messages_received=F('messages_received') + 1,
+            last_message_at=contact.last_message_at,
+            engagement_rank=add_rank(contact.engagement_rank)
+        )
+
+    _, created = Chat.objects.get_or_create(
+        tenant_id=chat.tenant_id,
+        phone_number=chat.phone_number,
+        defaults={
+            'contact_name': existing.name,
+            'unread_count': 1,
+            'last_message_preview': chat.last_message_preview,
+            'last_message_at': chat.last_message_at,
+        }
+    )
+    if not created:
+        Chat.objects.filter(tenant_id=chat.tenant_id, phone_number=chat.phone_number).update(
+            unread_count=F('unread_count') + 1,
+            last_message_preview=chat.last_message_preview,
+            last_message_at=chat.last_message_at
+        )
+    return existing.pk, contact_created
+
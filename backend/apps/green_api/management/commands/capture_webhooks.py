@@ -0,0 +1,40 @@
+"""
+Management command that records live webhook traffic to a capture file.
+"""
+import signal
+from django.core.management.base import BaseCommand, CommandError
+from apps.green_api.replay import capture_stream
+
+
+class Command(BaseCommand):
+    help = 'Record raw Green API webhooks from the ingestion stream to a gzipped NDJSON file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='Capture file to append to (e.g. webhooks.ndjson.gz).')
+        parser.add_argument('--sample', type=float, default=1.0,
+                            help='Fraction of events to keep, between 0 and 1 (default: all).')
+        parser.add_argument('--limit', type=int, help='Stop after this many events.')
+        parser.add_argument('--duration', type=float, help='Stop after this many seconds.')
+
+    def handle(self, *args, **options):
+        sample = options['sample']
+        if not 0 < sample <= 1:
+            raise CommandError('--sample must be greater than 0 and at most 1.')
+
+        stopping = []
+
+        def _stop(signum, frame):
+            stopping.append(signum)
+
+        signal.signal(signal.SIGTERM, _stop)
+        signal.signal(signal.SIGINT, _stop)
+
+        self.stdout.write(f"Capturing webhooks to {options['output']} (sample={sample})")
+        written = capture_stream(
+            options['output'],
+            sample=sample,
+            limit=options.get('limit'),
+            duration=options.get('duration'),
+            should_stop=lambda: bool(stopping)
+        )
+        self.stdout.write(self.style.SUCCESS(f"Captured {written} events"))
@@ -0,0 +1,31 @@
+"""
+Management command that runs a Green API webhook stream consumer.
+"""
+import signal
+from django.core.management.base import BaseCommand
+from apps.green_api.stream import WebhookStreamConsumer
+
+
+class Command(BaseCommand):
+    help = 'Consume Green API webhook events from the Redis stream in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--name', help='Consumer name (defaults to host-pid).')
+        parser.add_argument('--batch-size', type=int, help='Events read per batch.')
+        parser.add_argument('--block-ms', type=int, help='Milliseconds to block waiting for events.')
+
+    def handle(self, *args, **options):
+        consumer = WebhookStreamConsumer(
+            name=options.get('name'),
+            batch_size=options.get('batch_size'),
+            block_ms=options.get('block_ms')
+        )
+
+        def _stop(signum, frame):
+            consumer.stop()
+
+        signal.signal(signal.SIGTERM, _stop)
+        signal.signal(signal.SIGINT, _stop)
+
+        self.stdout.write(f"Starting webhook consumer {consumer.name}")
+        consumer.run()
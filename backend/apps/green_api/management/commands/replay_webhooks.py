@@ -0,0 +1,55 @@
+"""
+Management command that replays a webhook capture for load testing.
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from apps.green_api.replay import Replayer, read_capture
+
+
+class Command(BaseCommand):
+    help = 'Replay a webhook capture against the webhook handler or the HTTP endpoint.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('capture', help='Capture file written by capture_webhooks.')
+        parser.add_argument('--target', choices=['process', 'http'], default='process',
+                            help='Call process_webhook in-process or POST to --url.')
+        parser.add_argument('--url', help='Webhook endpoint for --target http.')
+        parser.add_argument('--token', default=None,
+                            help='Bearer token for --target http (defaults to GREEN_API_WEBHOOK_TOKEN).')
+        parser.add_argument('--speed', type=float, default=1.0,
+                            help='Replay speed multiplier, e.g. 1, 10 or 100; 0 sends without delays.')
+        parser.add_argument('--concurrency', type=int, default=8, help='Concurrent senders.')
+        parser.add_argument('--send-replies', action='store_true',
+                            help='Queue real auto-reply sends for --target process (off by default).')
+
+    def handle(self, *args, **options):
+        try:
+            replayer = Replayer(
+                target=options['target'],
+                speed=options['speed'],
+                concurrency=options['concurrency'],
+                url=options.get('url'),
+                token=options.get('token') or settings.GREEN_API_WEBHOOK_TOKEN,
+                send_replies=options['send_replies']
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(
+            f"Replaying {options['capture']} via {options['target']} "
+            f"at {options['speed']}x with {options['concurrency']} workers"
+        )
+        elapsed = replayer.run(read_capture(options['capture']))
+
+        self.stdout.write(
+            f"{'type':<24}{'events':>8}{'errors':>8}{'ev/s':>10}"
+            f"{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}{'q/event':>9}"
+        )
+        for row in replayer.stats.summary(elapsed):
+            queries = row['queries_per_event']
+            self.stdout.write(
+                f"{row['type']:<24}{row['events']:>8}{row['errors']:>8}{row['events_per_sec']:>10.1f}"
+                f"{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}{row['p99_ms']:>10.1f}{row['max_ms']:>10.1f}"
+                f"{(f'{queries:.1f}' if queries is not None else '-'):>9}"
+            )
+        self.stdout.write(self.style.SUCCESS(f"Replay finished in {elapsed:.1f}s"))
@@ -0,0 +1,201 @@
+"""
+Capture and replay of Green API webhook traffic for load testing.
+
+Captures are gzip-compressed NDJSON files, one event per line::
+
+    {"received_at": <epoch ms>, "payload": {...raw webhook...}}
+
+``capture_stream`` tails the ingestion stream without joining the consumer
+group, so capturing never takes events away from the real consumers.
+``Replayer`` feeds a capture back through ``process_webhook`` or the HTTP
+endpoint, keeping the original inter-arrival gaps divided by ``speed``.
+In-process replays do not send auto-replies unless ``send_replies`` is
+set; an HTTP replay is handled by the target server as it is configured.
+"""
+import gzip
+import json
+import logging
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from django.conf import settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from config.redis_client import get_redis
+from .stream import PAYLOAD_FIELD
+from .webhook_handler import process_webhook
+
+logger = logging.getLogger(__name__)
+
+
+def read_capture(path):
+    """Yield ``(received_at_ms, payload)`` pairs from a capture file."""
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            event = json.loads(line)
+            yield event['received_at'], event['payload']
+
+
+def capture_stream(path, sample=1.0, limit=None, duration=None, should_stop=None):
+    """Append new stream events to ``path``; returns the number written.
+
+    ``sample`` is the fraction of events kept. Capturing ends after
+    ``limit`` events, ``duration`` seconds or when ``should_stop()`` is true.
+    """
+    client = get_redis()
+    stream = settings.GREEN_API_WEBHOOK_STREAM
+    deadline = time.monotonic() + duration if duration else None
+    last_id = '$'
+    written = 0
+    with gzip.open(path, 'at', encoding='utf-8') as f:
+        while True:
+            if should_stop and should_stop():
+                break
+            if deadline and time.monotonic() >= deadline:
+                break
+            response = client.xread({stream: last_id}, count=500, block=1000)
+            for _, entries in response or []:
+                for entry_id, fields in entries:
+                    last_id = entry_id
+                    if sample < 1.0 and random.random() >= sample:
+                        continue
+                    received_at = int(entry_id.decode().split('-')[0])
+                    try:
+                        payload = json.loads(fields[PAYLOAD_FIELD.encode()])
+                    except (KeyError, ValueError):
+                        continue
+                    f.write(json.dumps({'received_at': received_at, 'payload': payload}) + '\n')
+                    written += 1
+                    if limit and written >= limit:
+                        return written
+    return written
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not values:
+        return 0.0
+    index = max(0, min(len(values) - 1, int(round(pct / 100 * len(values))) - 1))
+    return values[index]
+
+
+class ReplayStats:
+    """Per event type latency, query count and error tallies."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.queries = defaultdict(int)
+        self.errors = defaultdict(int)
+
+    def add(self, event_type, latency, queries=None, error=False):
+        with self._lock:
+            self.latencies[event_type].append(latency)
+            if queries is not None:
+                self.queries[event_type] += queries
+            if error:
+                self.errors[event_type] += 1
+
+    def summary(self, elapsed):
+        """Return one row per event type plus a total row."""
+        rows = []
+        everything = []
+        for event_type in sorted(self.latencies):
+            latencies = sorted(self.latencies[event_type])
+            everything.extend(latencies)
+            rows.append(self._row(event_type, latencies, self.queries.get(event_type),
+                                  self.errors[event_type], elapsed))
+        everything.sort()
+        total_queries = sum(self.queries.values()) if self.queries else None
+        rows.append(self._row('TOTAL', everything, total_queries,
+                              sum(self.errors.values()), elapsed))
+        return rows
+
+    @staticmethod
+    def _row(event_type, latencies, queries, errors, elapsed):
+        count = len(latencies)
+        return {
+            'type': event_type,
+            'events': count,
+            'errors': errors,
+            'events_per_sec': count / elapsed if elapsed else 0.0,
+            'p50_ms': percentile(latencies, 50) * 1000,
+            'p95_ms': percentile(latencies, 95) * 1000,
+            'p99_ms': percentile(latencies, 99) * 1000,
+            'max_ms': (latencies[-1] if latencies else 0.0) * 1000,
+            'queries_per_event': (queries / count) if queries is not None and count else None,
+        }
+
+
+class Replayer:
+    """Replays captured events against the handler or the HTTP endpoint.
+
+    Latency is measured from the moment an event was due, so it includes
+    time spent waiting for a free worker when the target falls behind.
+    """
+
+    def __init__(self, target='process', speed=1.0, concurrency=8, url=None, token=None,
+                 send_replies=False):
+        if target not in ('process', 'http'):
+            raise ValueError(f"Unknown replay target: {target}")
+        if target == 'http' and not url:
+            raise ValueError('An endpoint URL is required for HTTP replay')
+        self.target = target
+        self.speed = speed
+        self.concurrency = concurrency
+        self.url = url
+        self.token = token
+        self.send_replies = send_replies
+        self.stats = ReplayStats()
+        self._local = threading.local()
+
+    def run(self, events):
+        """Replay ``events`` and return the elapsed wall time in seconds."""
+        started = time.monotonic()
+        first_at = None
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            for received_at, payload in events:
+                if first_at is None:
+                    first_at = received_at
+                if self.speed > 0:
+                    due = started + (received_at - first_at) / 1000 / self.speed
+                    delay = due - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                else:
+                    due = time.monotonic()
+                pool.submit(self._send, payload, due)
+        return time.monotonic() - started
+
+    def _send(self, payload, due):
+        event_type = payload.get('type') or 'unknown'
+        queries = None
+        error = False
+        try:
+            if self.target == 'process':
+                with CaptureQueriesContext(connection) as ctx:
+                    result = process_webhook(payload, send_replies=self.send_replies)
+                queries = len(ctx.captured_queries)
+                error = (result or {}).get('status') == 'error'
+            else:
+                response = self._session().post(self.url, json=payload, timeout=30)
+                error = response.status_code >= 400
+        except Exception as e:
+            logger.warning(f"Replay of {event_type} event failed: {e}")
+            error = True
+        self.stats.add(event_type, time.monotonic() - due, queries, error)
+
+    def _session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            if self.token:
+                session.headers['Authorization'] = f'Bearer {self.token}'
+            self._local.session = session
+        return session
@@ -4,6 +4,7 @@ Green API service for WhatsApp integration.
 import requests
 import logging
 from django.conf import settings
+from apps.contacts.phones import to_chat_id
 
 logger = logging.getLogger(__name__)
 
@@ -51,7 +52,7 @@ class GreenAPIService:
     def send_message(self, phone, message):
         """Send a text message."""
         data = {
-            'chatId': f"{phone}@c.us",
+            'chatId': to_chat_id(phone),
             'message': message
         }
         return self._request('POST', f'/waInstance{self.id_instance}/sendMessage', data)
@@ -59,7 +60,7 @@ class GreenAPIService:
     def send_file(self, phone, file_url, file_name, caption=''):
         """Send a file message."""
         data = {
-            'chatId': f"{phone}@c.us",
+            'chatId': to_chat_id(phone),
             'urlFile': file_url,
             'fileName': file_name,
             'caption': caption
@@ -69,7 +70,7 @@ class GreenAPIService:
     def send_image(self, phone, image_url, caption=''):
         """Send an image message."""
         data = {
-            'chatId': f"{phone}@c.us",
+            'chatId': to_chat_id(phone),
             'urlFile': image_url,
             'caption': caption
         }
@@ -78,7 +79,7 @@ class GreenAPIService:
     def send_video(self, phone, video_url, caption=''):
         """Send a video message."""
         data = {
-            'chatId': f"{phone}@c.us",
+            'chatId': to_chat_id(phone),
             'urlFile': video_url,
             'caption': caption
         }
@@ -0,0 +1,161 @@
+"""
+Redis Stream transport for Green API webhooks.
+
+The webhook view appends the raw request body to a stream and returns
+straight away; consumer workers read the stream in batches and run the
+events through the webhook handler.
+"""
+import json
+import logging
+import os
+import socket
+import time
+import redis
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections
+from config.redis_client import get_redis
+from apps.messages.reconciler import StatusReconciler
+from .dedup import get_deduplicator
+from .webhook_handler import process_webhook_batch
+
+logger = logging.getLogger(__name__)
+
+PAYLOAD_FIELD = 'payload'
+
+
+def append_webhook(raw_body):
+    """Append a raw webhook body to the ingestion stream."""
+    return get_redis().xadd(
+        settings.GREEN_API_WEBHOOK_STREAM,
+        {PAYLOAD_FIELD: raw_body},
+        maxlen=settings.GREEN_API_WEBHOOK_STREAM_MAXLEN,
+        approximate=True
+    )
+
+
+class WebhookStreamConsumer:
+    """Consumer-group reader that processes webhook events in batches."""
+
+    def __init__(self, name=None, batch_size=None, block_ms=None):
+        self.redis = get_redis()
+        self.stream = settings.GREEN_API_WEBHOOK_STREAM
+        self.group = settings.GREEN_API_WEBHOOK_CONSUMER_GROUP
+        self.name = name or f"{socket.gethostname()}-{os.getpid()}"
+        self.batch_size = batch_size or settings.GREEN_API_WEBHOOK_BATCH_SIZE
+        self.block_ms = block_ms if block_ms is not None else settings.GREEN_API_WEBHOOK_BLOCK_MS
+        self.claim_idle_ms = settings.GREEN_API_WEBHOOK_CLAIM_IDLE_MS
+        self._claim_cursor = '0-0'
+        self._last_claim = 0
+        self._running = False
+        # Status events are coalesced across batches; their stream entries
+        # are only acknowledged once the reconciler has written them, and
+        # processed events are only marked as seen when acknowledged.
+        self.reconciler = StatusReconciler()
+        self._unacked = []
+        self._processed = []
+
+    def ensure_group(self):
+        """Create the consumer group (and stream) if it does not exist yet."""
+        try:
+            self.redis.xgroup_create(self.stream, self.group, id='0', mkstream=True)
+        except redis.exceptions.ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+
+    def claim_stale(self):
+        """Take over entries left pending by consumers that died mid-batch."""
+        now = time.monotonic()
+        if (now - self._last_claim) * 1000 < self.claim_idle_ms:
+            return []
+        self._last_claim = now
+        response = self.redis.xautoclaim(
+            self.stream, self.group, self.name,
+            min_idle_time=self.claim_idle_ms,
+            start_id=self._claim_cursor,
+            count=self.batch_size
+        )
+        self._claim_cursor = response[0]
+        return response[1]
+
+    def read_batch(self):
+        """Return the next batch of ``(entry_id, fields)`` pairs."""
+        entries = self.claim_stale()
+        if entries:
+            return entries
+        block_ms = self.block_ms
+        if self.reconciler.pending:
+            # Wake up in time to flush the coalescing window
+            block_ms = max(1, min(block_ms, int(self.reconciler.flush_seconds * 1000)))
+        response = self.redis.xreadgroup(
+            self.group, self.name, {self.stream: '>'},
+            count=self.batch_size,
+            block=block_ms
+        )
+        if not response:
+            return []
+        return response[0][1]
+
+    def process_batch(self, entries):
+        """Decode, process and acknowledge a batch of stream entries."""
+        events = []
+        for entry_id, fields in entries:
+            if not fields:
+                # Entry was trimmed from the stream while pending
+                continue
+            raw = fields.get(PAYLOAD_FIELD.encode()) or fields.get(PAYLOAD_FIELD)
+            try:
+                events.append(json.loads(raw))
+            except (TypeError, ValueError) as e:
+                logger.error(f"Dropping undecodable webhook {entry_id!r}: {e}")
+
+        if events:
+            close_old_connections()
+            process_webhook_batch(events, reconciler=self.reconciler, processed=self._processed)
+
+        self._unacked.extend(entry_id for entry_id, _ in entries)
+        if not self.reconciler.pending:
+            self.ack()
+        return len(events)
+
+    def flush(self, force=False):
+        """Write coalesced status events when due and acknowledge their entries."""
+        if force:
+            self.reconciler.flush()
+        else:
+            self.reconciler.flush_if_due()
+        if not self.reconciler.pending:
+            self.ack()
+
+    def ack(self):
+        """Acknowledge every processed entry and mark its event as seen."""
+        if self._unacked:
+            self.redis.xack(self.stream, self.group, *self._unacked)
+            self._unacked = []
+        if self._processed:
+            get_deduplicator().mark(self._processed)
+            self._processed = []
+
+    def run(self):
+        """Consume the stream until ``stop()`` is called."""
+        self.ensure_group()
+        self._running = True
+        logger.info(f"Webhook consumer {self.name} started on {self.stream}")
+        while self._running:
+            try:
+                entries = self.read_batch()
+                if entries:
+                    self.process_batch(entries)
+                self.flush()
+            except redis.exceptions.ConnectionError as e:
+                logger.error(f"Webhook stream connection error: {e}")
+                time.sleep(1)
+            except DatabaseError as e:
+                # The batch stays pending and is reclaimed once idle
+                logger.error(f"Database error processing webhooks: {e}")
+                time.sleep(1)
+        self.flush(force=True)
+        logger.info(f"Webhook consumer {self.name} stopped")
+
+    def stop(self):
+        """Ask the consume loop to exit after the current batch."""
+        self._running = False
@@ -0,0 +1,526 @@
+"""
+Unit tests for the green_api app.
+"""
+import gzip
+import json
+import os
+import tempfile
+import uuid
+from unittest.mock import patch
+
+import redis
+from django.test import TestCase, override_settings
+from rest_framework.test import APITestCase
+from rest_framework import status
+
+
+class WebhookViewTests(APITestCase):
+    """Tests for the Green API webhook endpoint."""
+
+    url = '/api/green-api/webhook/'
+
+    @patch('apps.green_api.views.append_webhook')
+    def test_webhook_is_appended_to_stream(self, mock_append):
+        """Test that a valid webhook is queued and acknowledged."""
+        payload = {'type': 'messageReceived', 'idMessage': 'ABC123'}
+
+        response = self.client.post(self.url, payload, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data['success'])
+        mock_append.assert_called_once()
+        self.assertEqual(json.loads(mock_append.call_args[0][0]), payload)
+
+    @patch('apps.green_api.views.append_webhook')
+    def test_webhook_without_type_is_rejected(self, mock_append):
+        """Test that payloads without an event type are rejected."""
+        response = self.client.post(self.url, {'idMessage': 'ABC123'}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        mock_append.assert_not_called()
+
+    @patch('apps.green_api.views.append_webhook')
+    def test_malformed_webhook_is_rejected(self, mock_append):
+        """Test that a non-JSON body is rejected."""
+        response = self.client.generic(
+            'POST', self.url, 'not-json', content_type='application/json'
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        mock_append.assert_not_called()
+
+    @override_settings(GREEN_API_WEBHOOK_TOKEN='secret')
+    @patch('apps.green_api.views.append_webhook')
+    def test_webhook_token_is_enforced(self, mock_append):
+        """Test that the configured webhook token is required."""
+        payload = {'type': 'messageReceived'}
+
+        response = self.client.post(self.url, payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        response = self.client.post(
+            self.url, payload, format='json', HTTP_AUTHORIZATION='Bearer secret'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        mock_append.assert_called_once()
+
+    @patch('apps.green_api.views.process_webhook_batch')
+    @patch('apps.green_api.views.append_webhook')
+    def test_falls_back_to_inline_processing(self, mock_append, mock_process):
+        """Test that webhooks are processed inline when Redis is down."""
+        mock_append.side_effect = redis.exceptions.ConnectionError('down')
+        payload = {'type': 'messageRead', 'idMessage': 'ABC123'}
+
+        response = self.client.post(self.url, payload, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        mock_process.assert_called_once_with([payload])
+
+
+class WebhookStreamConsumerTests(TestCase):
+    """Tests for the webhook stream consumer."""
+
+    @patch('apps.green_api.stream.get_deduplicator')
+    @patch('apps.green_api.stream.process_webhook_batch')
+    @patch('apps.green_api.stream.get_redis')
+    def test_process_batch_decodes_and_acks(self, mock_redis, mock_process, mock_dedup):
+        """Test that a batch is decoded, processed and acknowledged."""
+        from apps.green_api.stream import WebhookStreamConsumer
+
+        consumer = WebhookStreamConsumer(name='test')
+        event = {'type': 'messageRead', 'idMessage': 'A'}
+        mock_process.side_effect = lambda events, reconciler, processed: processed.extend(events)
+        entries = [
+            (b'1-0', {b'payload': b'{"type": "messageRead", "idMessage": "A"}'}),
+            (b'2-0', {b'payload': b'garbage'}),
+        ]
+
+        processed = consumer.process_batch(entries)
+
+        self.assertEqual(processed, 1)
+        mock_process.assert_called_once_with(
+            [event], reconciler=consumer.reconciler, processed=[event]
+        )
+        consumer.redis.xack.assert_called_once_with(
+            consumer.stream, consumer.group, b'1-0', b'2-0'
+        )
+        mock_dedup.return_value.mark.assert_called_once_with([event])
+
+    @patch('apps.green_api.stream.process_webhook_batch')
+    @patch('apps.green_api.stream.get_redis')
+    def test_database_error_leaves_batch_pending(self, mock_redis, mock_process):
+        """Test that a batch failing on the database is not acknowledged."""
+        from django.db import OperationalError
+        from apps.green_api.stream import WebhookStreamConsumer
+
+        consumer = WebhookStreamConsumer(name='test')
+        mock_process.side_effect = OperationalError('connection lost')
+        entries = [(b'1-0', {b'payload': b'{"type": "messageRead", "idMessage": "A"}'})]
+
+        with self.assertRaises(OperationalError):
+            consumer.process_batch(entries)
+        consumer.flush()
+
+        consumer.redis.xack.assert_not_called()
+
+    @patch('apps.green_api.webhook_handler.get_deduplicator')
+    @patch('apps.green_api.webhook_handler.process_webhook')
+    def test_only_database_errors_abort_the_batch(self, mock_process, mock_dedup):
+        """Test that bad events fail alone while database errors propagate."""
+        from django.db import OperationalError
+        from apps.green_api.webhook_handler import process_webhook_batch
+
+        mock_dedup.return_value.filter.side_effect = lambda events: events
+        events = [{'type': 'messageReceived', 'idMessage': 'A'}]
+        mock_process.side_effect = ValueError('bad payload')
+        self.assertEqual(process_webhook_batch(events)[0]['status'], 'error')
+
+        mock_process.side_effect = OperationalError('deadlock detected')
+        with self.assertRaises(OperationalError):
+            process_webhook_batch(events)
+
+
+class InboundMessageTests(TestCase):
+    """Tests for recording inbound messages."""
+
+    def setUp(self):
+        self.tenant_id = uuid.uuid4()
+
+    def _record(self, green_api_message_id='MSG1', text='Hello'):
+        from apps.green_api.inbound import record_inbound_message
+
+        return record_inbound_message(
+            tenant_id=self.tenant_id,
+            phone='+15550000001',
+            sender='15550000001@c.us',
+            message_type='text',
+            text=text,
+            media={},
+            green_api_message_id=green_api_message_id
+        )
+
+    def _rows(self, phone, text='Hello'):
+        from django.utils import timezone
+        from apps.chats.models import Chat
+        from apps.contacts.engagement import event_rank
+        from apps.contacts.models import Contact
+
+        now = timezone.now()
+        contact = Contact(
+            tenant_id=self.tenant_id, phone_number=phone, wa_id=phone[1:] + '@c.us',
+            source='chat', messages_received=1, last_message_at=now,
+            engagement_rank=event_rank('received', now)
+        )
+        chat = Chat(
+            tenant_id=self.tenant_id, phone_number=phone, unread_count=1,
+            last_message_preview=text, last_message_at=now
+        )
+        return contact, chat
+
+    def _upserts(self):
+        """Yield ``(phone, upsert)`` for each upsert path this database runs."""
+        from django.db import connection
+        from apps.green_api import inbound
+
+        yield '+15550000101', inbound._upsert_contact_and_chat_portable
+        if connection.vendor == 'postgresql':
+            yield '+15550000102', inbound._upsert_contact_and_chat
+
+    def test_upsert_creates_contact_and_chat(self):
+        """Test that a first message creates its contact and chat."""
+        from apps.chats.models import Chat
+        from apps.contacts.models import Contact
+
+        for phone, upsert in self._upserts():
+            with self.subTest(upsert=upsert.__name__):
+                contact_id, created = upsert(*self._rows(phone))
+
+                self.assertTrue(created)
+                contact = Contact.objects.get(pk=contact_id)
+                self.assertEqual(contact.messages_received, 1)
+                self.assertEqual(contact.source, 'chat')
+                chat = Chat.objects.get(tenant_id=self.tenant_id, phone_number=phone)
+                self.assertEqual(chat.unread_count, 1)
+                self.assertEqual(chat.last_message_preview, 'Hello')
+
+    def test_upsert_increments_existing_contact_and_chat(self):
+        """Test that a message for known rows bumps their counters."""
+        from apps.chats.models import Chat
+        from apps.contacts.models import Contact
+
+        for phone, upsert in self._upserts():
+            with self.subTest(upsert=upsert.__name__):
+                existing = Contact.objects.create(
+                    tenant_id=self.tenant_id, phone_number=phone, name='Ann', messages_received=3
+                )
+                Chat.objects.create(
+                    tenant_id=self.tenant_id, phone_number=phone, contact_name='Ann',
+                    unread_count=2, last_message_preview='Old'
+                )
+
+                contact_id, created = upsert(*self._rows(phone, text='New'))
+
+                self.assertFalse(created)
+                self.assertEqual(contact_id, existing.id)
+                contact = Contact.objects.get(pk=contact_id)
+                self.assertEqual(contact.messages_received, 4)
+                self.assertEqual(contact.name, 'Ann')
+                chat = Chat.objects.get(tenant_id=self.tenant_id, phone_number=phone)
+                self.assertEqual(chat.unread_count, 3)
+                self.assertEqual(chat.last_message_preview, 'New')
+
+    def test_upsert_names_new_chat_after_existing_contact(self):
+        """Test that a new chat for a known contact takes the contact's name."""
+        from apps.chats.models import Chat
+        from apps.contacts.models import Contact
+
+        for phone, upsert in self._upserts():
+            with self.subTest(upsert=upsert.__name__):
+                Contact.objects.create(tenant_id=self.tenant_id, phone_number=phone, name='Ann')
+
+                upsert(*self._rows(phone))
+
+                chat = Chat.objects.get(tenant_id=self.tenant_id, phone_number=phone)
+                self.assertEqual(chat.contact_name, 'Ann')
+                self.assertEqual(chat.unread_count, 1)
+
+    def test_message_row_is_inserted(self):
+        """Test the recorded message row."""
+        from apps.messages.models import Message
+
+        message_id, contact_id, _ = self._record(text='Hello there')
+
+        message = Message.objects.get(pk=message_id)
+        self.assertEqual(message.contact_id, contact_id)
+        self.assertEqual(message.direction, 'inbound')
+        self.assertEqual(message.content, 'Hello there')
+        self.assertEqual(message.phone_from, '+15550000001')
+        self.assertEqual(message.phone_to, 'self')
+        self.assertEqual(message.green_api_chat_id, '15550000001@c.us')
+        self.assertEqual(message.green_api_message_id, 'MSG1')
+        self.assertEqual(message.status, 'received')
+
+    def test_insert_row_prepares_values_like_save(self):
+        """Test that insert_row applies defaults, auto_now and overrides."""
+        from apps.chats.models import Chat
+        from config.sql import insert_columns, insert_row
+
+        _, chat = self._rows('+15550000001')
+        fields, columns = insert_columns(Chat)
+        placeholders, params = insert_row(Chat, chat, overrides={'contact_name': 'contact.name'})
+
+        self.assertEqual(len(columns.split(', ')), len(fields))
+        placeholders = placeholders.split(', ')
+        self.assertEqual(len(placeholders), len(fields))
+        self.assertEqual(placeholders[[field.name for field in fields].index('contact_name')], 'contact.name')
+        self.assertEqual(len(params), len(fields) - 1)
+        self.assertIsNotNone(chat.updated_at)
+        self.assertIn(chat.last_message_preview, params)
+
+    def test_insert_row_round_trips(self):
+        """Test that a hand-written INSERT stores the row Model.save() would."""
+        from django.db import connection
+        from apps.chats.models import Chat
+        from config.sql import insert_columns, insert_row
+
+        if connection.vendor != 'postgresql':
+            self.skipTest('insert_row casts are PostgreSQL syntax')
+        _, chat = self._rows('+15550000001')
+        _, columns = insert_columns(Chat)
+        placeholders, params = insert_row(Chat, chat)
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {Chat._meta.db_table} ({columns}) VALUES ({placeholders})", params
+            )
+
+        stored = Chat.objects.get(pk=chat.id)
+        self.assertEqual(stored.status, 'open')
+        self.assertEqual(stored.unread_count, 1)
+        self.assertEqual(stored.updated_at, chat.updated_at)
+
+    def test_redelivered_message_is_recorded_once(self):
+        """Test that a redelivery neither inserts nor counts the message again."""
+        from apps.chats.models import Chat
+        from apps.contacts.models import Contact
+        from apps.messages.models import Message
+
+        message_id, contact_id, created = self._record()
+        self.assertTrue(created)
+
+        self.assertEqual(self._record(), (message_id, contact_id, False))
+        self.assertEqual(Message.objects.filter(tenant_id=self.tenant_id).count(), 1)
+        self.assertEqual(Contact.objects.get(pk=contact_id).messages_received, 1)
+        self.assertEqual(Chat.objects.get(tenant_id=self.tenant_id).unread_count, 1)
+
+    @patch('apps.campaigns.tasks.send_single_message')
+    @patch('apps.green_api.webhook_handler.get_matcher')
+    def test_auto_reply_is_not_sent_when_replies_are_disabled(self, mock_matcher, mock_send):
+        """Test that replays can match auto-reply rules without sending."""
+        from apps.green_api.webhook_handler import GreenAPIWebhookHandler
+        from apps.messages.models import Message
+
+        mock_matcher.return_value.match.return_value = {
+            'name': 'Hi', 'message': 'Hello!', 'media_url': ''
+        }
+        handler = GreenAPIWebhookHandler({}, send_replies=False)
+
+        handler._process_auto_reply(self.tenant_id, '+15550000001', 'hi', None)
+
+        mock_send.delay.assert_not_called()
+        self.assertFalse(Message.objects.filter(tenant_id=self.tenant_id).exists())
+
+    @patch('apps.green_api.webhook_handler.resolve_instance')
+    @patch('apps.green_api.webhook_handler.GreenAPIWebhookHandler._process_auto_reply')
+    def test_redelivered_message_skips_auto_reply(self, mock_auto_reply, mock_resolve):
+        """Test that the handler only auto-replies to the first delivery."""
+        from apps.green_api.webhook_handler import process_webhook
+
+        mock_resolve.return_value = self.tenant_id
+        payload = {
+            'type': 'messageReceived',
+            'idMessage': 'MSG1',
+            'instanceData': {'idInstance': 1},
+            'messageData': {'sender': '15550000001@c.us', 'textMessage': {'text': 'Hi'}},
+        }
+
+        self.assertEqual(process_webhook(payload)['status'], 'success')
+        self.assertEqual(process_webhook(payload)['status'], 'duplicate')
+        mock_auto_reply.assert_called_once()
+
+
+class ContactAddedTests(TestCase):
+    """Tests for contactAdded webhooks."""
+
+    @patch('apps.green_api.webhook_handler.contacts_changed')
+    @patch('apps.green_api.webhook_handler.resolve_instance')
+    def test_wa_id_update_invalidates_segments(self, mock_resolve, mock_changed):
+        """Test that storing a contact's WhatsApp ID expires its tenant's counts."""
+        from apps.contacts.models import Contact
+        from apps.green_api.webhook_handler import process_webhook
+
+        tenant_id = uuid.uuid4()
+        mock_resolve.return_value = tenant_id
+        contact = Contact.objects.create(tenant_id=tenant_id, phone_number='+15550000001')
+
+        process_webhook({
+            'type': 'contactAdded',
+            'instanceData': {'idInstance': 1},
+            'contact': {'id': '15550000001@c.us'},
+        })
+
+        contact.refresh_from_db()
+        self.assertEqual(contact.wa_id, '15550000001@c.us')
+        mock_changed.assert_called_once_with(tenant_id)
+
+
+class WebhookDeduplicatorTests(TestCase):
+    """Tests for the webhook idempotency filter."""
+
+    def _deduplicator(self, seen_in_redis=()):
+        from apps.green_api.dedup import WebhookDeduplicator
+
+        deduplicator = WebhookDeduplicator(lru_size=2, bucket_seconds=60)
+        deduplicator._seen_in_redis = lambda keys: set(seen_in_redis) & set(keys)
+        deduplicator._mark_in_redis = lambda keys: None
+        return deduplicator
+
+    def test_redelivered_event_is_dropped(self):
+        """Test that the same event type and idMessage is processed once."""
+        deduplicator = self._deduplicator()
+        event = {'type': 'messageReceived', 'idMessage': 'A'}
+
+        self.assertEqual(deduplicator.filter([event, dict(event)]), [event])
+        self.assertEqual(deduplicator.filter([dict(event)]), [event])
+        deduplicator.mark([event])
+        self.assertEqual(deduplicator.filter([dict(event)]), [])
+
+    def test_different_event_types_are_kept(self):
+        """Test that sent and read events for one message are distinct."""
+        deduplicator = self._deduplicator()
+        events = [
+            {'type': 'messageSent', 'idMessage': 'A'},
+            {'type': 'messageRead', 'idMessage': 'A'},
+        ]
+
+        self.assertEqual(deduplicator.filter(events), events)
+
+    def test_events_without_id_are_not_deduplicated(self):
+        """Test that events without idMessage always pass through."""
+        deduplicator = self._deduplicator()
+        event = {'type': 'instanceStatusChanged'}
+
+        self.assertEqual(deduplicator.filter([event, event]), [event, event])
+
+    def test_events_seen_by_other_consumers_are_dropped(self):
+        """Test that keys already present in Redis are filtered."""
+        deduplicator = self._deduplicator(seen_in_redis={'messageReceived:B'})
+        events = [
+            {'type': 'messageReceived', 'idMessage': 'A'},
+            {'type': 'messageReceived', 'idMessage': 'B'},
+        ]
+
+        self.assertEqual(deduplicator.filter(events), events[:1])
+
+    def test_local_cache_is_bounded(self):
+        """Test that the in-process LRU evicts the oldest keys."""
+        deduplicator = self._deduplicator()
+        for message_id in 'ABC':
+            deduplicator.mark([{'type': 'messageReceived', 'idMessage': message_id}])
+
+        self.assertEqual(len(deduplicator._seen), 2)
+        self.assertNotIn('messageReceived:A', deduplicator._seen)
+
+    @patch('apps.green_api.webhook_handler.process_webhook')
+    def test_failed_event_is_processed_when_redelivered(self, mock_process):
+        """Test that only events that were processed are recorded in Redis."""
+        from django.db import OperationalError
+        from apps.green_api.dedup import WebhookDeduplicator
+        from apps.green_api.webhook_handler import process_webhook_batch
+
+        buckets = {}
+
+        class FakePipeline:
+            def __init__(self):
+                self.results = []
+
+            def sadd(self, name, *keys):
+                buckets.setdefault(name, set()).update(keys)
+                self.results.append(len(keys))
+
+            def expire(self, name, seconds):
+                self.results.append(True)
+
+            def smismember(self, name, keys):
+                self.results.append([int(key in buckets.get(name, ())) for key in keys])
+
+            def execute(self):
+                return self.results
+
+        event = {'type': 'messageReceived', 'idMessage': 'A'}
+        mock_process.return_value = {'status': 'success'}
+        with patch('apps.green_api.dedup.get_redis') as mock_redis:
+            mock_redis.return_value.pipeline.side_effect = lambda transaction: FakePipeline()
+            consumer = WebhookDeduplicator(bucket_seconds=60)
+            with patch('apps.green_api.webhook_handler.get_deduplicator', return_value=consumer):
+                mock_process.side_effect = OperationalError('connection lost')
+                with self.assertRaises(OperationalError):
+                    process_webhook_batch([event])
+                self.assertFalse(any(buckets.values()))
+
+                mock_process.side_effect = None
+                process_webhook_batch([event])
+                self.assertEqual(mock_process.call_count, 2)
+
+            other_consumer = WebhookDeduplicator(bucket_seconds=60)
+            self.assertEqual(other_consumer.filter([event]), [])
+
+
+class WebhookReplayTests(TestCase):
+    """Tests for webhook capture replay."""
+
+    def _capture(self, events):
+        handle, path = tempfile.mkstemp(suffix='.ndjson.gz')
+        os.close(handle)
+        self.addCleanup(os.remove, path)
+        with gzip.open(path, 'wt', encoding='utf-8') as f:
+            for received_at, payload in events:
+                f.write(json.dumps({'received_at': received_at, 'payload': payload}) + '\n')
+        return path
+
+    def test_read_capture(self):
+        """Test that capture files are read back in order."""
+        from apps.green_api.replay import read_capture
+        events = [(1000, {'type': 'messageReceived'}), (1500, {'type': 'messageRead'})]
+
+        self.assertEqual(list(read_capture(self._capture(events))), events)
+
+    @patch('apps.green_api.replay.process_webhook', return_value={'status': 'success'})
+    def test_replay_reports_per_type_stats(self, mock_process):
+        """Test that replay calls the handler and groups stats by event type."""
+        from apps.green_api.replay import Replayer, read_capture
+        path = self._capture([
+            (1000, {'type': 'messageReceived'}),
+            (1001, {'type': 'messageReceived'}),
+            (1002, {'type': 'messageRead'}),
+        ])
+        replayer = Replayer(speed=0, concurrency=2)
+
+        elapsed = replayer.run(read_capture(path))
+        rows = {row['type']: row for row in replayer.stats.summary(elapsed)}
+
+        self.assertEqual(mock_process.call_count, 3)
+        self.assertFalse(mock_process.call_args.kwargs['send_replies'])
+        self.assertEqual(rows['messageReceived']['events'], 2)
+        self.assertEqual(rows['messageRead']['events'], 1)
+        self.assertEqual(rows['TOTAL']['errors'], 0)
+        self.assertEqual(rows['TOTAL']['queries_per_event'], 0)
+
+    def test_percentile(self):
+        """Test nearest-rank percentiles."""
+        from apps.green_api.replay import percentile
+        values = list(range(1, 101))
+
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([], 95), 0.0)
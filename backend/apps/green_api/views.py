@@ -6,10 +6,15 @@ from rest_framework.response import Response
 from rest_framework import status
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
+from django.conf import settings
 from apps.tenants.models import Tenant
 from .service import get_green_api_service
+from .stream import append_webhook
+from .webhook_handler import process_webhook_batch
+import hmac
 import json
 import logging
+import redis
 
 logger = logging.getLogger(__name__)
 
@@ -54,23 +59,47 @@ class QRCodeView(APIView):
 
 @method_decorator(csrf_exempt, name='dispatch')
 class WebhookView(APIView):
-    """View for handling Green API webhooks."""
+    """View for handling Green API webhooks.
+    
+    The request is validated and its raw body appended to the webhook
+    stream; processing happens in the stream consumers.
+    """
+    
+    authentication_classes = []
+    permission_classes = []
     
     def post(self, request):
-        """Handle incoming webhook from Green API."""
+        """Acknowledge an incoming webhook from Green API."""
+        token = settings.GREEN_API_WEBHOOK_TOKEN
+        if token:
+            supplied = request.META.get('HTTP_AUTHORIZATION', '')
+            if not hmac.compare_digest(supplied, f'Bearer {token}'):
+                return Response(
+                    {'success': False, 'message': 'Invalid webhook token.'},
+                    status=status.HTTP_401_UNAUTHORIZED
+                )
+        
+        body = request.body
         try:
-            data = json.loads(request.body)
-            logger.info(f"Received webhook: {data}")
-            
-            # TODO: Process webhook based on type
-            # - messageReceived: Handle incoming message
-            # - messageSent: Update message status
-            # - instanceStatusChanged: Update instance status
-            
-            return Response({'success': True})
-        except Exception as e:
-            logger.error(f"Webhook error: {e}")
+            data = json.loads(body)
+        except ValueError as e:
+            logger.warning(f"Rejected malformed webhook: {e}")
             return Response(
-                {'success': False, 'message': str(e)},
+                {'success': False, 'message': 'Invalid JSON payload.'},
                 status=status.HTTP_400_BAD_REQUEST
             )
+        
+        if not isinstance(data, dict) or not data.get('type'):
+            return Response(
+                {'success': False, 'message': 'Missing webhook type.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            append_webhook(body)
+        except redis.exceptions.RedisError as e:
+            # Never lose an event: fall back to inline processing
+            logger.error(f"Webhook stream unavailable, processing inline: {e}")
+            process_webhook_batch([data])
+        
+        return Response({'success': True})
@@ -3,13 +3,18 @@ Webhook handler for Green API messages.
 """
 import json
 import logging
+from datetime import datetime, timezone as dt_timezone
 from django.utils import timezone
-from django.db import transaction
-from apps.tenants.models import Tenant
-from apps.contacts.models import Contact, ContactActivity
+from django.db import DatabaseError, transaction
+from apps.tenants.routing import resolve_instance
+from apps.contacts.models import Contact
+from apps.contacts.phones import from_chat_id
+from apps.contacts.segments import contacts_changed
 from apps.messages.models import Message
-from apps.chats.models import Chat, AutoReply
-from apps.campaigns.tasks import update_message_delivery_status
+from apps.messages.reconciler import StatusReconciler
+from apps.chats.matcher import get_matcher
+from .dedup import get_deduplicator
+from .inbound import record_inbound_message
 
 logger = logging.getLogger(__name__)
 
@@ -17,9 +22,11 @@ logger = logging.getLogger(__name__)
 class GreenAPIWebhookHandler:
     """Handler for Green API webhook events."""
     
-    def __init__(self, webhook_data):
+    def __init__(self, webhook_data, reconciler=None, send_replies=True):
         self.data = webhook_data
         self.event_type = webhook_data.get('type', '')
+        self.reconciler = reconciler
+        self.send_replies = send_replies
     
     def process(self):
         """Process the webhook based on event type."""
@@ -48,133 +55,86 @@ class GreenAPIWebhookHandler:
             media = message_data.get('fileMessage', {})
             
             # Normalize phone number
-            phone = sender.replace('@c.us', '').replace('@g.us', '')
+            phone = from_chat_id(sender)
+            if phone is None:
+                logger.warning(f"Ignoring message from unrecognised sender: {sender}")
+                return {'status': 'skipped', 'reason': 'Invalid sender'}
             
             # Find or create contact
-            tenant = self._find_tenant_by_phone(phone)
-            if not tenant:
-                logger.warning(f"No tenant found for phone: {phone}")
+            tenant_id = self._find_tenant_id()
+            if not tenant_id:
+                logger.warning(f"No tenant found for instance: {self._instance_id()}")
                 return {'status': 'skipped', 'reason': 'No tenant'}
             
-            contact, created = Contact.objects.get_or_create(
-                tenant_id=tenant.id,
-                phone_number=phone,
-                defaults={
-                    'wa_id': sender,
-                    'source': 'chat'
-                }
-            )
-            
-            # Create message
-            message = Message.objects.create(
-                tenant_id=tenant.id,
-                direction='inbound',
+            message_id, _, created = record_inbound_message(
+                tenant_id=tenant_id,
+                phone=phone,
+                sender=sender,
                 message_type=message_type,
-                content=text,
-                media_url=media.get('fileUrl', ''),
-                media_id=media.get('fileUniqueId', ''),
-                phone_from=phone,
-                phone_to='self',
-                green_api_chat_id=sender,
-                green_api_message_id=self.data.get('idMessage', ''),
-                status='received'
-            )
-            
-            # Update contact stats
-            contact.messages_received += 1
-            contact.last_message_at = timezone.now()
-            contact.save()
-            
-            # Log activity
-            ContactActivity.objects.create(
-                contact=contact,
-                activity_type='message_received',
-                description=f"Received: {text[:100]}"
+                text=text,
+                media=media,
+                green_api_message_id=self.data.get('idMessage', '')
             )
-            
-            # Update or create chat
-            chat, _ = Chat.objects.get_or_create(
-                tenant_id=tenant.id,
-                phone_number=phone,
-                defaults={'contact_name': contact.name}
-            )
-            chat.last_message_preview = text[:200]
-            chat.last_message_at = timezone.now()
-            chat.unread_count += 1
-            chat.save()
+            if not created:
+                logger.info(f"Incoming message already recorded: {message_id}")
+                return {'status': 'duplicate', 'message_id': message_id}
             
             # Check for auto-reply
-            self._process_auto_reply(tenant.id, phone, text, message.id)
+            self._process_auto_reply(tenant_id, phone, text, message_id)
             
-            logger.info(f"Incoming message processed: {message.id}")
-            return {'status': 'success', 'message_id': message.id}
+            logger.info(f"Incoming message processed: {message_id}")
+            return {'status': 'success', 'message_id': message_id}
             
+        except DatabaseError:
+            # Leave the stream entry pending so it is retried
+            raise
         except Exception as e:
             logger.error(f"Error handling message received: {e}")
             return {'status': 'error', 'message': str(e)}
     
     def handle_message_sent(self):
         """Handle outgoing message delivery confirmation."""
-        try:
-            message_id = self.data.get('idMessage', '')
-            chat_id = self.data.get('chatId', '')
-            
-            # Find message by Green API ID
-            message = Message.objects.filter(
-                green_api_message_id=message_id
-            ).first()
-            
-            if message:
-                message.status = 'delivered'
-                message.delivered_at = timezone.now()
-                message.save()
-                
-                # Update campaign stats
-                if message.campaign_id:
-                    from apps.campaigns.tasks import update_campaign_stats
-                    update_campaign_stats.delay(message.campaign_id)
-            
-            return {'status': 'success'}
-            
-        except Exception as e:
-            logger.error(f"Error handling message sent: {e}")
-            return {'status': 'error', 'message': str(e)}
+        return self._reconcile_status('delivered')
     
     def handle_message_read(self):
         """Handle message read confirmation."""
-        try:
-            message_id = self.data.get('idMessage', '')
-            
-            message = Message.objects.filter(
-                green_api_message_id=message_id
-            ).first()
-            
-            if message:
-                message.status = 'read'
-                message.read_at = timezone.now()
-                message.save()
-            
-            return {'status': 'success'}
-            
-        except Exception as e:
-            logger.error(f"Error handling message read: {e}")
-            return {'status': 'error', 'message': str(e)}
+        return self._reconcile_status('read')
+    
+    def _reconcile_status(self, status):
+        """Queue a status change on the reconciler (flushed immediately if unshared).
+        
+        Flush failures propagate: the reconciler keeps the events and the
+        stream entries must stay unacknowledged until they are written.
+        """
+        reconciler = self.reconciler or StatusReconciler()
+        reconciler.add(self.data.get('idMessage', ''), status, self._event_time())
+        if reconciler is not self.reconciler:
+            reconciler.flush()
+        return {'status': 'success'}
+    
+    def _event_time(self):
+        """Return the webhook's event timestamp, falling back to now."""
+        timestamp = self.data.get('timestamp')
+        if timestamp:
+            try:
+                return datetime.fromtimestamp(int(timestamp), tz=dt_timezone.utc)
+            except (TypeError, ValueError, OverflowError):
+                pass
+        return timezone.now()
     
     def handle_status_changed(self):
         """Handle instance status changes."""
         try:
             instance_data = self.data.get('instanceData', {})
             status = instance_data.get('state', '')
-            chat_id = instance_data.get('chatId', '')
             
             # Find tenant by Green API instance
-            phone = chat_id.replace('@c.us', '') if chat_id else ''
-            tenant = self._find_tenant_by_phone(phone)
+            tenant_id = self._find_tenant_id()
             
-            if tenant:
+            if tenant_id:
                 # Update instance status
                 # This could trigger notifications or logging
-                logger.info(f"Tenant {tenant.id} instance status: {status}")
+                logger.info(f"Tenant {tenant_id} instance status: {status}")
             
             return {'status': 'success'}
             
@@ -186,15 +146,20 @@ class GreenAPIWebhookHandler:
         """Handle contact added event."""
         try:
             contact_data = self.data.get('contact', {})
-            phone = contact_data.get('id', '').replace('@c.us', '')
+            phone = from_chat_id(contact_data.get('id', ''))
             
-            contact = Contact.objects.filter(phone_number=phone).first()
-            if contact:
-                contact.wa_id = contact_data.get('id', '')
-                contact.save()
+            tenant_id = self._find_tenant_id()
+            if tenant_id and phone:
+                updated = Contact.objects.filter(tenant_id=tenant_id, phone_number=phone).update(
+                    wa_id=contact_data.get('id', '')
+                )
+                if updated:
+                    contacts_changed(tenant_id)
             
             return {'status': 'success'}
             
+        except DatabaseError:
+            raise
         except Exception as e:
             logger.error(f"Error handling contact added: {e}")
             return {'status': 'error', 'message': str(e)}
@@ -202,57 +167,88 @@ class GreenAPIWebhookHandler:
     def _process_auto_reply(self, tenant_id, phone, message_text, message_id):
         """Process auto-reply rules for incoming message."""
         try:
-            rules = AutoReply.objects.filter(
+            rule = get_matcher(tenant_id).match(message_text)
+            if rule is None:
+                return
+            if not self.send_replies:
+                logger.debug(f"Auto-reply not sent to {phone} (replies disabled): {rule['name']}")
+                return
+            
+            # Create and queue reply message
+            reply_message = Message.objects.create(
                 tenant_id=tenant_id,
-                is_active=True
-            ).order_by('-priority')
+                direction='outbound',
+                message_type='text',
+                content=rule['message'],
+                media_url=rule['media_url'],
+                phone_from='self',
+                phone_to=phone,
+                status='queued'
+            )
             
-            for rule in rules:
-                matched = False
-                
-                if rule.trigger_type == 'keyword':
-                    matched = rule.trigger_value.lower() in message_text.lower()
-                elif rule.trigger_type == 'exact':
-                    matched = message_text.lower() == rule.trigger_value.lower()
-                elif rule.trigger_type == 'always':
-                    matched = True
-                
-                if matched:
-                    # Create and queue reply message
-                    reply_message = Message.objects.create(
-                        tenant_id=tenant_id,
-                        direction='outbound',
-                        message_type='text',
-                        content=rule.message,
-                        media_url=rule.media_url,
-                        phone_from='self',
-                        phone_to=phone,
-                        status='queued'
-                    )
-                    
-                    # Queue sending task
-                    from apps.campaigns.tasks import send_single_message
-                    send_single_message.delay(reply_message.id)
-                    
-                    logger.info(f"Auto-reply sent to {phone}: {rule.name}")
-                    break
+            # Queue sending task
+            from apps.campaigns.tasks import send_single_message
+            send_single_message.delay(reply_message.id)
+            
+            logger.info(f"Auto-reply sent to {phone}: {rule['name']}")
                     
         except Exception as e:
             logger.error(f"Error processing auto-reply: {e}")
     
-    def _find_tenant_by_phone(self, phone):
-        """Find tenant associated with a phone number."""
-        # In a multi-tenant system, we need another way to identify the tenant
-        # This could be done by:
-        # 1. Matching with tenant's configured phone number
-        # 2. Using a mapping table
-        # 3. Using the first active tenant (for single-tenant scenarios)
-        
-        # For now, return the first active tenant
-        return Tenant.objects.filter(is_active=True).first()
+    def _instance_id(self):
+        """Return the Green API instance ID the webhook was sent for."""
+        return self.data.get('instanceData', {}).get('idInstance')
+    
+    def _find_tenant_id(self):
+        """Resolve the webhook's tenant from the instance routing index."""
+        return resolve_instance(self._instance_id())
 
 
-def process_webhook(webhook_data):
-    """Main entry point for processing webhooks."""
-    handler = GreenAPIWebhookHandler(webhook_data)
+def process_webhook(webhook_data, reconciler=None, send_replies=True):
+    """Main entry point for processing webhooks.
+    
+    ``send_replies=False`` still matches auto-reply rules but neither
+    records nor queues the reply (used when replaying captures).
+    """
+    handler = GreenAPIWebhookHandler(webhook_data, reconciler=reconciler, send_replies=send_replies)
     return handler.process()
+
+
+def process_webhook_batch(events, reconciler=None, processed=None):
+    """Process a batch of webhook payloads read from the ingestion stream.
+    
+    Redelivered events are dropped before any DB work. Status events are
+    coalesced on ``reconciler``; when none is supplied a batch-local one is
+    used and flushed before returning. Database errors propagate, so the
+    caller leaves the batch unacknowledged for redelivery; other failures
+    (bad payloads) only fail their own event.
+    
+    Events that succeed are appended to ``processed`` as they finish, for
+    the caller to mark as seen once they are durable; without it they are
+    marked before returning.
+    """
+    deduplicator = get_deduplicator()
+    events = deduplicator.filter(events)
+    owns_reconciler = reconciler is None
+    if owns_reconciler:
+        reconciler = StatusReconciler()
+    
+    results = []
+    succeeded = processed if processed is not None else []
+    for webhook_data in events:
+        try:
+            result = process_webhook(webhook_data, reconciler=reconciler)
+        except DatabaseError:
+            raise
+        except Exception as e:
+            logger.error(f"Error processing webhook batch entry: {e}")
+            result = {'status': 'error', 'message': str(e)}
+        results.append(result)
+        if result.get('status') != 'error':
+            succeeded.append(webhook_data)
+    
+    if owns_reconciler:
+        reconciler.flush()
+    if processed is None:
+        deduplicator.mark(succeeded)
+    return results
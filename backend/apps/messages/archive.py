@@ -0,0 +1,169 @@
+"""
+Cold storage for a tenant's old messages.
+
+``archive_tenant_messages`` moves messages older than a number of days
+out of Postgres, oldest first, into NDJSON.gz files of at most
+``MESSAGE_ARCHIVE_FILE_ROWS`` rows in the default storage (``MEDIA_ROOT``
+or S3 through django-storages)::
+
+    <PARTITION_ARCHIVE_PREFIX>/messages/<tenant_id>/<first created_at>-<id>.ndjson.gz
+
+Each file gets a ``MessageArchive`` manifest row with its time range, and
+only then are its rows deleted, ``MESSAGE_ARCHIVE_BATCH_SIZE`` IDs per
+statement read back from the file itself. A run that stops half-way
+finishes the purge next time; a file uploaded without a manifest row is
+never read and its rows are archived again.
+
+``iter_archived_messages`` is the lazy query path: it opens only the
+files whose range overlaps the requested one and streams their rows.
+"""
+import gzip
+import json
+import logging
+import tempfile
+import uuid
+from datetime import timedelta
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from apps.tenants.versions import MESSAGES, bump_version
+from .models import Message, MessageArchive
+
+logger = logging.getLogger(__name__)
+
+# Fields iter_archived_messages can match on
+ARCHIVE_FILTERS = (
+    'contact_id', 'campaign_id', 'direction', 'status', 'phone_from', 'phone_to',
+    'green_api_message_id', 'green_api_chat_id',
+)
+
+
+def _batches(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _read(path):
+    """Stream the rows of an archive file."""
+    with default_storage.open(path, 'rb') as f, gzip.open(f, 'rt') as lines:
+        for line in lines:
+            yield json.loads(line)
+
+
+def _write_file(tenant_id, cutoff):
+    """Archive the tenant's oldest messages before ``cutoff`` to one file."""
+    fields = [field.attname for field in Message._meta.concrete_fields]
+    encode = DjangoJSONEncoder(separators=(',', ':')).encode
+    batch_size = settings.MESSAGE_ARCHIVE_BATCH_SIZE
+    queryset = Message.objects.filter(tenant_id=tenant_id, created_at__lt=cutoff).order_by('created_at', 'id')
+    first = last = None
+    rows = 0
+    with tempfile.TemporaryFile() as tmp:
+        with gzip.GzipFile(fileobj=tmp, mode='wb') as gz:
+            while rows < settings.MESSAGE_ARCHIVE_FILE_ROWS:
+                page = queryset
+                if last is not None:
+                    page = page.filter(
+                        Q(created_at__gt=last['created_at'])
+                        | Q(created_at=last['created_at'], id__gt=last['id'])
+                    )
+                limit = min(batch_size, settings.MESSAGE_ARCHIVE_FILE_ROWS - rows)
+                batch = list(page.values(*fields)[:limit])
+                if not batch:
+                    break
+                gz.write(''.join(f'{encode(row)}\n' for row in batch).encode())
+                first = first or batch[0]
+                last = batch[-1]
+                rows += len(batch)
+        if not rows:
+            return None
+        tmp.seek(0)
+        path = default_storage.save(
+            f"{settings.PARTITION_ARCHIVE_PREFIX}/{Message._meta.db_table}/{tenant_id}/"
+            f"{first['created_at']:%Y%m%d%H%M%S}-{uuid.uuid4().hex[:8]}.ndjson.gz",
+            File(tmp)
+        )
+    return MessageArchive.objects.create(
+        tenant_id=tenant_id, path=path, row_count=rows,
+        first_created_at=first['created_at'], last_created_at=last['created_at']
+    )
+
+
+def _purge(archive):
+    """Delete an archive's rows from messages; returns the number deleted."""
+    deleted = 0
+    ids = (row['id'] for row in _read(archive.path))
+    for batch in _batches(ids, settings.MESSAGE_ARCHIVE_BATCH_SIZE):
+        # The time range lets partitioned tables skip other months
+        rows = Message.objects.filter(
+            tenant_id=archive.tenant_id, id__in=batch,
+            created_at__range=(archive.first_created_at, archive.last_created_at)
+        )
+        # A plain DELETE: per-row post_delete signals would load every row
+        # and bump the tenant's version once per message
+        deleted += rows._raw_delete(rows.db)
+    archive.purged_at = timezone.now()
+    archive.save(update_fields=['purged_at'])
+    return deleted
+
+
+def archive_tenant_messages(tenant_id, older_than_days):
+    """Move a tenant's messages older than ``older_than_days`` to cold storage."""
+    days = max(older_than_days, settings.MESSAGE_ARCHIVE_MIN_DAYS)
+    cutoff = timezone.now() - timedelta(days=days)
+    stats = {'files': 0, 'archived': 0, 'deleted': 0}
+    for archive in MessageArchive.objects.filter(tenant_id=tenant_id, purged_at__isnull=True):
+        stats['deleted'] += _purge(archive)
+    while True:
+        archive = _write_file(tenant_id, cutoff)
+        if archive is None:
+            break
+        stats['files'] += 1
+        stats['archived'] += archive.row_count
+        stats['deleted'] += _purge(archive)
+        logger.info(f"Archived {archive.row_count} messages of tenant {tenant_id} to {archive.path}")
+    if stats['deleted']:
+        bump_version(tenant_id, MESSAGES)
+    return stats
+
+
+def iter_archived_messages(tenant_id, start=None, end=None, after=None, **filters):
+    """Yield a tenant's archived messages in ``[start, end)`` oldest first.
+
+    ``filters`` match fields in ``ARCHIVE_FILTERS`` exactly. ``after`` is
+    the ``(created_at, id)`` of the last row already seen; only rows past
+    it are yielded. Rows are read lazily, so stop iterating to stop reading.
+    """
+    unknown = set(filters) - set(ARCHIVE_FILTERS)
+    if unknown:
+        raise ValueError(f"Cannot filter archived messages by {', '.join(sorted(unknown))}")
+    expected = {field: str(value) for field, value in filters.items() if value is not None}
+    archives = MessageArchive.objects.filter(tenant_id=tenant_id)
+    if start:
+        archives = archives.filter(last_created_at__gte=start)
+    if end:
+        archives = archives.filter(first_created_at__lt=end)
+    if after:
+        after = (after[0], str(after[1]))
+        archives = archives.filter(last_created_at__gte=after[0])
+    for archive in archives.order_by('first_created_at', 'last_created_at').iterator():
+        for row in _read(archive.path):
+            created_at = parse_datetime(row['created_at'])
+            if start and created_at < start:
+                continue
+            if after and (created_at, row['id']) <= after:
+                continue
+            if end and created_at >= end:
+                break
+            if all(str(row.get(field)) == value for field, value in expected.items()):
+                yield row
@@ -0,0 +1,40 @@
+"""
+Short-lived Redis map from Green API ``idMessage`` to message and campaign IDs.
+
+Entries are written when a send succeeds so that status webhooks can be
+resolved to a primary key without looking the message up in Postgres.
+"""
+import logging
+from django.conf import settings
+from config.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'green_api:msgid:'
+
+
+def _key(green_api_message_id):
+    return f"{KEY_PREFIX}{green_api_message_id}"
+
+
+def remember(green_api_message_id, message_id, campaign_id=None):
+    """Record the message (and campaign) a Green API ID belongs to."""
+    if not green_api_message_id:
+        return
+    value = f"{message_id}:{campaign_id or ''}"
+    get_redis().set(_key(green_api_message_id), value, ex=settings.MESSAGE_ID_MAP_TTL)
+
+
+def resolve_many(green_api_message_ids):
+    """Return ``{green_api_message_id: (message_id, campaign_id)}`` for known IDs."""
+    green_api_message_ids = list(green_api_message_ids)
+    if not green_api_message_ids:
+        return {}
+    values = get_redis().mget([_key(gid) for gid in green_api_message_ids])
+    resolved = {}
+    for gid, value in zip(green_api_message_ids, values):
+        if value is None:
+            continue
+        message_id, _, campaign_id = value.decode().partition(':')
+        resolved[gid] = (message_id, campaign_id or None)
+    return resolved
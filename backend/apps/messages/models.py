@@ -12,6 +12,10 @@ class Message(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     tenant_id = models.UUIDField()
     
+    # Related records (plain UUIDs, like tenant_id)
+    contact_id = models.UUIDField(null=True, blank=True)
+    campaign_id = models.UUIDField(null=True, blank=True)
+    
     # Message direction
     DIRECTION_CHOICES = [
         ('outbound', 'Outbound'),
@@ -52,6 +56,17 @@ class Message(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
     status_description = models.CharField(max_length=200, blank=True)
     
+    # Statuses only ever move to a higher rank, so late or redelivered
+    # events can be discarded with a conditional update
+    STATUS_RANKS = {
+        'queued': 0,
+        'sent': 1,
+        'failed': 2,
+        'delivered': 3,
+        'read': 4,
+    }
+    status_rank = models.SmallIntegerField(default=0)
+    
     # Green API message ID
     green_api_message_id = models.CharField(max_length=100, blank=True)
     green_api_chat_id = models.CharField(max_length=100, blank=True)
@@ -64,18 +79,57 @@ class Message(models.Model):
     
     class Meta:
         db_table = 'messages'
+        # Partitioned by month of created_at on PostgreSQL (see
+        # apps.messages.signals); every index is built per partition
         indexes = [
-            models.Index(fields=['tenant_id']),
-            models.Index(fields=['direction']),
-            models.Index(fields=['status']),
-            models.Index(fields=['phone_from']),
-            models.Index(fields=['phone_to']),
-            models.Index(fields=['created_at']),
+            models.Index(fields=['tenant_id', 'created_at', 'id']),
+            models.Index(fields=['campaign_id', 'status']),
+            models.Index(fields=['contact_id', 'created_at']),
+            # Status webhooks resolve messages by Green API ID. Not unique:
+            # a partitioned table cannot enforce a key without created_at,
+            # so redelivered inbound messages are caught by
+            # apps.green_api.inbound instead
+            models.Index(
+                fields=['green_api_message_id'],
+                condition=~models.Q(green_api_message_id=''),
+                name='messages_green_api_id_idx'
+            ),
         ]
         ordering = ['-created_at']
     
     def __str__(self):
         return f"{self.direction} - {self.phone_from} -> {self.phone_to}"
+    
+    def save(self, *args, **kwargs):
+        self.status_rank = self.STATUS_RANKS.get(self.status, 0)
+        super().save(*args, **kwargs)
+
+
+class MessageArchive(models.Model):
+    """Manifest entry for a file of a tenant's archived messages."""
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    tenant_id = models.UUIDField()
+    
+    # NDJSON.gz file in the default storage, rows ordered by created_at
+    path = models.CharField(max_length=500)
+    first_created_at = models.DateTimeField()
+    last_created_at = models.DateTimeField()
+    row_count = models.IntegerField(default=0)
+    
+    # Set once the archived rows are deleted from messages
+    purged_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        db_table = 'message_archives'
+        indexes = [
+            models.Index(fields=['tenant_id', 'first_created_at']),
+        ]
+        ordering = ['first_created_at']
+    
+    def __str__(self):
+        return f"Archive {self.path} ({self.row_count} messages)"
 
 
 class ScheduledMessage(models.Model):
@@ -115,6 +169,7 @@ class ScheduledMessage(models.Model):
             models.Index(fields=['tenant_id']),
             models.Index(fields=['scheduled_at']),
             models.Index(fields=['status']),
+            models.Index(fields=['tenant_id', 'created_at', 'id']),
         ]
     
     def __str__(self):
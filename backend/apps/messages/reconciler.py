@@ -0,0 +1,255 @@
+"""
+Coalesced delivery/read status updates for messages.
+
+Status webhooks are buffered for a short window, collapsed to the highest
+status per message and applied in one statement together with the
+matching campaign counter increments and the engagement of contacts who
+read their messages.
+"""
+import logging
+import time
+from collections import defaultdict
+import redis
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from apps.campaigns.models import Campaign
+from apps.contacts.engagement import ADD_RANK_SQL, add_rank, event_rank
+from apps.contacts.models import Contact
+from apps.contacts.segments import ENGAGEMENT_RESOURCE
+from apps.tenants.versions import CAMPAIGNS, MESSAGES, bump_version
+from . import id_map
+from .models import Message
+
+logger = logging.getLogger(__name__)
+
+STATUS_RANKS = Message.STATUS_RANKS
+
+RECONCILED_STATUSES = ('delivered', 'read')
+
+
+class StatusReconciler:
+    """Buffers status events and applies them in bulk."""
+
+    def __init__(self, key_field='green_api_message_id', flush_seconds=None, flush_size=None):
+        self.key_field = key_field
+        self.flush_seconds = (
+            settings.GREEN_API_STATUS_FLUSH_SECONDS if flush_seconds is None else flush_seconds
+        )
+        self.flush_size = flush_size or settings.GREEN_API_STATUS_FLUSH_SIZE
+        self._pending = {}
+        self._first_event_at = None
+
+    @property
+    def pending(self):
+        return len(self._pending)
+
+    def add(self, key, status, event_at=None):
+        """Buffer a status event, keeping only the highest status per message."""
+        if status not in RECONCILED_STATUSES:
+            raise ValueError(f"Unsupported status for reconciliation: {status}")
+        if not key:
+            return
+        key = str(key)
+        event_at = event_at or timezone.now()
+        current = self._pending.get(key)
+        if current is None or STATUS_RANKS[status] > STATUS_RANKS[current[0]]:
+            self._pending[key] = (status, event_at)
+        if self._first_event_at is None:
+            self._first_event_at = time.monotonic()
+        if len(self._pending) >= self.flush_size:
+            self.flush()
+
+    def flush_if_due(self):
+        """Flush the buffer once the coalescing window has elapsed."""
+        if self._first_event_at is None:
+            return 0
+        if time.monotonic() - self._first_event_at >= self.flush_seconds:
+            return self.flush()
+        return 0
+
+    def flush(self):
+        """Apply all buffered events; returns the number of messages changed.
+
+        On failure the events go back into the buffer and the error is
+        raised, so callers keep their stream entries unacknowledged.
+        """
+        pending, self._pending = self._pending, {}
+        self._first_event_at = None
+        if not pending:
+            return 0
+        try:
+            changed = 0
+            tenants = set()
+            engaged = set()
+            for key_field, group in self._resolve(pending).items():
+                if not group:
+                    continue
+                if connection.vendor == 'postgresql':
+                    count, touched, readers = self._apply_postgresql(group, key_field)
+                else:
+                    count, touched, readers = self._apply_portable(group, key_field)
+                changed += count
+                tenants.update(touched)
+                engaged.update(readers)
+            for tenant_id in tenants:
+                bump_version(tenant_id, MESSAGES)
+                bump_version(tenant_id, CAMPAIGNS)
+            for tenant_id in engaged:
+                bump_version(tenant_id, ENGAGEMENT_RESOURCE)
+            return changed
+        except Exception as e:
+            logger.error(f"Error applying {len(pending)} status updates: {e}")
+            self._restore(pending)
+            raise
+
+    def _restore(self, pending):
+        """Merge events from a failed flush back into the buffer."""
+        for key, event in pending.items():
+            current = self._pending.get(key)
+            if current is None or STATUS_RANKS[event[0]] > STATUS_RANKS[current[0]]:
+                self._pending[key] = event
+        if self._first_event_at is None:
+            self._first_event_at = time.monotonic()
+
+    def _resolve(self, pending):
+        """Split events into those keyed by primary key and the rest.
+
+        Green API IDs found in the Redis ID map are rewritten to message
+        primary keys; misses fall back to the indexed Green API ID column.
+        """
+        if self.key_field != 'green_api_message_id':
+            return {self.key_field: pending}
+        try:
+            known = id_map.resolve_many(pending)
+        except redis.exceptions.RedisError as e:
+            logger.warning(f"Message ID map unavailable: {e}")
+            known = {}
+        by_id = {}
+        by_green_api_id = {}
+        for key, event in pending.items():
+            if key in known:
+                by_id[known[key][0]] = event
+            else:
+                by_green_api_id[key] = event
+        return {'id': by_id, 'green_api_message_id': by_green_api_id}
+
+    def _apply_postgresql(self, pending, key_field):
+        """One statement: update messages, then bump campaign counters and engagement.
+
+        Returns the number of messages changed, the tenants they belong to
+        and the tenants whose contacts' engagement moved.
+        """
+        key_cast = '::uuid' if key_field == 'id' else ''
+        values = []
+        params = []
+        for key, (status, event_at) in pending.items():
+            values.append(f"(%s{key_cast}, %s, %s, %s::timestamptz)")
+            params.extend([key, status, STATUS_RANKS[status], event_at])
+
+        sql = f"""
+            WITH updates (key, status, rank, event_at) AS (
+                VALUES {', '.join(values)}
+            ),
+            changed AS (
+                UPDATE {Message._meta.db_table} AS m
+                SET status = u.status,
+                    status_rank = u.rank,
+                    delivered_at = COALESCE(m.delivered_at, u.event_at),
+                    read_at = CASE WHEN u.rank >= {STATUS_RANKS['read']}
+                                   THEN COALESCE(m.read_at, u.event_at)
+                                   ELSE m.read_at END
+                FROM updates AS u, {Message._meta.db_table} AS old
+                WHERE m.{key_field} = u.key
+                  AND old.id = m.id
+                  AND m.status_rank < u.rank
+                RETURNING m.campaign_id, m.tenant_id, m.contact_id,
+                          old.status_rank AS old_rank, u.rank AS new_rank
+            ),
+            counters AS (
+                SELECT campaign_id,
+                       COUNT(*) FILTER (WHERE old_rank < {STATUS_RANKS['delivered']}) AS delivered,
+                       COUNT(*) FILTER (WHERE new_rank >= {STATUS_RANKS['read']}
+                                        AND old_rank < {STATUS_RANKS['read']}) AS read
+                FROM changed
+                WHERE campaign_id IS NOT NULL
+                GROUP BY campaign_id
+            ),
+            bumped AS (
+                UPDATE {Campaign._meta.db_table} AS c
+                SET delivered_count = c.delivered_count + counters.delivered,
+                    read_count = c.read_count + counters.read
+                FROM counters
+                WHERE c.id = counters.campaign_id
+                RETURNING c.id
+            ),
+            reads AS (
+                SELECT contact_id, %s + LN(COUNT(*)) / LN(2) AS rank
+                FROM changed
+                WHERE contact_id IS NOT NULL
+                  AND new_rank >= {STATUS_RANKS['read']} AND old_rank < {STATUS_RANKS['read']}
+                GROUP BY contact_id
+            ),
+            engaged AS (
+                UPDATE {Contact._meta.db_table} AS ct
+                SET engagement_rank = {ADD_RANK_SQL.format(rank='ct.engagement_rank', other='reads.rank')}
+                FROM reads
+                WHERE ct.id = reads.contact_id
+                RETURNING ct.tenant_id
+            )
+            SELECT (SELECT COUNT(*) FROM changed), (SELECT COUNT(*) FROM bumped),
+                   ARRAY(SELECT DISTINCT tenant_id::text FROM changed),
+                   ARRAY(SELECT DISTINCT tenant_id::text FROM engaged)
+        """
+        params.append(event_rank('read'))
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            changed, campaigns, tenants, engaged = cursor.fetchone()
+        logger.debug(f"Reconciled {changed} of {len(pending)} status events "
+                     f"across {campaigns} campaigns")
+        return changed, tenants, engaged
+
+    def _apply_portable(self, pending, key_field):
+        """Fallback for non-PostgreSQL databases (development)."""
+        messages = Message.objects.filter(
+            **{f'{key_field}__in': list(pending)}
+        ).only('id', 'tenant_id', 'campaign_id', 'contact_id', 'status', 'status_rank',
+               'delivered_at', 'read_at', key_field)
+
+        changed = []
+        counters = defaultdict(lambda: [0, 0])
+        reads = defaultdict(int)
+        for message in messages:
+            status, event_at = pending[str(getattr(message, key_field))]
+            old_rank = message.status_rank
+            new_rank = STATUS_RANKS[status]
+            if old_rank >= new_rank:
+                continue
+            message.status = status
+            message.status_rank = new_rank
+            message.delivered_at = message.delivered_at or event_at
+            if status == 'read':
+                message.read_at = message.read_at or event_at
+                if message.contact_id and old_rank < STATUS_RANKS['read']:
+                    reads[message.contact_id] += 1
+            changed.append(message)
+            if message.campaign_id:
+                if old_rank < STATUS_RANKS['delivered']:
+                    counters[message.campaign_id][0] += 1
+                if new_rank >= STATUS_RANKS['read']:
+                    counters[message.campaign_id][1] += 1
+
+        with transaction.atomic():
+            Message.objects.bulk_update(changed, ['status', 'status_rank', 'delivered_at', 'read_at'])
+            for campaign_id, (delivered, read) in counters.items():
+                Campaign.objects.filter(id=campaign_id).update(
+                    delivered_count=F('delivered_count') + delivered,
+                    read_count=F('read_count') + read
+                )
+            for contact_id, count in reads.items():
+                Contact.objects.filter(id=contact_id).update(
+                    engagement_rank=add_rank(event_rank('read', count=count))
+                )
+        readers = {message.tenant_id for message in changed if message.contact_id in reads}
+        return len(changed), {message.tenant_id for message in changed}, readers
@@ -0,0 +1,23 @@
+"""
+Signals for the messages app.
+"""
+from django.conf import settings
+from django.db.models.signals import post_delete, post_migrate, post_save
+from django.dispatch import receiver
+from apps.tenants.versions import MESSAGES, bump_on_commit
+from config.partitions import install_partitioning
+from .models import Message
+
+
+@receiver(post_save, sender=Message)
+@receiver(post_delete, sender=Message)
+def message_changed(sender, instance, **kwargs):
+    """Expire conditional GETs of the tenant's messages."""
+    bump_on_commit(instance.tenant_id, MESSAGES)
+
+
+@receiver(post_migrate)
+def messages_post_migrate(sender, using, **kwargs):
+    """Partition the new messages table by month (see ``partition_messages``)."""
+    if sender.name == 'apps.messages':
+        install_partitioning(Message, 'created_at', settings.MESSAGE_PARTITIONS_AHEAD, using)
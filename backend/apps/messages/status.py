@@ -0,0 +1,45 @@
+"""
+Monotonic message status transitions.
+
+Messages move queued -> sent -> delivered -> read, with failed ranked
+between sent and delivered. Every transition is a conditional
+``UPDATE ... WHERE status_rank < new_rank`` that only touches the status
+columns and the matching timestamp, so a stale or out-of-order event is
+a single no-op statement.
+"""
+from django.db.models import F
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .models import Message
+
+TIMESTAMP_FIELDS = {
+    'sent': 'sent_at',
+    'delivered': 'delivered_at',
+    'read': 'read_at',
+}
+
+
+def transition_fields(status, at=None, description=None):
+    """Return the ``update()`` kwargs for moving a message to ``status``."""
+    if status not in Message.STATUS_RANKS:
+        raise ValueError(f"Unknown message status: {status}")
+    at = at or timezone.now()
+    fields = {'status': status, 'status_rank': Message.STATUS_RANKS[status]}
+    timestamp_field = TIMESTAMP_FIELDS.get(status)
+    if timestamp_field:
+        fields[timestamp_field] = Coalesce(F(timestamp_field), at)
+    if status == 'read':
+        # A read receipt implies delivery even if that event was lost
+        fields['delivered_at'] = Coalesce(F('delivered_at'), at)
+    if description is not None:
+        fields['status_description'] = description[:200]
+    return fields
+
+
+def advance_status(message_id, status, at=None, description=None, **extra_fields):
+    """Move a message forward to ``status``; returns False for stale events."""
+    fields = transition_fields(status, at=at, description=description)
+    fields.update(extra_fields)
+    return Message.objects.filter(
+        pk=message_id, status_rank__lt=fields['status_rank']
+    ).update(**fields) > 0
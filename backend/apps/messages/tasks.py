@@ -0,0 +1,43 @@
+"""
+Celery tasks for the messages app.
+"""
+import logging
+from celery import shared_task
+from django.conf import settings
+from apps.tenants.models import TenantSettings
+from config.partitions import ensure_partitions, retire_partitions
+from .archive import archive_tenant_messages
+from .models import Message
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def maintain_message_partitions():
+    """Create upcoming message partitions and archive the expired ones."""
+    table = Message._meta.db_table
+    created = ensure_partitions(table, settings.MESSAGE_PARTITIONS_AHEAD)
+    stats = retire_partitions(table, settings.MESSAGE_RETENTION_MONTHS)
+    logger.info(f"Message partitions: {created} created, {stats}")
+    return {'status': 'success', 'created': created, **stats}
+
+
+@shared_task
+def archive_old_messages():
+    """Move old messages to cold storage for tenants that enabled it."""
+    totals = {'tenants': 0, 'files': 0, 'archived': 0, 'deleted': 0}
+    tenants = TenantSettings.objects.filter(message_archive_days__gt=0).values_list(
+        'tenant_id', 'message_archive_days'
+    )
+    for tenant_id, days in tenants:
+        try:
+            stats = archive_tenant_messages(tenant_id, days)
+        except Exception as e:
+            # Unpurged archives are finished by the next run
+            logger.error(f"Error archiving messages of tenant {tenant_id}: {e}")
+            continue
+        totals['tenants'] += 1
+        for key, value in stats.items():
+            totals[key] += value
+    logger.info(f"Message archive: {totals}")
+    return {'status': 'success', **totals}
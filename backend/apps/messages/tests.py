@@ -0,0 +1,378 @@
+"""
+Unit tests for the messages app.
+"""
+import uuid
+from datetime import timedelta
+from unittest.mock import patch
+from django.conf import settings
+from django.db import connection, models
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from apps.campaigns.models import Campaign
+from apps.contacts.models import Contact
+from apps.messages.archive import _write_file, archive_tenant_messages, iter_archived_messages
+from apps.messages.models import Message, MessageArchive
+from apps.messages.reconciler import StatusReconciler
+from apps.messages.status import advance_status
+from config.partitions import (
+    _partitions, add_months, install_partitioning, is_partitioned, month_start, partition_name,
+    partition_table
+)
+
+
+class StatusReconcilerTests(TestCase):
+    """Tests for coalesced delivery/read status updates."""
+    
+    def setUp(self):
+        patcher = patch('apps.messages.reconciler.id_map.resolve_many', return_value={})
+        self.resolve_many = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.campaign = Campaign.objects.create(
+            tenant_id='00000000-0000-0000-0000-000000000001',
+            name='Test Campaign',
+            message_template='Test',
+            created_by='00000000-0000-0000-0000-000000000002'
+        )
+        self.message = Message.objects.create(
+            tenant_id=self.campaign.tenant_id,
+            campaign_id=self.campaign.id,
+            direction='outbound',
+            phone_from='self',
+            phone_to='+1234567890',
+            green_api_message_id='BAE5F4886F6F2D05',
+            status='sent'
+        )
+    
+    def test_events_are_coalesced_to_highest_status(self):
+        """Test that delivered then read collapses into one read update."""
+        reconciler = StatusReconciler(flush_seconds=60)
+        reconciler.add('BAE5F4886F6F2D05', 'delivered')
+        reconciler.add('BAE5F4886F6F2D05', 'read')
+        
+        self.assertEqual(reconciler.pending, 1)
+        self.assertEqual(reconciler.flush(), 1)
+        
+        self.message.refresh_from_db()
+        self.campaign.refresh_from_db()
+        self.assertEqual(self.message.status, 'read')
+        self.assertIsNotNone(self.message.delivered_at)
+        self.assertIsNotNone(self.message.read_at)
+        self.assertEqual(self.campaign.delivered_count, 1)
+        self.assertEqual(self.campaign.read_count, 1)
+    
+    def test_stale_status_is_ignored(self):
+        """Test that a late delivered event does not overwrite read."""
+        Message.objects.filter(id=self.message.id).update(
+            status='read', status_rank=Message.STATUS_RANKS['read'],
+            read_at=timezone.now() - timedelta(minutes=1)
+        )
+        reconciler = StatusReconciler()
+        reconciler.add('BAE5F4886F6F2D05', 'delivered')
+        
+        self.assertEqual(reconciler.flush(), 0)
+        self.message.refresh_from_db()
+        self.assertEqual(self.message.status, 'read')
+    
+    def test_read_raises_contact_engagement(self):
+        """Test that a read event adds to the reader's engagement once."""
+        contact = Contact.objects.create(tenant_id=self.campaign.tenant_id, phone_number='+1234567890')
+        Message.objects.filter(id=self.message.id).update(contact_id=contact.id)
+        reconciler = StatusReconciler(flush_seconds=60)
+        reconciler.add('BAE5F4886F6F2D05', 'read')
+        reconciler.flush()
+        reconciler.add('BAE5F4886F6F2D05', 'read')
+        reconciler.flush()
+        
+        contact.refresh_from_db()
+        self.assertAlmostEqual(contact.engagement_score, 2.0, places=2)
+    
+    def test_failed_flush_keeps_events(self):
+        """Test that events survive a flush that fails and are applied by the next one."""
+        from django.db import OperationalError
+        reconciler = StatusReconciler(flush_seconds=60)
+        reconciler.add('BAE5F4886F6F2D05', 'read')
+        
+        with patch.object(StatusReconciler, '_apply_postgresql', side_effect=OperationalError('gone')), \
+                patch.object(StatusReconciler, '_apply_portable', side_effect=OperationalError('gone')):
+            with self.assertRaises(OperationalError):
+                reconciler.flush()
+        reconciler.add('BAE5F4886F6F2D05', 'delivered')
+        
+        self.assertEqual(reconciler.pending, 1)
+        self.assertEqual(reconciler.flush(), 1)
+        self.message.refresh_from_db()
+        self.assertEqual(self.message.status, 'read')
+    
+    def test_unsupported_status_is_rejected(self):
+        """Test that only delivered/read are reconciled."""
+        with self.assertRaises(ValueError):
+            StatusReconciler().add('BAE5F4886F6F2D05', 'failed')
+    
+    def test_id_map_hit_updates_by_primary_key(self):
+        """Test that IDs known to the Redis map are resolved to primary keys."""
+        self.resolve_many.return_value = {
+            'BAE5F4886F6F2D05': (str(self.message.id), str(self.campaign.id))
+        }
+        reconciler = StatusReconciler()
+        reconciler.add('BAE5F4886F6F2D05', 'delivered')
+        
+        self.assertEqual(reconciler._resolve(reconciler._pending), {
+            'id': {str(self.message.id): reconciler._pending['BAE5F4886F6F2D05']},
+            'green_api_message_id': {},
+        })
+        self.assertEqual(reconciler.flush(), 1)
+        self.message.refresh_from_db()
+        self.assertEqual(self.message.status, 'delivered')
+
+
+class MessageStatusTransitionTests(TestCase):
+    """Tests for monotonic message status transitions."""
+    
+    def setUp(self):
+        self.message = Message.objects.create(
+            tenant_id='00000000-0000-0000-0000-000000000001',
+            direction='outbound',
+            phone_from='self',
+            phone_to='+1234567890'
+        )
+    
+    def test_save_keeps_rank_in_sync(self):
+        """Test that saving a message stores the rank of its status."""
+        self.assertEqual(self.message.status_rank, Message.STATUS_RANKS['queued'])
+    
+    def test_status_moves_forward(self):
+        """Test the queued -> sent -> delivered -> read progression."""
+        for status in ('sent', 'delivered', 'read'):
+            self.assertTrue(advance_status(self.message.id, status))
+        
+        self.message.refresh_from_db()
+        self.assertEqual(self.message.status, 'read')
+        self.assertIsNotNone(self.message.sent_at)
+        self.assertIsNotNone(self.message.delivered_at)
+        self.assertIsNotNone(self.message.read_at)
+    
+    def test_out_of_order_event_is_a_no_op(self):
+        """Test that a late delivered event does not overwrite read."""
+        advance_status(self.message.id, 'read')
+        
+        self.assertFalse(advance_status(self.message.id, 'delivered'))
+        self.message.refresh_from_db()
+        self.assertEqual(self.message.status, 'read')
+    
+    def test_failed_does_not_override_delivery(self):
+        """Test that a late failure does not regress a delivered message."""
+        advance_status(self.message.id, 'delivered')
+        
+        self.assertFalse(advance_status(self.message.id, 'failed', description='timeout'))
+        self.message.refresh_from_db()
+        self.assertEqual(self.message.status, 'delivered')
+
+
+class MessagePartitionTests(TestCase):
+    """Tests for the monthly messages partitions."""
+    
+    def setUp(self):
+        if connection.vendor != 'postgresql':
+            self.skipTest('Message partitions are PostgreSQL only')
+        self.table = Message._meta.db_table
+    
+    def test_partitions_created_ahead(self):
+        """Test that the table is partitioned with months created ahead."""
+        ahead = add_months(month_start(timezone.now()), settings.MESSAGE_PARTITIONS_AHEAD)
+        
+        partitions = [name for name, _ in _partitions(self.table, connection)]
+        
+        self.assertTrue(is_partitioned(self.table))
+        self.assertIn(partition_name(self.table, ahead), partitions)
+    
+    def test_future_message_lands_in_its_month(self):
+        """Test that a message is stored in its month's partition and found by Green API ID."""
+        created_at = add_months(month_start(timezone.now()), 1)
+        message = Message.objects.create(
+            tenant_id='00000000-0000-0000-0000-000000000001', direction='outbound',
+            phone_from='self', phone_to='+1234567890', green_api_message_id='BAE5PARTITION',
+            created_at=created_at
+        )
+        
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT tableoid::regclass::text FROM {self.table} WHERE id = %s", [message.id])
+            self.assertEqual(cursor.fetchone()[0], partition_name(self.table, created_at))
+        self.assertTrue(advance_status(message.id, 'sent'))
+        self.assertEqual(Message.objects.get(green_api_message_id='BAE5PARTITION').status, 'sent')
+
+
+class PartitionProbe(models.Model):
+    """A throwaway history table for converting a live table."""
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4)
+    tenant_id = models.UUIDField()
+    created_at = models.DateTimeField()
+    
+    class Meta:
+        app_label = 'messages'
+        db_table = 'partition_probe'
+        managed = False
+        indexes = [models.Index(fields=['tenant_id', '-created_at'], name='partition_probe_recent')]
+
+
+class LivePartitionTests(TransactionTestCase):
+    """Tests for converting a table that already has rows."""
+    
+    def setUp(self):
+        if connection.vendor != 'postgresql':
+            self.skipTest('Partitioning is PostgreSQL only')
+        with connection.schema_editor() as editor:
+            editor.create_model(PartitionProbe)
+        self.addCleanup(self.drop_tables)
+        self.now = timezone.now()
+        PartitionProbe.objects.bulk_create([
+            PartitionProbe(tenant_id=uuid.uuid4(), created_at=self.now - timedelta(days=days))
+            for days in range(3)
+        ])
+    
+    def drop_tables(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TABLE IF EXISTS partition_probe, partition_probe_legacy CASCADE')
+    
+    def indexes(self, table):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT i.relname, i.relispartition FROM pg_index x JOIN pg_class i ON i.oid = x.indexrelid "
+                "WHERE x.indrelid = %s::regclass", [table]
+            )
+            return dict(cursor.fetchall())
+    
+    def checks(self, table):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'c'", [table]
+            )
+            return [row[0] for row in cursor.fetchall()]
+    
+    def test_live_table_adopts_prebuilt_indexes(self):
+        """Test that the old rows keep the concurrently built indexes and lose the bound CHECK."""
+        self.assertTrue(partition_table(PartitionProbe, 'created_at', 1))
+        
+        self.assertTrue(is_partitioned('partition_probe'))
+        self.assertEqual(self.indexes('partition_probe_legacy'), {
+            'partition_probe_recent_attach': True, 'partition_probe_pkey_attach': True,
+        })
+        self.assertEqual(self.checks('partition_probe_legacy'), [])
+        self.assertEqual(self.checks('partition_probe'), [])
+        self.assertEqual(PartitionProbe.objects.count(), 3)
+        PartitionProbe.objects.create(tenant_id=uuid.uuid4(), created_at=add_months(self.now, 3))
+        self.assertFalse(partition_table(PartitionProbe, 'created_at', 1))
+    
+    def test_migrate_leaves_live_table_alone(self):
+        """Test that post-migrate partitioning skips a table that has rows."""
+        with self.assertLogs('config.partitions', 'WARNING'):
+            install_partitioning(PartitionProbe, 'created_at', 1)
+        
+        self.assertFalse(is_partitioned('partition_probe'))
+    
+    def test_rows_past_the_bound_are_refused(self):
+        """Test that rows beyond the legacy partition stop the conversion and leave no CHECK."""
+        PartitionProbe.objects.create(tenant_id=uuid.uuid4(), created_at=add_months(self.now, 3))
+        
+        with self.assertRaises(ValueError):
+            partition_table(PartitionProbe, 'created_at', 1)
+        
+        self.assertFalse(is_partitioned('partition_probe'))
+        self.assertEqual(self.checks('partition_probe'), [])
+
+
+class MessageArchiveTests(TestCase):
+    """Tests for moving old messages to cold storage."""
+    
+    def setUp(self):
+        import tempfile
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        overrides = override_settings(
+            MEDIA_ROOT=media_root.name, MESSAGE_ARCHIVE_FILE_ROWS=2, MESSAGE_ARCHIVE_BATCH_SIZE=1
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.tenant_id = '00000000-0000-0000-0000-0000000000a1'
+        now = timezone.now()
+        self.old = [
+            Message.objects.create(
+                tenant_id=self.tenant_id, direction='outbound', phone_from='self',
+                phone_to=f'+155500000{days}', content=f'{days} days ago',
+                created_at=now - timedelta(days=days)
+            ) for days in (100, 90, 80)
+        ]
+        self.recent = Message.objects.create(
+            tenant_id=self.tenant_id, direction='outbound', phone_from='self',
+            phone_to='+15550000001', created_at=now - timedelta(days=1)
+        )
+    
+    def test_old_messages_are_archived_and_deleted(self):
+        """Test that old messages move to manifest-indexed files."""
+        stats = archive_tenant_messages(self.tenant_id, 60)
+        
+        self.assertEqual(stats, {'files': 2, 'archived': 3, 'deleted': 3})
+        self.assertEqual(list(Message.objects.filter(tenant_id=self.tenant_id)), [self.recent])
+        archives = MessageArchive.objects.filter(tenant_id=self.tenant_id)
+        self.assertEqual([archive.row_count for archive in archives], [2, 1])
+        self.assertTrue(all(archive.purged_at for archive in archives))
+    
+    def test_unfinished_purge_is_completed(self):
+        """Test that rows of an archived but unpurged file are deleted, not archived again."""
+        cutoff = timezone.now() - timedelta(days=60)
+        _write_file(self.tenant_id, cutoff)
+        
+        stats = archive_tenant_messages(self.tenant_id, 60)
+        
+        self.assertEqual(stats, {'files': 1, 'archived': 1, 'deleted': 3})
+        self.assertEqual(sum(MessageArchive.objects.values_list('row_count', flat=True)), 3)
+    
+    def test_lazy_lookup(self):
+        """Test reading archived messages by time range and field."""
+        from django.contrib.auth import get_user_model
+        from rest_framework.test import APIClient
+        archive_tenant_messages(self.tenant_id, 60)
+        
+        rows = list(iter_archived_messages(self.tenant_id, start=timezone.now() - timedelta(days=95)))
+        self.assertEqual([row['id'] for row in rows], [str(self.old[1].id), str(self.old[2].id)])
+        with self.assertRaises(ValueError):
+            list(iter_archived_messages(self.tenant_id, content='x'))
+        
+        client = APIClient()
+        client.force_authenticate(get_user_model().objects.create_user(
+            email='archive@example.com', password='test123', tenant_id=self.tenant_id
+        ))
+        response = client.get('/api/messages/archived/', {'phone_to': self.old[0].phone_to})
+        
+        self.assertEqual(response.data['count'], 1)
+        self.assertEqual(response.data['messages'][0]['content'], '100 days ago')
+    
+    def test_archived_messages_are_paged(self):
+        """Test that the archive endpoint pages with a (created_at, id) cursor."""
+        from django.contrib.auth import get_user_model
+        from rest_framework.test import APIClient
+        # Two rows sharing a timestamp must not be skipped or repeated
+        Message.objects.create(
+            tenant_id=self.tenant_id, direction='outbound', phone_from='self',
+            phone_to='+15550000002', created_at=self.old[1].created_at
+        )
+        archive_tenant_messages(self.tenant_id, 60)
+        client = APIClient()
+        client.force_authenticate(get_user_model().objects.create_user(
+            email='archive@example.com', password='test123', tenant_id=self.tenant_id
+        ))
+        
+        seen = []
+        url = '/api/messages/archived/?limit=1'
+        while url:
+            response = client.get(url)
+            self.assertLessEqual(response.data['count'], 1)
+            seen.extend(row['id'] for row in response.data['messages'])
+            url = response.data['next']
+        
+        self.assertEqual(len(seen), 4)
+        self.assertEqual(len(set(seen)), 4)
+        self.assertEqual(seen[0], str(self.old[0].id))
+        self.assertEqual(seen[-1], str(self.old[2].id))
+        response = client.get('/api/messages/archived/', {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 400)
@@ -1,30 +1,103 @@
 """
 Views for the messages app.
 """
+import base64
+import binascii
+import json
+from itertools import islice
+from django.utils.dateparse import parse_datetime
 from rest_framework import viewsets, status
+from rest_framework.decorators import action
 from rest_framework.views import APIView
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+from apps.contacts.phones import normalize_phone, tenant_country_code
+from apps.tenants.conditional import conditional_get
+from apps.tenants.versions import MESSAGES
+from .archive import ARCHIVE_FILTERS, iter_archived_messages
 from .models import Message, ScheduledMessage
 from .serializers import MessageSerializer, ScheduledMessageSerializer
 import uuid
 
+ARCHIVE_PAGE_SIZE = 100
+
+ARCHIVE_MAX_PAGE_SIZE = 1000
+
 
 class MessageViewSet(viewsets.ModelViewSet):
     """ViewSet for message management."""
     
     serializer_class = MessageSerializer
+    results_key = 'messages'
     
     def get_queryset(self):
         return Message.objects.filter(tenant_id=self.request.user.tenant_id)
     
+    @conditional_get(MESSAGES)
     def list(self, request, *args, **kwargs):
-        queryset = self.get_queryset()
-        serializer = self.get_serializer(queryset, many=True)
+        page = self.paginate_queryset(self.get_queryset())
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+    
+    @action(detail=False, methods=['get'])
+    def archived(self, request):
+        """Look up messages moved to cold storage, oldest first."""
+        params = request.query_params
+        bounds = {}
+        for name in ('start', 'end'):
+            value = params.get(name)
+            bounds[name] = parse_datetime(value) if value else None
+            if value and (bounds[name] is None or bounds[name].tzinfo is None):
+                return Response({
+                    'success': False,
+                    'message': f'{name} must be an ISO 8601 date and time with a UTC offset.'
+                }, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = min(max(int(params.get('limit', ARCHIVE_PAGE_SIZE)), 1), ARCHIVE_MAX_PAGE_SIZE)
+        except ValueError:
+            limit = ARCHIVE_PAGE_SIZE
+        after = None
+        if params.get('cursor'):
+            after = self._decode_archive_cursor(params['cursor'])
+            if after is None:
+                return Response({
+                    'success': False,
+                    'message': 'Invalid cursor.'
+                }, status=status.HTTP_400_BAD_REQUEST)
+        
+        # Reading stops as soon as the page (plus one row) is full
+        rows = iter_archived_messages(
+            request.user.tenant_id, bounds['start'], bounds['end'], after=after,
+            **{field: params[field] for field in ARCHIVE_FILTERS if field in params}
+        )
+        messages = list(islice(rows, limit + 1))
+        next_link = None
+        if len(messages) > limit:
+            messages = messages[:limit]
+            # The cursor is the last row's (created_at, id), as KeysetPagination does
+            last = [messages[-1]['created_at'], messages[-1]['id']]
+            next_link = replace_query_param(
+                request.build_absolute_uri(), 'cursor',
+                base64.urlsafe_b64encode(json.dumps(last).encode()).decode()
+            )
         return Response({
             'success': True,
-            'messages': serializer.data,
-            'count': queryset.count()
+            'count': len(messages),
+            'messages': messages,
+            'next': next_link
         })
+    
+    @staticmethod
+    def _decode_archive_cursor(encoded):
+        """Return the ``(created_at, id)`` an archive cursor points past, or None."""
+        try:
+            created_at, message_id = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            after = (parse_datetime(created_at), uuid.UUID(message_id))
+        except (TypeError, ValueError, AttributeError, binascii.Error):
+            return None
+        if after[0] is None or after[0].tzinfo is None:
+            return None
+        return after
 
 
 class SendMessageView(APIView):
@@ -42,6 +115,13 @@ class SendMessageView(APIView):
                 'message': 'phone_number and message are required.'
             }, status=status.HTTP_400_BAD_REQUEST)
         
+        phone_number = normalize_phone(phone_number, tenant_country_code(request.user.tenant_id))
+        if phone_number is None:
+            return Response({
+                'success': False,
+                'message': 'Enter a valid phone number.'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
         # Create message record
         msg = Message.objects.create(
             tenant_id=request.user.tenant_id,
@@ -67,15 +147,12 @@ class ScheduledMessageViewSet(viewsets.ModelViewSet):
     """ViewSet for scheduled messages."""
     
     serializer_class = ScheduledMessageSerializer
+    results_key = 'scheduled_messages'
     
     def get_queryset(self):
         return ScheduledMessage.objects.filter(tenant_id=self.request.user.tenant_id)
     
     def list(self, request, *args, **kwargs):
-        queryset = self.get_queryset()
-        serializer = self.get_serializer(queryset, many=True)
-        return Response({
-            'success': True,
-            'scheduled_messages': serializer.data,
-            'count': queryset.count()
-        })
+        page = self.paginate_queryset(self.get_queryset())
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
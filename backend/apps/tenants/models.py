@@ -102,6 +102,8 @@ class TenantSettings(models.Model):
     message_footer = models.CharField(max_length=200, blank=True)
     signature = models.TextField(blank=True)
     auto_save_contacts = models.BooleanField(default=True)
+    # Messages older than this many days move to cold storage (0 keeps them)
+    message_archive_days = models.PositiveIntegerField(default=0)
     
     # Notification settings
     email_notifications = models.BooleanField(default=True)
@@ -131,6 +133,7 @@ class TenantSettings(models.Model):
             'message_footer': self.message_footer,
             'signature': self.signature,
             'auto_save_contacts': self.auto_save_contacts,
+            'message_archive_days': self.message_archive_days,
             'email_notifications': self.email_notifications,
             'browser_notifications': self.browser_notifications,
             'webhook_url': self.webhook_url,
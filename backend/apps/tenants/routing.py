@@ -0,0 +1,99 @@
+"""
+In-process routing index from Green API instance ID to tenant.
+
+Webhooks carry ``instanceData.idInstance``; resolving it is a dictionary
+lookup. Changes to ``Tenant.green_api_instance_id`` are broadcast over
+Redis pub/sub so every process applies them; a periodic full reload is
+the safety net if a broadcast is missed.
+"""
+import json
+import logging
+import threading
+import time
+import redis
+from django.conf import settings
+from config.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+_index = {}
+_loaded_at = None
+_lock = threading.Lock()
+_listener = None
+
+
+def _load():
+    """(Re)build the index from the database."""
+    global _index, _loaded_at
+    from .models import Tenant
+    rows = Tenant.objects.filter(is_active=True).exclude(
+        green_api_instance_id=''
+    ).values_list('green_api_instance_id', 'id')
+    _index = {str(instance_id): str(tenant_id) for instance_id, tenant_id in rows}
+    _loaded_at = time.monotonic()
+
+
+def _ensure_listener():
+    """Subscribe this process to routing changes (once)."""
+    global _listener
+    if _listener is not None:
+        return
+    try:
+        pubsub = get_redis().pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(**{settings.TENANT_ROUTING_CHANNEL: _on_message})
+        _listener = pubsub.run_in_thread(sleep_time=1, daemon=True)
+    except redis.exceptions.RedisError as e:
+        logger.warning(f"Tenant routing listener unavailable: {e}")
+
+
+def _on_message(message):
+    try:
+        change = json.loads(message['data'])
+    except (TypeError, ValueError):
+        invalidate()
+        return
+    apply_change(change)
+
+
+def resolve_instance(instance_id):
+    """Return the tenant ID for a Green API instance, or None."""
+    if not instance_id:
+        return None
+    if _loaded_at is None or time.monotonic() - _loaded_at > settings.TENANT_ROUTING_MAX_AGE:
+        with _lock:
+            if _loaded_at is None or time.monotonic() - _loaded_at > settings.TENANT_ROUTING_MAX_AGE:
+                _ensure_listener()
+                _load()
+    return _index.get(str(instance_id))
+
+
+def apply_change(change):
+    """Apply a routing change: ``{'tenant_id', 'old', 'new', 'active'}``."""
+    with _lock:
+        old = change.get('old')
+        if old and _index.get(old) == change.get('tenant_id'):
+            _index.pop(old, None)
+        new = change.get('new')
+        if new and change.get('active'):
+            _index[new] = change.get('tenant_id')
+
+
+def invalidate():
+    """Force a full reload on the next lookup."""
+    global _loaded_at
+    _loaded_at = None
+
+
+def publish_change(tenant_id, old_instance_id, new_instance_id, is_active):
+    """Broadcast a routing change to every process (and apply it locally)."""
+    change = {
+        'tenant_id': str(tenant_id),
+        'old': old_instance_id or None,
+        'new': new_instance_id or None,
+        'active': is_active,
+    }
+    apply_change(change)
+    try:
+        get_redis().publish(settings.TENANT_ROUTING_CHANNEL, json.dumps(change))
+    except redis.exceptions.RedisError as e:
+        logger.warning(f"Could not publish tenant routing change: {e}")
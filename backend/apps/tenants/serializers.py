@@ -1,6 +1,7 @@
 """
 Serializers for the tenants app.
 """
+from django.conf import settings
 from rest_framework import serializers
 from .models import Tenant, TenantSettings, TenantUsage
 
@@ -59,10 +60,18 @@ class TenantSettingsSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'timezone', 'language', 'date_format', 'time_format',
             'default_country_code', 'message_footer', 'signature',
-            'auto_save_contacts', 'email_notifications', 'browser_notifications',
-            'webhook_url', 'webhook_secret', 'created_at', 'updated_at'
+            'auto_save_contacts', 'message_archive_days', 'email_notifications',
+            'browser_notifications', 'webhook_url', 'webhook_secret', 'created_at', 'updated_at'
         ]
         read_only_fields = ['id', 'created_at', 'updated_at']
+    
+    def validate_message_archive_days(self, value):
+        """Keep recent messages, which still receive status updates, in the database."""
+        if 0 < value < settings.MESSAGE_ARCHIVE_MIN_DAYS:
+            raise serializers.ValidationError(
+                f'Messages can be archived after {settings.MESSAGE_ARCHIVE_MIN_DAYS} days at the earliest.'
+            )
+        return value
 
 
 class TenantUsageSerializer(serializers.ModelSerializer):
@@ -1,10 +1,12 @@
 """
 Signals for the tenants app.
 """
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_save, post_init, post_delete
 from django.dispatch import receiver
 from django.contrib.auth import get_user_model
 from .models import Tenant, TenantSettings, TenantUsage
+from . import routing
 import logging
 
 logger = logging.getLogger(__name__)
@@ -28,3 +30,26 @@ def tenant_post_save(sender, instance, created, **kwargs):
                 'period_end': (timezone.now().replace(day=1) + timedelta(days=32)).replace(day=1)
             }
         )
+
+
+@receiver(post_init, sender=Tenant)
+def tenant_post_init(sender, instance, **kwargs):
+    """Remember the routing fields so changes can be detected on save."""
+    instance._routing_snapshot = (instance.green_api_instance_id, instance.is_active)
+
+
+@receiver(post_save, sender=Tenant)
+def tenant_routing_post_save(sender, instance, created, **kwargs):
+    """Broadcast Green API instance routing changes once they are committed."""
+    old_instance_id, old_active = getattr(instance, '_routing_snapshot', ('', False))
+    if created or (old_instance_id, old_active) != (instance.green_api_instance_id, instance.is_active):
+        change = (instance.id, old_instance_id, instance.green_api_instance_id, instance.is_active)
+        transaction.on_commit(lambda: routing.publish_change(*change))
+    instance._routing_snapshot = (instance.green_api_instance_id, instance.is_active)
+
+
+@receiver(post_delete, sender=Tenant)
+def tenant_routing_post_delete(sender, instance, **kwargs):
+    """Drop a deleted tenant from the routing index once the delete commits."""
+    change = (instance.id, instance.green_api_instance_id, None, False)
+    transaction.on_commit(lambda: routing.publish_change(*change))
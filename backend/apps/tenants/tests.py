@@ -0,0 +1,67 @@
+"""
+Unit tests for the tenants app.
+"""
+from unittest.mock import patch
+from django.test import TestCase
+from apps.tenants import routing
+from apps.tenants.models import Tenant
+from apps.tenants.signals import tenant_routing_post_delete
+
+
+class TenantRoutingTests(TestCase):
+    """Tests for the Green API instance -> tenant routing index."""
+    
+    def setUp(self):
+        patcher = patch.object(routing, '_index', {})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        routing._index['1101000001'] = 'tenant-a'
+    
+    @patch('apps.tenants.routing._load')
+    def test_resolve_is_a_dictionary_lookup(self, mock_load):
+        """Test that a loaded index resolves without touching the DB."""
+        with patch.object(routing, '_loaded_at', float('inf')):
+            self.assertEqual(routing.resolve_instance(1101000001), 'tenant-a')
+            self.assertIsNone(routing.resolve_instance('9999'))
+        mock_load.assert_not_called()
+    
+    def test_apply_change_moves_instance(self):
+        """Test that a changed instance ID is re-pointed."""
+        routing.apply_change({
+            'tenant_id': 'tenant-a', 'old': '1101000001', 'new': '1101000002', 'active': True
+        })
+        
+        self.assertNotIn('1101000001', routing._index)
+        self.assertEqual(routing._index['1101000002'], 'tenant-a')
+    
+    def test_apply_change_removes_inactive_tenant(self):
+        """Test that deactivated tenants are dropped from the index."""
+        routing.apply_change({
+            'tenant_id': 'tenant-a', 'old': '1101000001', 'new': '1101000001', 'active': False
+        })
+        
+        self.assertNotIn('1101000001', routing._index)
+    
+    def test_apply_change_ignores_other_tenants(self):
+        """Test that a stale change cannot remove another tenant's route."""
+        routing.apply_change({
+            'tenant_id': 'tenant-b', 'old': '1101000001', 'new': None, 'active': False
+        })
+        
+        self.assertEqual(routing._index['1101000001'], 'tenant-a')
+    
+    @patch('apps.tenants.routing.publish_change')
+    def test_changes_are_published_after_commit(self, mock_publish):
+        """Test that routing changes are only broadcast once committed."""
+        with self.captureOnCommitCallbacks(execute=True):
+            tenant = Tenant.objects.create(
+                name='Acme', slug='acme', green_api_instance_id='1101000001'
+            )
+            mock_publish.assert_not_called()
+        mock_publish.assert_called_once_with(tenant.id, '1101000001', '1101000001', True)
+        
+        mock_publish.reset_mock()
+        with self.captureOnCommitCallbacks(execute=True):
+            tenant_routing_post_delete(Tenant, tenant)
+            mock_publish.assert_not_called()
+        mock_publish.assert_called_once_with(tenant.id, '1101000001', None, False)
@@ -0,0 +1,91 @@
+"""
+Tenant-scoped version counters.
+
+A counter is bumped whenever a tenant's data of a given resource type
+changes; caches compare the version they were built from against the
+current one to decide whether they are still valid. The time of the last
+bump is kept next to each counter for ``Last-Modified`` headers.
+"""
+import logging
+import time
+import redis
+from django.db import transaction
+from config.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'tenant_version:'
+
+TIME_KEY_PREFIX = 'tenant_version_at:'
+
+# Resources bumped on every write, for conditional GETs (apps.tenants.conditional)
+CAMPAIGNS = 'campaigns'
+CHATS = 'chats'
+MESSAGES = 'messages'
+
+
+def _key(tenant_id, resource):
+    return f"{KEY_PREFIX}{resource}:{tenant_id}"
+
+
+def _time_key(tenant_id, resource):
+    return f"{TIME_KEY_PREFIX}{resource}:{tenant_id}"
+
+
+def get_version(tenant_id, resource):
+    """Return the current version (0 if never bumped, None if Redis is down)."""
+    try:
+        value = get_redis().get(_key(tenant_id, resource))
+    except redis.exceptions.RedisError as e:
+        logger.warning(f"Version counter unavailable for {resource}: {e}")
+        return None
+    return int(value) if value is not None else 0
+
+
+def get_versions(tenant_id, resources):
+    """Return the current versions of several resources in one round trip."""
+    try:
+        values = get_redis().mget([_key(tenant_id, resource) for resource in resources])
+    except redis.exceptions.RedisError as e:
+        logger.warning(f"Version counters unavailable: {e}")
+        return None
+    return [int(value) if value is not None else 0 for value in values]
+
+
+def get_stamps(tenant_id, resources):
+    """Return ``(versions, bump times)`` for several resources in one round trip.
+
+    A resource that was never bumped has version 0 and time None. Returns
+    None if Redis is down.
+    """
+    keys = [_key(tenant_id, resource) for resource in resources]
+    keys += [_time_key(tenant_id, resource) for resource in resources]
+    try:
+        values = get_redis().mget(keys)
+    except redis.exceptions.RedisError as e:
+        logger.warning(f"Version counters unavailable: {e}")
+        return None
+    count = len(resources)
+    versions = [int(value) if value is not None else 0 for value in values[:count]]
+    times = [float(value) if value is not None else None for value in values[count:]]
+    return versions, times
+
+
+def bump_version(tenant_id, resource):
+    """Increment and return the version (None if Redis is down)."""
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        pipe.incr(_key(tenant_id, resource))
+        pipe.set(_time_key(tenant_id, resource), f'{time.time():.6f}')
+        return pipe.execute()[0]
+    except redis.exceptions.RedisError as e:
+        logger.warning(f"Could not bump {resource} version: {e}")
+        return None
+
+
+def bump_on_commit(tenant_id, *resources):
+    """Bump versions once the surrounding transaction commits."""
+    def bump():
+        for resource in resources:
+            bump_version(tenant_id, resource)
+    transaction.on_commit(bump)
@@ -0,0 +1,35 @@
+"""
+Indexes installed outside migrations (PostgreSQL).
+
+Outside a transaction they are built ``CONCURRENTLY`` so the table stays
+writable. A concurrent build that is interrupted leaves an INVALID index
+behind, which ``CREATE INDEX IF NOT EXISTS`` would then skip on every
+later run; ``index_is_valid`` drops such an index so it is built again.
+"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def concurrently(connection):
+    """``CONCURRENTLY`` when index DDL may run concurrently on ``connection``."""
+    return '' if connection.in_atomic_block else 'CONCURRENTLY'
+
+
+def index_is_valid(connection, name):
+    """Return True if index ``name`` exists and is usable.
+
+    An invalid index of that name is dropped, so the caller builds it again.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT x.indisvalid FROM pg_index x WHERE x.indexrelid = to_regclass(%s)", [name]
+        )
+        row = cursor.fetchone()
+        if row is None:
+            return False
+        if row[0]:
+            return True
+        logger.warning(f"Dropping invalid index {name} left by an interrupted build")
+        cursor.execute(f"DROP INDEX {concurrently(connection)} IF EXISTS {connection.ops.quote_name(name)}")
+    return False
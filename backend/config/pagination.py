@@ -0,0 +1,173 @@
+"""
+Keyset (cursor) pagination for list endpoints.
+
+Pages are read with ``WHERE (key, id) < (last key, last id) ORDER BY key
+DESC, id DESC LIMIT n`` instead of ``OFFSET``, so with a ``(tenant_id,
+key, id)`` index a deep page costs the same short index range scan as the
+first one. ``id`` breaks ties between rows sharing a key; key columns must
+be NOT NULL. Cursors are opaque tokens carrying the boundary row's key and
+id, so rows inserted while a client pages never shift or repeat results.
+
+The total is bounded: up to ``PAGINATION_EXACT_COUNT_LIMIT`` rows are
+counted exactly, beyond that PostgreSQL's planner estimate is returned
+with ``count_is_estimate`` set. ``?total=false`` skips it altogether.
+"""
+import base64
+import binascii
+import json
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import connections
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.filters import OrderingFilter
+from rest_framework.pagination import BasePagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def estimate_count(queryset):
+    """Planner row estimate for ``queryset`` (PostgreSQL), else an exact count."""
+    if connections[queryset.db].vendor != 'postgresql':
+        return queryset.count()
+    plan = json.loads(queryset.order_by().explain(format='json'))
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def _encode_value(value):
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    if isinstance(value, (str, int, float)):
+        return value
+    return str(value)
+
+
+class KeysetPagination(BasePagination):
+    """Cursor pagination on an indexed sort key plus ``id``.
+
+    The key is the view's ``?ordering=`` when it declares ``ordering_fields``,
+    else its ``ordering``, else ``ordering`` here. Results are returned under
+    the view's ``results_key``.
+    """
+
+    page_size = api_settings.PAGE_SIZE
+    max_page_size = 100
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    total_query_param = 'total'
+    ordering = '-created_at'
+    invalid_cursor_message = 'Invalid cursor.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.results_key = getattr(view, 'results_key', 'results')
+        self.page_size = self.get_page_size(request)
+        key = self.get_ordering(request, queryset, view)
+        self.descending = key.startswith('-')
+        self.key = key.lstrip('-')
+
+        self.total = None
+        if request.query_params.get(self.total_query_param, '').lower() not in ('0', 'false'):
+            self.total = self.get_total(queryset)
+
+        cursor = self.decode_cursor(request, queryset.model)
+        backwards = cursor is not None and cursor[0]
+        if cursor is not None:
+            queryset = queryset.filter(self.after_q(cursor[1], cursor[2], backwards))
+        # Walking backwards reads the rows before the cursor in reverse order
+        descending = self.descending != backwards
+        prefix = '-' if descending else ''
+        queryset = queryset.order_by(f'{prefix}{self.key}', f'{prefix}pk')
+
+        rows = list(queryset[:self.page_size + 1])
+        more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if backwards:
+            rows.reverse()
+            self.has_next, self.has_previous = True, more
+        else:
+            self.has_next, self.has_previous = more, cursor is not None
+        self.page = rows
+        return rows
+
+    def get_page_size(self, request):
+        try:
+            return _positive_int(
+                request.query_params[self.page_size_query_param],
+                strict=True, cutoff=self.max_page_size
+            )
+        except (KeyError, ValueError):
+            return self.page_size
+
+    def get_ordering(self, request, queryset, view):
+        ordering = None
+        if getattr(view, 'ordering_fields', None):
+            ordering = OrderingFilter().get_ordering(request, queryset, view)
+        ordering = ordering or getattr(view, 'ordering', None) or self.ordering
+        if isinstance(ordering, (list, tuple)):
+            # The first field is the key; id takes over as tie-breaker
+            ordering = ordering[0]
+        return ordering
+
+    def get_total(self, queryset):
+        """Return ``(count, is_estimate)``, counting at most the exact limit."""
+        limit = settings.PAGINATION_EXACT_COUNT_LIMIT
+        counted = queryset.order_by()[:limit + 1].count()
+        if counted <= limit:
+            return counted, False
+        return max(estimate_count(queryset), counted), True
+
+    def after_q(self, value, pk, backwards=False):
+        """Rows past ``(value, pk)`` in the walking direction.
+
+        The redundant ``key <= value`` keeps the condition an index range
+        instead of an OR the planner can only apply as a filter.
+        """
+        if self.descending != backwards:
+            return Q(**{f'{self.key}__lte': value}) & (
+                Q(**{f'{self.key}__lt': value}) | Q(pk__lt=pk)
+            )
+        return Q(**{f'{self.key}__gte': value}) & (
+            Q(**{f'{self.key}__gt': value}) | Q(pk__gt=pk)
+        )
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            backwards, value, pk = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            value = model._meta.get_field(self.key).to_python(value)
+            pk = model._meta.pk.to_python(pk)
+        except (TypeError, ValueError, binascii.Error, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        if value is None or pk is None:
+            raise NotFound(self.invalid_cursor_message)
+        return bool(backwards), value, pk
+
+    def encode_cursor(self, row, backwards):
+        data = [int(backwards), _encode_value(getattr(row, self.key)), _encode_value(row.pk)]
+        encoded = base64.urlsafe_b64encode(json.dumps(data).encode()).decode()
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], backwards=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.request.build_absolute_uri(), self.cursor_query_param)
+        return self.encode_cursor(self.page[0], backwards=True)
+
+    def get_paginated_response(self, data):
+        payload = {'success': True, self.results_key: data}
+        if self.total is not None:
+            payload['count'], payload['count_is_estimate'] = self.total
+        payload['next'] = self.get_next_link()
+        payload['previous'] = self.get_previous_link()
+        return Response(payload)
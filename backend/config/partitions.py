@@ -0,0 +1,389 @@
+"""
+Monthly range partitioning for append-only history tables (PostgreSQL).
+
+A table is converted in place: it is renamed to ``<table>_legacy`` and
+attached to a new parent ``PARTITION BY RANGE (<column>)`` as the
+partition holding every row before a bound, so no rows are copied. The
+parent gets the model's ``Meta.indexes`` (built on every partition), a
+primary key extended with the partition column and the old table's
+foreign keys. Monthly partitions ``<table>_pYYYYMM`` are created ahead of
+time; a DEFAULT partition catches anything outside them. Indexes of the
+old table that the model no longer declares are dropped once it is
+attached.
+
+``install_partitioning`` (run after ``migrate``) only converts a table
+that is still empty. A table with rows is converted by
+``partition_table``, called from a maintenance command, which holds the
+exclusive lock for the swap alone: first, with the table in use, a
+``CHECK (<column> < bound) NOT VALID`` is added and validated and the
+parent's indexes and key are built ``CONCURRENTLY`` on the table; the
+swap then attaches it, adopting those indexes, and the CHECK lets the
+``ATTACH`` skip its validation scan. The bound is the start of the month
+after next, which leaves a month for the index builds.
+
+``retire_partitions`` detaches every partition whose range ends before
+the retention cutoff, streams it to ``<PARTITION_ARCHIVE_PREFIX>/<table>/
+<partition>.ndjson.gz`` in the default storage and drops it. Expiring a
+month is a catalog change instead of a DELETE followed by VACUUM.
+
+Other databases keep plain tables; every function here is a no-op there.
+"""
+import gzip
+import logging
+import re
+import tempfile
+from datetime import timezone as dt_timezone
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import DatabaseError, connections, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from config.indexes import index_is_valid
+
+logger = logging.getLogger(__name__)
+
+LEGACY_SUFFIX = '_legacy'
+
+DEFAULT_SUFFIX = '_default'
+
+ARCHIVE_FETCH_SIZE = 5000
+
+# Detaching needs a short exclusive lock on the parent; give up rather
+# than queue every reader and writer behind a long-running query
+DETACH_LOCK_TIMEOUT = '5s'
+
+# The same for swapping a live table for its partitioned parent
+CONVERT_LOCK_TIMEOUT = '5s'
+
+# Suffix of the indexes built on a live table ahead of its conversion
+PREBUILT_SUFFIX = '_attach'
+
+_UPPER_BOUND_RE = re.compile(r"TO \('([^']+)'\)")
+
+
+def month_start(value):
+    """Return the first instant of ``value``'s month (UTC)."""
+    value = timezone.localtime(value, dt_timezone.utc)
+    return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return month.replace(year=index // 12, month=index % 12 + 1)
+
+
+def partition_name(table, month):
+    return f'{table}_p{month:%Y%m}'
+
+
+def is_partitioned(table, using='default'):
+    with connections[using].cursor() as cursor:
+        cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", [table])
+        row = cursor.fetchone()
+    return bool(row) and row[0] == 'p'
+
+
+def _bound_constraint(table, bound):
+    return f'{table[:40]}_before_{bound:%Y%m}'
+
+
+def _prebuilt_name(name):
+    return f'{name[:56]}{PREBUILT_SUFFIX}'
+
+
+def _prepare(model, column, connection, bound):
+    """Make a live table attachable below ``bound`` without a scan or index build.
+
+    Runs outside a transaction so the table stays writable throughout;
+    returns the name of the index prebuilt for the parent's primary key.
+    """
+    table = model._meta.db_table
+    qn = connection.ops.quote_name
+    constraint = _bound_constraint(table, bound)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT conname, convalidated FROM pg_constraint "
+            "WHERE conrelid = %s::regclass AND contype = 'c' AND conname LIKE %s",
+            [table, f'{table[:40]}_before_%']
+        )
+        checks = dict(cursor.fetchall())
+        for name in checks:
+            if name != constraint:
+                # Left by an interrupted run with another bound
+                cursor.execute(f"ALTER TABLE {qn(table)} DROP CONSTRAINT {qn(name)}")
+        if constraint not in checks:
+            with transaction.atomic(using=connection.alias):
+                cursor.execute(f"SET LOCAL lock_timeout = '{CONVERT_LOCK_TIMEOUT}'")
+                cursor.execute(
+                    f"ALTER TABLE {qn(table)} ADD CONSTRAINT {qn(constraint)} "
+                    f"CHECK ({qn(column)} < %s) NOT VALID", [bound]
+                )
+        if not checks.get(constraint):
+            try:
+                # Scans the table without blocking writes
+                cursor.execute(f"ALTER TABLE {qn(table)} VALIDATE CONSTRAINT {qn(constraint)}")
+            except DatabaseError:
+                cursor.execute(f"ALTER TABLE {qn(table)} DROP CONSTRAINT {qn(constraint)}")
+                raise ValueError(
+                    f"{table} has rows with {column} on or after {bound:%Y-%m-%d}, "
+                    f"which cannot go in its legacy partition"
+                )
+
+    statements = []
+    with connection.schema_editor(atomic=False, collect_sql=True) as editor:
+        for index in model._meta.indexes:
+            prebuilt = index.clone()
+            prebuilt.name = _prebuilt_name(index.name)
+            statements.append((prebuilt.name, str(prebuilt.create_sql(model, editor, concurrently=True))))
+    primary_key = _prebuilt_name(f'{table}_pkey')
+    statements.append((primary_key, (
+        f"CREATE UNIQUE INDEX CONCURRENTLY {qn(primary_key)} "
+        f"ON {qn(table)} ({qn(model._meta.pk.column)}, {qn(column)})"
+    )))
+    for name, sql in statements:
+        if not index_is_valid(connection, name):
+            logger.info(f"Building {name} on {table}")
+            with connection.cursor() as cursor:
+                cursor.execute(sql)
+    return primary_key
+
+
+def _convert(model, column, connection, bound, primary_key_index=None):
+    table = model._meta.db_table
+    legacy = f'{table}{LEGACY_SUFFIX}'
+    qn = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT i.relname FROM pg_index x JOIN pg_class i ON i.oid = x.indexrelid "
+            "WHERE x.indrelid = %s::regclass", [table]
+        )
+        indexes = [row[0] for row in cursor.fetchall() if not row[0].endswith(PREBUILT_SUFFIX)]
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = %s::regclass AND contype = 'f'", [table]
+        )
+        foreign_keys = cursor.fetchall()
+        cursor.execute(
+            "SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'p'", [table]
+        )
+        primary_key = cursor.fetchone()
+        cursor.execute(f"ALTER TABLE {qn(table)} RENAME TO {qn(legacy)}")
+        if primary_key:
+            # Replaced by the parent's key when the table is attached
+            cursor.execute(f"ALTER TABLE {qn(legacy)} DROP CONSTRAINT {qn(primary_key[0])}")
+            indexes.remove(primary_key[0])
+        if primary_key_index:
+            # The ATTACH only adopts a key index that backs a constraint
+            cursor.execute(
+                f"ALTER TABLE {qn(legacy)} ADD CONSTRAINT {qn(primary_key_index)} "
+                f"PRIMARY KEY USING INDEX {qn(primary_key_index)}"
+            )
+        # Free the index names for the parent's indexes
+        for index in indexes:
+            cursor.execute(f"ALTER INDEX {qn(index)} RENAME TO {qn(index[:56] + LEGACY_SUFFIX)}")
+        cursor.execute(
+            f"CREATE TABLE {qn(table)} (LIKE {qn(legacy)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) "
+            f"PARTITION BY RANGE ({qn(column)})"
+        )
+        # The bound CHECK only describes the legacy rows
+        cursor.execute(
+            f"ALTER TABLE {qn(table)} DROP CONSTRAINT IF EXISTS {qn(_bound_constraint(table, bound))}"
+        )
+        # Unique keys of a partitioned table must contain the partition column
+        cursor.execute(f"ALTER TABLE {qn(table)} ADD PRIMARY KEY ({qn(model._meta.pk.column)}, {qn(column)})")
+        for name, definition in foreign_keys:
+            cursor.execute(f"ALTER TABLE {qn(table)} ADD CONSTRAINT {qn(name)} {definition}")
+    with connection.schema_editor(atomic=False) as editor:
+        for index in model._meta.indexes:
+            editor.add_index(model, index)
+    with connection.cursor() as cursor:
+        # Adopts the prebuilt indexes; the bound CHECK spares the validation scan
+        cursor.execute(
+            f"ALTER TABLE {qn(table)} ATTACH PARTITION {qn(legacy)} "
+            f"FOR VALUES FROM (MINVALUE) TO (%s)", [bound]
+        )
+        # Anything not attached to a parent index is no longer declared
+        cursor.execute(
+            "SELECT con.conname, i.relname FROM pg_index x JOIN pg_class i ON i.oid = x.indexrelid "
+            "LEFT JOIN pg_constraint con ON con.conindid = x.indexrelid AND con.conrelid = x.indrelid "
+            "WHERE x.indrelid = %s::regclass AND NOT i.relispartition", [legacy]
+        )
+        for constraint, index in cursor.fetchall():
+            if constraint:
+                cursor.execute(f"ALTER TABLE {qn(legacy)} DROP CONSTRAINT {qn(constraint)}")
+            else:
+                cursor.execute(f"DROP INDEX {qn(index)}")
+        cursor.execute(
+            f"ALTER TABLE {qn(legacy)} DROP CONSTRAINT IF EXISTS {qn(_bound_constraint(table, bound))}"
+        )
+    logger.info(f"Converted {table} to monthly partitions on {column}")
+
+
+def install_partitioning(model, column, ahead, using='default'):
+    """Partition ``model``'s empty table by month of ``column`` (idempotent).
+
+    A table that already has rows is left to ``partition_table``.
+    """
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return
+    table = model._meta.db_table
+    if not is_partitioned(table, using):
+        if model._base_manager.using(using).exists():
+            logger.warning(f"{table} is not partitioned yet; run manage.py partition_{table}")
+            return
+        with transaction.atomic(using=using):
+            _convert(model, column, connection, add_months(month_start(timezone.now()), 1))
+    ensure_partitions(table, ahead, using)
+
+
+def partition_table(model, column, ahead, using='default'):
+    """Partition ``model``'s live table by month of ``column``; False if it already is.
+
+    Must run outside a transaction. If the swap fails (e.g. its lock wait
+    times out) the bound CHECK is dropped again and the call can simply
+    be repeated; the prebuilt indexes are reused.
+    """
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return False
+    table = model._meta.db_table
+    if is_partitioned(table, using):
+        ensure_partitions(table, ahead, using)
+        return False
+    bound = add_months(month_start(timezone.now()), 2)
+    primary_key_index = _prepare(model, column, connection, bound)
+    try:
+        with transaction.atomic(using=using):
+            with connection.cursor() as cursor:
+                cursor.execute(f"SET LOCAL lock_timeout = '{CONVERT_LOCK_TIMEOUT}'")
+            _convert(model, column, connection, bound, primary_key_index)
+    except DatabaseError:
+        # Left in place, the CHECK would reject new rows once its bound passes
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"ALTER TABLE {connection.ops.quote_name(table)} DROP CONSTRAINT IF EXISTS "
+                f"{connection.ops.quote_name(_bound_constraint(table, bound))}"
+            )
+        raise
+    ensure_partitions(table, ahead, using)
+    return True
+
+
+def _partitions(table, connection):
+    """Return ``[(name, upper bound or None)]`` for ``table``'s partitions."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = %s::regclass",
+            [table]
+        )
+        rows = cursor.fetchall()
+    partitions = []
+    for name, bound in rows:
+        match = _UPPER_BOUND_RE.search(bound)
+        partitions.append((name, parse_datetime(match.group(1)) if match else None))
+    return partitions
+
+
+def ensure_partitions(table, ahead, using='default'):
+    """Create the monthly partitions up to ``ahead`` months from now."""
+    connection = connections[using]
+    if connection.vendor != 'postgresql' or not is_partitioned(table, using):
+        return 0
+    qn = connection.ops.quote_name
+    uppers = [upper for _, upper in _partitions(table, connection) if upper]
+    month = max(uppers + [month_start(timezone.now())])
+    horizon = add_months(month_start(timezone.now()), ahead + 1)
+    created = 0
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {qn(table + DEFAULT_SUFFIX)} PARTITION OF {qn(table)} DEFAULT"
+        )
+        while month < horizon:
+            name = partition_name(table, month)
+            try:
+                with transaction.atomic(using=using):
+                    cursor.execute(
+                        f"CREATE TABLE {qn(name)} PARTITION OF {qn(table)} FOR VALUES FROM (%s) TO (%s)",
+                        [month, add_months(month, 1)]
+                    )
+            except DatabaseError as e:
+                # Rows for the month already landed in the default partition
+                logger.error(f"Could not create partition {name}: {e}")
+                break
+            created += 1
+            month = add_months(month, 1)
+    return created
+
+
+def archive_table(name, table, using='default'):
+    """Stream a table to ``<prefix>/<table>/<name>.ndjson.gz``; returns ``(path, rows)``."""
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    rows = 0
+    with tempfile.TemporaryFile() as tmp:
+        with gzip.GzipFile(fileobj=tmp, mode='wb') as gz, transaction.atomic(using=using):
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"DECLARE archive_rows NO SCROLL CURSOR FOR SELECT row_to_json(t)::text FROM {qn(name)} t"
+                )
+                while True:
+                    cursor.execute(f"FETCH {ARCHIVE_FETCH_SIZE} FROM archive_rows")
+                    batch = cursor.fetchall()
+                    if not batch:
+                        break
+                    gz.write(''.join(f'{row[0]}\n' for row in batch).encode())
+                    rows += len(batch)
+                cursor.execute("CLOSE archive_rows")
+        tmp.seek(0)
+        path = default_storage.save(
+            f'{settings.PARTITION_ARCHIVE_PREFIX}/{table}/{name}.ndjson.gz', File(tmp)
+        )
+    return path, rows
+
+
+def _detached(table, connection):
+    """Partitions detached by an earlier run that were never archived."""
+    pattern = f'^{re.escape(table)}_(p[0-9]{{6}}|{LEGACY_SUFFIX[1:]})$'
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT relname FROM pg_class WHERE relkind = 'r' AND NOT relispartition "
+            "AND relname ~ %s", [pattern]
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def retire_partitions(table, keep_months, using='default'):
+    """Detach, archive and drop partitions older than ``keep_months``."""
+    connection = connections[using]
+    stats = {'detached': 0, 'archived': 0, 'rows': 0}
+    if connection.vendor != 'postgresql' or not keep_months or not is_partitioned(table, using):
+        return stats
+    qn = connection.ops.quote_name
+    cutoff = add_months(month_start(timezone.now()), -keep_months)
+    for name, upper in _partitions(table, connection):
+        if upper is None or upper > cutoff:
+            continue
+        try:
+            with transaction.atomic(using=using), connection.cursor() as cursor:
+                cursor.execute(f"SET LOCAL lock_timeout = '{DETACH_LOCK_TIMEOUT}'")
+                cursor.execute(f"ALTER TABLE {qn(table)} DETACH PARTITION {qn(name)}")
+        except DatabaseError as e:
+            logger.warning(f"Could not detach {name}, retrying next run: {e}")
+            continue
+        stats['detached'] += 1
+    for name in _detached(table, connection):
+        try:
+            path, rows = archive_table(name, table, using)
+        except Exception as e:
+            # The detached table is kept and picked up by the next run
+            logger.error(f"Could not archive {name}: {e}")
+            continue
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE {qn(name)}")
+        logger.info(f"Archived {rows} rows of {name} to {path}")
+        stats['archived'] += 1
+        stats['rows'] += rows
+    return stats
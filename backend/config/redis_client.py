@@ -0,0 +1,15 @@
+"""
+Shared Redis client for Viviz Bulk Sender.
+"""
+import redis
+from django.conf import settings
+
+_client = None
+
+
+def get_redis():
+    """Return the process-wide Redis client (lazily created)."""
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(settings.REDIS_URL)
+    return _client
@@ -167,7 +167,7 @@ REST_FRAMEWORK = {
         'rest_framework.filters.SearchFilter',
         'rest_framework.filters.OrderingFilter',
     ),
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'config.pagination.KeysetPagination',
     'PAGE_SIZE': 20,
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
     'EXCEPTION_HANDLER': 'config.exceptions.custom_exception_handler',
@@ -187,6 +187,9 @@ SIMPLE_JWT = {
     'USER_ID_CLAIM': 'user_id',
 }
 
+# Redis (shared by caches, webhook stream and routing indexes)
+REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+
 # Celery settings
 CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', 'redis://localhost:6379/0')
 CELERY_RESULT_BACKEND = os.environ.get('CELERY_RESULT_BACKEND', 'django-db')
@@ -220,6 +223,82 @@ FILE_UPLOAD_MAX_MEMORY_SIZE = 52428800  # 50MB
 GREEN_API_BASE_URL = 'https://api.green-api.com'
 GREEN_API_TIMEOUT = 30
 
+# Green API webhook ingestion (Redis Stream)
+GREEN_API_WEBHOOK_TOKEN = os.environ.get('GREEN_API_WEBHOOK_TOKEN', '')
+GREEN_API_WEBHOOK_STREAM = 'green_api:webhooks'
+GREEN_API_WEBHOOK_STREAM_MAXLEN = 1000000
+GREEN_API_WEBHOOK_CONSUMER_GROUP = 'webhook-consumers'
+GREEN_API_WEBHOOK_BATCH_SIZE = 100
+GREEN_API_WEBHOOK_BLOCK_MS = 2000
+GREEN_API_WEBHOOK_CLAIM_IDLE_MS = 60000
+
+# Redelivered webhooks are dropped within this window (Redis buckets + local LRU)
+WEBHOOK_DEDUP_BUCKET_SECONDS = 60 * 60
+WEBHOOK_DEDUP_LRU_SIZE = 100000
+
+# Delivered/read status events are coalesced for this window before writing
+GREEN_API_STATUS_FLUSH_SECONDS = 1.0
+GREEN_API_STATUS_FLUSH_SIZE = 5000
+
+# Green API instance -> tenant routing index
+TENANT_ROUTING_CHANNEL = 'tenants:routing'
+TENANT_ROUTING_MAX_AGE = 300
+
+# Seconds a compiled auto-reply matcher is trusted before its version is rechecked
+AUTO_REPLY_VERSION_CHECK_SECONDS = 1
+
+# How long sent messages stay in the Redis idMessage -> message map
+MESSAGE_ID_MAP_TTL = 60 * 60 * 24 * 3
+
+# How long a process caches tenant settings such as default_country_code
+TENANT_SETTINGS_CACHE_SECONDS = 60
+
+# Write-behind contact activity logging
+CONTACT_ACTIVITY_FLUSH_SIZE = 500
+CONTACT_ACTIVITY_FLUSH_SECONDS = 2.0
+CONTACT_ACTIVITY_MAX_PENDING = 10000
+
+# contact_activities is partitioned by month: partitions are created this
+# many months ahead, and months older than the retention are archived to
+# PARTITION_ARCHIVE_PREFIX in the default storage, then dropped
+CONTACT_ACTIVITY_PARTITIONS_AHEAD = 3
+CONTACT_ACTIVITY_RETENTION_MONTHS = int(os.environ.get('CONTACT_ACTIVITY_RETENTION_MONTHS', 12))
+PARTITION_ARCHIVE_PREFIX = 'archives'
+
+# messages is partitioned by month the same way; months older than the
+# retention are archived and dropped (0 keeps every month)
+MESSAGE_PARTITIONS_AHEAD = 3
+MESSAGE_RETENTION_MONTHS = int(os.environ.get('MESSAGE_RETENTION_MONTHS', 0))
+
+# Per-tenant cold storage (TenantSettings.message_archive_days): older
+# messages are moved to NDJSON.gz files of at most MESSAGE_ARCHIVE_FILE_ROWS
+# rows under PARTITION_ARCHIVE_PREFIX, deleted MESSAGE_ARCHIVE_BATCH_SIZE
+# rows at a time. Recent messages still receive status webhooks, so
+# tenants cannot archive anything younger than MESSAGE_ARCHIVE_MIN_DAYS
+MESSAGE_ARCHIVE_FILE_ROWS = 100000
+MESSAGE_ARCHIVE_BATCH_SIZE = 5000
+MESSAGE_ARCHIVE_MIN_DAYS = 30
+
+# Rows per server-side cursor fetch and per streamed chunk of a contact export
+CONTACT_EXPORT_CHUNK_SIZE = 2000
+
+# Upper bound on how long a cached segment audience count is trusted; counts
+# are also dropped as soon as the tenant's contacts change
+SEGMENT_COUNT_CACHE_SECONDS = 300
+
+# List endpoints count matches exactly up to this many rows and report the
+# planner's estimate beyond it
+PAGINATION_EXACT_COUNT_LIMIT = 10000
+
+# Duplicate phone keys merged per transaction by the contact dedup job
+CONTACT_DEDUP_BATCH_SIZE = 500
+
+# Contact engagement: each sent, received or read message adds its weight
+# and scores halve every half-life. Changing either needs a
+# rebuild_engagement_scores run
+CONTACT_ENGAGEMENT_HALF_LIFE_DAYS = 30
+CONTACT_ENGAGEMENT_WEIGHTS = {'sent': 1.0, 'received': 3.0, 'read': 2.0}
+
 # Stripe settings
 STRIPE_PUBLIC_KEY = os.environ.get('STRIPE_PUBLIC_KEY', '')
 STRIPE_SECRET_KEY = os.environ.get('STRIPE_SECRET_KEY', '')
@@ -0,0 +1,37 @@
+"""
+Helpers for hand-written INSERT statements.
+
+Used where the ORM cannot express a statement (``ON CONFLICT DO UPDATE``
+with increments, data-modifying CTEs). Values are prepared exactly as
+``Model.save()`` would prepare them, so field defaults and ``auto_now``
+still apply.
+"""
+from django.db import connection
+
+
+def insert_columns(model):
+    """Return the concrete fields and quoted column list for ``model``."""
+    fields = list(model._meta.concrete_fields)
+    columns = ', '.join(connection.ops.quote_name(field.column) for field in fields)
+    return fields, columns
+
+
+def insert_row(model, instance, overrides=None):
+    """Return ``(placeholders, params)`` for one row of ``instance``.
+
+    Every placeholder carries an explicit cast so the row can be used in
+    ``VALUES`` lists and ``INSERT ... SELECT`` alike. ``overrides`` maps a
+    field name to a raw SQL expression used instead of a parameter.
+    """
+    overrides = overrides or {}
+    fields, _ = insert_columns(model)
+    placeholders = []
+    params = []
+    for field in fields:
+        if field.name in overrides:
+            placeholders.append(overrides[field.name])
+            continue
+        value = field.get_db_prep_save(field.pre_save(instance, True), connection)
+        placeholders.append(f"%s::{field.cast_db_type(connection)}")
+        params.append(value)
+    return ', '.join(placeholders), params
@@ -8,7 +8,10 @@ backlog = 2048
 
 # Worker processes
 workers = multiprocessing.cpu_count() * 2 + 1
-worker_class = "sync"
+# Threaded workers keep heartbeating while a request thread streams a long
+# response (contact exports), so only idle-stuck workers hit the timeout
+worker_class = "gthread"
+threads = 4
 worker_connections = 1000
 timeout = 120
 keepalive = 5